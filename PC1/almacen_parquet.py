@@ -0,0 +1,252 @@
+# almacen_parquet.py
+"""
+Almacén columnar de mediciones limpias, particionado por estación y mes:
+
+    datos/estacion=<nombre url-encoded>/mes=YYYY-MM/part-<stamp>.parquet
+
+Cada partición tiene un solo archivo con columnas tipadas (contaminantes en
+float64, `ts` como timestamp real armado de Fecha/Hora día-primero). Escribir
+en una partición la reescribe completa (existente + nuevo, dedup última gana
+sobre Estacion/Fecha/Hora) vía archivo temporal + rename, así que solo se tocan
+las particiones afectadas. Las lecturas podan carpetas por estación/mes y
+empujan el filtro de `ts` al lector Parquet.
+
+Uso:
+    python almacen_parquet.py --migrar                 # desde senamhi_detalle.csv
+    python almacen_parquet.py --migrar otro.csv ...    # desde otros CSV (crudos o limpios)
+    python almacen_parquet.py --bench                  # lectura CSV (+limpieza) vs almacén
+"""
+import argparse
+import os
+import shutil
+import time
+from pathlib import Path
+from urllib.parse import quote, unquote
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+BASE = Path(__file__).resolve().parent
+STORE_DIR = Path(os.getenv("SENAMHI_ALMACEN", BASE / "datos"))
+KEY = ["Estacion","Fecha","Hora"]
+POLS = ["PM 2.5","PM 10","SO2","NO2","O3","CO"]
+COLUMNS_CSV = KEY + POLS
+COLUMNS = KEY + ["ts"] + POLS
+
+ARROW_SCHEMA = pa.schema(
+    [(c, pa.string()) for c in KEY]
+    + [("ts", pa.timestamp("s"))]
+    + [(c, pa.float64()) for c in POLS]
+)
+
+
+def timestamps(df):
+    """ts de Fecha (dd/mm/YYYY) + Hora (HH:MM); NaT si no calza."""
+    return pd.to_datetime(df["Fecha"].astype(str).str.strip() + " " + df["Hora"].astype(str).str.strip(),
+                          format="%d/%m/%Y %H:%M", errors="coerce")
+
+
+def _to_timestamp(x):
+    return None if x is None else pd.Timestamp(x)
+
+
+def _partition_dir(base, estacion, mes):
+    return Path(base) / f"estacion={quote(estacion, safe='')}" / f"mes={mes}"
+
+
+def _read_partition(pdir, columns=None, filters=None):
+    # el último part-* es el vigente; uno anterior solo sobrevive un instante durante la reescritura
+    files = sorted(pdir.glob("part-*.parquet"))[-1:]
+    return [pq.read_table(f, columns=columns, filters=filters) for f in files]
+
+
+def _write_partition(pdir, df):
+    pdir.mkdir(parents=True, exist_ok=True)
+    viejos = sorted(pdir.glob("part-*.parquet"))
+    name = f"part-{time.time_ns():020d}.parquet"
+    tmp = pdir / f".{name}.tmp"
+    pq.write_table(pa.Table.from_pandas(df[COLUMNS], schema=ARROW_SCHEMA, preserve_index=False), tmp)
+    os.replace(tmp, pdir / name)
+    for f in viejos:
+        f.unlink()
+
+
+def _por_particion(df):
+    return df.groupby([df["Estacion"], df["ts"].dt.strftime("%Y-%m")], sort=False)
+
+
+def escribir(df, base=STORE_DIR, borrar=None):
+    """
+    Agrega filas limpias (columnas de senamhi_detalle_limpio.csv) al almacén.
+    `borrar` (opcional): llaves Estacion/Fecha/Hora que deben desaparecer del
+    almacén; se quitan de lo existente antes de agregar `df`.
+    Devuelve las particiones (estacion, mes) reescritas.
+    """
+    df = df.copy()
+    df["ts"] = timestamps(df)
+    sin_ts = df["ts"].isna()
+    if sin_ts.any():
+        print(f"[almacen] {int(sin_ts.sum())} filas sin Fecha/Hora válida, se omiten")
+        df = df[~sin_ts]
+    for c in POLS:
+        df[c] = pd.to_numeric(df[c], errors="coerce").astype("float64")
+
+    nuevos = dict(iter(_por_particion(df)))
+    quitar = {}
+    if borrar is not None and len(borrar):
+        b = borrar[KEY].copy()
+        b["ts"] = timestamps(b)
+        quitar = {k: g[KEY] for k, g in _por_particion(b[b["ts"].notna()])}
+
+    tocadas = []
+    for estacion, mes in list(nuevos) + [k for k in quitar if k not in nuevos]:
+        pdir = _partition_dir(base, estacion, mes)
+        partes = [t.to_pandas() for t in _read_partition(pdir)]
+        if (estacion, mes) in quitar and partes:
+            fuera = pd.MultiIndex.from_frame(quitar[(estacion, mes)])
+            partes = [p[~p.set_index(KEY).index.isin(fuera)] for p in partes]
+        if (estacion, mes) in nuevos:
+            partes.append(nuevos[(estacion, mes)][COLUMNS])
+        if not partes:
+            continue
+        merged = (pd.concat(partes, ignore_index=True)
+                  .drop_duplicates(subset=KEY, keep="last")
+                  .sort_values("ts"))
+        if merged.empty:
+            _drop_partition(pdir)
+        else:
+            _write_partition(pdir, merged)
+        tocadas.append((estacion, mes))
+    return tocadas
+
+
+def _drop_partition(pdir):
+    for f in pdir.glob("part-*.parquet"):
+        f.unlink()
+    try:
+        pdir.rmdir()
+        pdir.parent.rmdir()
+    except OSError:
+        pass
+
+
+def vaciar(base=STORE_DIR):
+    """Borra todas las particiones del almacén (para reconstruirlo)."""
+    for est_dir in Path(base).glob("estacion=*"):
+        shutil.rmtree(est_dir)
+
+
+def particiones(base=STORE_DIR, estaciones=None, desde=None, hasta=None):
+    """Carpetas de partición que pueden tener filas para el filtro dado."""
+    desde, hasta = _to_timestamp(desde), _to_timestamp(hasta)
+    m_desde = desde.strftime("%Y-%m") if desde is not None else None
+    m_hasta = hasta.strftime("%Y-%m") if hasta is not None else None
+    out = []
+    for est_dir in sorted(Path(base).glob("estacion=*")):
+        estacion = unquote(est_dir.name.split("=", 1)[1])
+        if estaciones and estacion not in estaciones:
+            continue
+        for mes_dir in sorted(est_dir.glob("mes=*")):
+            mes = mes_dir.name.split("=", 1)[1]
+            if (m_desde and mes < m_desde) or (m_hasta and mes > m_hasta):
+                continue
+            out.append(mes_dir)
+    return out
+
+
+def _filtros_ts(desde, hasta):
+    filters = []
+    if desde is not None:
+        filters.append(("ts", ">=", desde.to_pydatetime()))
+    if hasta is not None:
+        filters.append(("ts", "<=", hasta.to_pydatetime()))
+    return filters or None
+
+
+def _vacio(cols):
+    return pd.DataFrame({c: pd.Series(dtype=ARROW_SCHEMA.field(c).type.to_pandas_dtype()) for c in cols})
+
+
+def leer(estaciones=None, desde=None, hasta=None, columnas=None, base=STORE_DIR):
+    """
+    DataFrame con las filas del almacén que cumplen el filtro.
+    - estaciones: lista de nombres (poda de carpetas)
+    - desde/hasta: límites inclusivos sobre `ts` (poda por mes + filtro en el lector)
+    - columnas: subconjunto de COLUMNS a materializar
+    """
+    desde, hasta = _to_timestamp(desde), _to_timestamp(hasta)
+    cols = list(columnas or COLUMNS)
+
+    tables = []
+    for pdir in particiones(base, estaciones, desde, hasta):
+        tables += _read_partition(pdir, columns=cols, filters=_filtros_ts(desde, hasta))
+    if not tables:
+        return _vacio(cols)
+    return pa.concat_tables(tables).to_pandas()
+
+
+def leer_por_particion(estaciones=None, desde=None, hasta=None, columnas=None, base=STORE_DIR):
+    """Como leer(), pero genera un DataFrame por partición (memoria de una estación/mes)."""
+    desde, hasta = _to_timestamp(desde), _to_timestamp(hasta)
+    cols = list(columnas or COLUMNS)
+    for pdir in particiones(base, estaciones, desde, hasta):
+        for t in _read_partition(pdir, columns=cols, filters=_filtros_ts(desde, hasta)):
+            if t.num_rows:
+                yield t.to_pandas()
+
+
+def migrar(paths, base=STORE_DIR):
+    """Carga única desde CSV existentes (crudos o limpios) al almacén."""
+    import limpiar_detalle
+
+    frames = [pd.read_csv(p, dtype=str, encoding="utf-8-sig") for p in paths if Path(p).exists()]
+    if not frames:
+        print("No hay CSV para migrar.")
+        return
+    # los CSV limpios traen "PM 2.5"; se lleva todo al nombre crudo que espera limpiar()
+    frames = [f.rename(columns={"PM 2.5": "PM 2,5"}) for f in frames]
+    df = limpiar_detalle.limpiar(pd.concat(frames, ignore_index=True))
+    tocadas = escribir(df, base)
+    print(f"Migración completa: {len(df)} filas en {len(tocadas)} particiones -> {base}")
+
+
+def bench(csv_path, base=STORE_DIR, repeticiones=3):
+    import limpiar_detalle
+
+    def medir(fn):
+        mejores = []
+        for _ in range(repeticiones):
+            t0 = time.perf_counter()
+            df = fn()
+            mejores.append(time.perf_counter() - t0)
+        return min(mejores), df.memory_usage(deep=True).sum() / 1e6, len(df)
+
+    pdirs = particiones(base)
+    if not pdirs:
+        print(f"Almacén vacío en {base}; corre --migrar primero.")
+        return
+    una = unquote(pdirs[0].parent.name.split("=", 1)[1])
+    casos = {
+        "CSV (dtype=str)": lambda: pd.read_csv(csv_path, dtype=str, encoding="utf-8-sig"),
+        "CSV + limpiar()": lambda: limpiar_detalle.limpiar(pd.read_csv(csv_path, dtype=str,
+                                                                       encoding="utf-8-sig")),
+        "almacén completo": lambda: leer(base=base),
+        "almacén 1 estación": lambda: leer(estaciones=[una], base=base),
+    }
+    for nombre, fn in casos.items():
+        t, mb, n = medir(fn)
+        print(f"{nombre:20s} {t * 1000:8.1f} ms  {mb:8.2f} MB  {n} filas")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Almacén Parquet por estación/mes.")
+    ap.add_argument("--migrar", nargs="*", metavar="CSV", help="migra CSV existentes al almacén")
+    ap.add_argument("--bench", nargs="?", const=str(BASE / "senamhi_detalle.csv"), metavar="CSV",
+                    help="compara lectura del CSV vs el almacén")
+    args = ap.parse_args()
+
+    if args.migrar is not None:
+        migrar(args.migrar or [BASE / "senamhi_detalle.csv"])
+    if args.bench:
+        bench(args.bench)
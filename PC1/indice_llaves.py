@@ -0,0 +1,175 @@
+# indice_llaves.py
+"""
+Índice persistente de llaves Estacion|Fecha|Hora para el scraper horario.
+
+En vez de releer todo senamhi_detalle.csv cada hora, se guarda un SQLite al
+lado del CSV (`senamhi_detalle.csv.keys.sqlite`) con las llaves ya escritas y
+el tamaño en bytes del CSV que cubre. Al abrirlo:
+- si el CSV creció (p.ej. se cortó un run entre escribir CSV y commitear el
+  índice), se indexa solo la cola desde ese offset;
+- si el CSV es más chico o no hay índice, se reconstruye completo.
+
+Uso:
+    python indice_llaves.py --rebuild              # reconstruye desde el CSV
+    python indice_llaves.py --bench 2000000        # benchmark vs rescan del CSV
+"""
+import argparse
+import csv
+import io
+import os
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+CSV_DEFAULT = BASE_DIR / "senamhi_detalle.csv"
+SCHEMA = ["Estacion","Fecha","Hora","PM 2,5","PM 10","SO2","NO2","O3","CO"]
+CHUNK = 500
+
+
+def row_key(r):
+    return f"{r.get('Estacion','')}|{r.get('Fecha','')}|{r.get('Hora','')}"
+
+
+def iter_csv_keys(path, offset=0):
+    """Llaves del CSV a partir de un offset en bytes (0 = todo el archivo)."""
+    with open(path, "rb") as fb:
+        header = next(csv.reader([fb.readline().decode("utf-8-sig")]), [])
+        start = max(offset, fb.tell())
+        fb.seek(start)
+        for r in csv.DictReader(io.TextIOWrapper(fb, encoding="utf-8", newline=""), fieldnames=header):
+            yield row_key(r)
+
+
+class KeyIndex:
+    def __init__(self, csv_path=CSV_DEFAULT, index_path=None):
+        self.csv_path = str(csv_path)
+        self.index_path = str(index_path or f"{csv_path}.keys.sqlite")
+        self.cn = sqlite3.connect(self.index_path)
+        self.cn.execute("PRAGMA journal_mode=WAL")
+        self.cn.execute("CREATE TABLE IF NOT EXISTS keys (k TEXT PRIMARY KEY) WITHOUT ROWID")
+        self.cn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)")
+        self.cn.commit()
+        self.sync()
+
+    def close(self):
+        self.cn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- estado ---
+    def _covered_bytes(self):
+        row = self.cn.execute("SELECT value FROM meta WHERE name='csv_bytes'").fetchone()
+        return row[0] if row else None
+
+    def _set_covered_bytes(self, n):
+        self.cn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('csv_bytes', ?)", (n,))
+
+    def _csv_size(self):
+        return os.path.getsize(self.csv_path) if os.path.exists(self.csv_path) else 0
+
+    def sync(self):
+        """Deja el índice al día con el CSV (cola incremental o rebuild)."""
+        size = self._csv_size()
+        covered = self._covered_bytes()
+        if covered is None or covered > size:
+            self.rebuild()
+        elif covered < size:
+            self._index_from(covered, size)
+
+    def rebuild(self):
+        with self.cn:
+            self.cn.execute("DELETE FROM keys")
+            self._set_covered_bytes(0)
+        self._index_from(0, self._csv_size())
+
+    def _index_from(self, offset, size):
+        with self.cn:
+            if size:
+                self.cn.executemany("INSERT OR IGNORE INTO keys (k) VALUES (?)",
+                                    ((k,) for k in iter_csv_keys(self.csv_path, offset)))
+            self._set_covered_bytes(size)
+
+    # --- consultas ---
+    def __len__(self):
+        return self.cn.execute("SELECT COUNT(*) FROM keys").fetchone()[0]
+
+    def existing(self, keys):
+        """Subconjunto de `keys` que ya está en el índice (probe por lotes)."""
+        keys = list(keys)
+        found = set()
+        for i in range(0, len(keys), CHUNK):
+            part = keys[i:i + CHUNK]
+            q = "SELECT k FROM keys WHERE k IN (%s)" % ",".join("?" * len(part))
+            found.update(k for (k,) in self.cn.execute(q, part))
+        return found
+
+    # --- escritura ---
+    def append(self, rows, writer):
+        """
+        Escribe `rows` con `writer(csv_path, rows)` y registra sus llaves en la
+        misma transacción: si el writer falla no queda ninguna llave huérfana, y
+        si el proceso muere tras escribir el CSV, el próximo sync() indexa la cola.
+        """
+        if not rows:
+            return
+        with self.cn:
+            self.cn.executemany("INSERT OR IGNORE INTO keys (k) VALUES (?)",
+                                ((row_key(r),) for r in rows))
+            writer(self.csv_path, rows)
+            self._set_covered_bytes(self._csv_size())
+
+
+# ---------------- Benchmark ----------------
+def bench(n_rows, n_new=30):
+    from senamhi_por_hora import read_existing_keys, append_rows
+
+    tmp = Path(tempfile.mkdtemp())
+    path = tmp / "senamhi_detalle.csv"
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(SCHEMA)
+        for i in range(n_rows):
+            w.writerow([f"EST{i % 30}", f"{i // 720 % 28 + 1:02d}/01/{2000 + i // 20160}",
+                        f"{i // 30 % 24:02d}:00", "1.0", "2.0", "3.0", "4.0", "5.0", "6.0"])
+
+    t0 = time.perf_counter()
+    KeyIndex(path).close()
+    t_build = time.perf_counter() - t0
+
+    for h in range(3):
+        nuevos = [dict(zip(SCHEMA, [f"EST{j}", "01/01/2100", f"{h:02d}:00"] + ["1"] * 6))
+                  for j in range(n_new)]
+        t0 = time.perf_counter()
+        keys = read_existing_keys(str(path))
+        _ = [r for r in nuevos if row_key(r) not in keys]
+        t_scan = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        with KeyIndex(path) as idx:
+            ya = idx.existing(row_key(r) for r in nuevos)
+            idx.append([r for r in nuevos if row_key(r) not in ya], append_rows)
+        t_idx = time.perf_counter() - t0
+        print(f"hora {h}: rescan CSV {t_scan:.3f}s | índice {t_idx * 1000:.1f}ms")
+    print(f"{n_rows} filas; construcción inicial del índice {t_build:.2f}s ({tmp})")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Índice de llaves del scraper horario.")
+    ap.add_argument("--csv", default=str(CSV_DEFAULT))
+    ap.add_argument("--rebuild", action="store_true", help="reconstruye el índice desde el CSV")
+    ap.add_argument("--bench", type=int, metavar="N", help="benchmark con N filas sintéticas")
+    args = ap.parse_args()
+
+    if args.bench:
+        bench(args.bench)
+    else:
+        with KeyIndex(args.csv) as idx:
+            if args.rebuild:
+                idx.rebuild()
+            print(f"{len(idx)} llaves en {idx.index_path}")
@@ -1,8 +1,18 @@
 from pathlib import Path
+import argparse
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
 import pandas as pd
 import numpy as np
 import re
 
+import almacen_parquet
+import por_bloques
+
 BASE = Path(__file__).resolve().parent
 INP = BASE / "senamhi_detalle.csv"
 OUT = BASE / "senamhi_detalle_limpio.csv"
@@ -44,16 +54,73 @@ def to_float(v):
     except:
         return np.nan
 
-def main():
-    if not INP.exists():
-        print(f"No existe {INP}, nada que limpiar.")
-        return
+# ---- versiones vectorizadas (misma salida que las funciones de arriba) ----
+# misma regla que en limpiar_valor, sin lookaround (RE2/Arrow): los matches no
+# se solapan porque cada uno termina en '.' o fin de texto
+RE_MILES = r'(\d),(\d{3}(?:\.|$))'
+RE_DOS_PUNTOS = r'(?s)^(.*)\.[^.]*\.([^.]*)\Z'
+RE_NUMERO = r'^[+-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?$'
+
+def _es_texto(s):
+    return pd.api.types.infer_dtype(s, skipna=True) in ("string", "empty")
+
+def _quitar_comillas(v):
+    return v.str.strip().str.replace('"', '', regex=False).str.replace("'", "", regex=False)
+
+def normalizar_texto(s):
+    """normalize_str sobre toda una columna."""
+    if not _es_texto(s):
+        return s.map(normalize_str)
+    return _quitar_comillas(s)
+
+def limpiar_columna(s):
+    """
+    normalize_str → limpiar_valor → to_float sobre toda una columna, con
+    kernels de texto de Arrow. Columnas que no son texto (ya numéricas o
+    mezcladas) y celdas no ASCII (\\d de Python acepta dígitos unicode, RE2 no)
+    caen a las funciones por celda.
+    """
+    if pd.api.types.is_numeric_dtype(s):
+        return s.astype("float64")
+    if not _es_texto(s):
+        return s.map(normalize_str).map(limpiar_valor).map(to_float)
+
+    v = s.astype("string[pyarrow]")
+    no_ascii = (~v.str.isascii()).fillna(False).to_numpy(bool)
+    v = _quitar_comillas(v.mask(no_ascii)).str.strip()
+
+    coma = v.str.contains(",", regex=False).fillna(False)
+    if coma.any():
+        v[coma] = v[coma].str.replace(RE_MILES, r"\1\2", regex=True)
 
-    df = pd.read_csv(INP, dtype=str, encoding="utf-8-sig")
+    # 2+ puntos: lo anterior al penúltimo punto (sin puntos) + '.' + lo posterior al último
+    puntos = v.str.len() - v.str.replace(".", "", regex=False).str.len()
+    dos = (puntos >= 2).fillna(False)
+    if dos.any():
+        g = v[dos].str.extract(RE_DOS_PUNTOS)
+        v[dos] = g[0].str.replace(".", "", regex=False) + "." + g[1]
+        puntos[dos] = 1
 
-    # asegurar columnas
+    una_coma = ((v.str.count(",") == 1) & (puntos == 0)).fillna(False)
+    if una_coma.any():
+        v[una_coma] = v[una_coma].str.replace(",", ".", regex=False)
+
+    out = pd.Series(np.nan, index=s.index, dtype="float64")
+    ok = v.str.match(RE_NUMERO).fillna(False).to_numpy(bool)
+    out[ok] = v[ok].astype("float64").to_numpy()
+    # lo que no es un número simple (inf, 1_000, dígitos unicode...) lo decide float()
+    raros = ~ok & (v.str.len() > 0).fillna(False).to_numpy(bool)
+    if raros.any():
+        out[raros] = v[raros].astype(object).map(to_float).to_numpy()
+    if no_ascii.any():
+        out[no_ascii] = s[no_ascii].map(normalize_str).map(limpiar_valor).map(to_float).to_numpy()
+    return out
+
+def preparar(df):
+    """Columnas, nombres y valores limpios fila a fila (sin dedup ni orden)."""
+    # asegurar columnas (acepta también "PM 2.5", p.ej. filas que vienen del almacén)
     for c in SCHEMA:
-        if c not in df.columns:
+        if c not in df.columns and c.replace("PM 2,5", "PM 2.5") not in df.columns:
             df[c] = ""
 
     # Renombrar columna PM 2,5 → PM 2.5
@@ -62,16 +129,16 @@ def main():
 
     # trimming strings
     for c in ["Estacion","Fecha","Hora"]:
-        df[c] = df[c].map(normalize_str)
+        df[c] = normalizar_texto(df[c])
 
     # limpiar contaminantes
     for c in POLS:
         if c in df.columns:
-            df[c] = df[c].map(normalize_str).map(limpiar_valor).map(to_float)
-
-    # quitar duplicados
-    df = df.drop_duplicates(subset=["Estacion","Fecha","Hora"], keep="last")
+            df[c] = limpiar_columna(df[c])
+    return df
 
+def descartar_invalidos(df):
+    """Quita filas sin ningún dato numérico y anula negativos."""
     # eliminar filas sin datos numéricos válidos
     mask_all_nan = df[[c for c in POLS if c in df.columns]].isna().all(axis=1)
     df = df[~mask_all_nan].copy()
@@ -80,13 +147,243 @@ def main():
     for c in POLS:
         if c in df.columns:
             df.loc[df[c] < 0, c] = np.nan
+    return df
+
+def limpiar(df):
+    """Aplica todas las reglas de limpieza a un DataFrame crudo (columnas como texto)."""
+    df = preparar(df)
+
+    # quitar duplicados
+    df = df.drop_duplicates(subset=["Estacion","Fecha","Hora"], keep="last")
+
+    df = descartar_invalidos(df)
 
     # ordenar
-    df = df.sort_values(by=["Estacion","Fecha","Hora"]).reset_index(drop=True)
+    return df.sort_values(by=["Estacion","Fecha","Hora"]).reset_index(drop=True)
+
+def main(almacen=False, estaciones=None, desde=None, hasta=None):
+    """
+    almacen=True: en vez del CSV crudo lee el almacén Parquet (ya tipado), filtrando
+    por estación/fecha en la lectura, y exporta el CSV limpio de ese subconjunto.
+    """
+    if almacen:
+        df = almacen_parquet.leer(estaciones=estaciones, desde=desde, hasta=hasta,
+                                  columnas=almacen_parquet.COLUMNS_CSV)
+    elif not INP.exists():
+        print(f"No existe {INP}, nada que limpiar.")
+        return
+    else:
+        df = pd.read_csv(INP, dtype=str, encoding="utf-8-sig")
+
+    df = limpiar(df)
 
     # guardar
     df.to_csv(OUT, index=False, encoding="utf-8-sig")
     print(f"Limpieza completa: {len(df)} filas -> {OUT}")
 
+# ---------------- Modo incremental (marca de agua sobre el CSV crudo) ----------------
+KEY = ["Estacion","Fecha","Hora"]
+MARCA = "_marca_limpieza.json"
+FIRMA_BYTES = 4096
+
+def _firma(path, n):
+    """Hash de los primeros n bytes: detecta si el CSV crudo fue reemplazado."""
+    with open(path, "rb") as fb:
+        return hashlib.sha1(fb.read(n)).hexdigest()
+
+def _leer_marca(base):
+    try:
+        return json.loads((Path(base) / MARCA).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+def _guardar_marca(base, marca):
+    path = Path(base) / MARCA
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(marca, indent=1), encoding="utf-8")
+    os.replace(tmp, path)
+
+def leer_cola(path, offset):
+    """
+    Filas crudas del CSV a partir de `offset` (bytes), hasta la última línea
+    completa. Devuelve (df, offset_nuevo).
+    """
+    with open(path, "rb") as fb:
+        header = fb.readline()
+        start = max(offset, fb.tell())
+        fb.seek(start)
+        data = fb.read()
+    fin = data.rfind(b"\n") + 1
+    df = pd.read_csv(io.BytesIO(header + data[:fin]), dtype=str, encoding="utf-8-sig")
+    return df, start + fin
+
+def llaves_sin_datos(crudo, limpio):
+    """
+    Llaves cuya última fila cruda quedó sin ningún valor válido: el modo completo
+    no las emite (dedup última gana y luego se descarta la fila), así que en el
+    almacén hay que borrarlas aunque una fila anterior sí tuviera datos.
+    """
+    llaves = pd.DataFrame({c: normalizar_texto(crudo[c]) for c in KEY}).drop_duplicates()
+    ya = pd.MultiIndex.from_frame(limpio[KEY])
+    return llaves[~llaves.set_index(KEY).index.isin(ya)]
+
+def incremental(rebuild=False, base=almacen_parquet.STORE_DIR):
+    """
+    Limpia solo las filas crudas nuevas desde la marca guardada y las mezcla en
+    el almacén Parquet (dedup última gana), reescribiendo solo las particiones
+    afectadas. rebuild=True, o un CSV que se achicó/reemplazó, vacía el almacén
+    y limpia todo desde el principio.
+    """
+    if not INP.exists():
+        print(f"No existe {INP}, nada que limpiar.")
+        return
+    size = INP.stat().st_size
+    marca = _leer_marca(base)
+    valida = (marca is not None
+              and marca.get("csv") == str(INP)
+              and marca["bytes"] <= size
+              and marca["firma"] == _firma(INP, marca["firma_n"]))
+    if rebuild or not valida:
+        print("Reconstrucción completa del almacén" + ("" if rebuild else " (sin marca válida)"))
+        almacen_parquet.vaciar(base)
+        offset = 0
+    else:
+        offset = marca["bytes"]
+
+    crudo, nuevo_offset = leer_cola(INP, offset)
+    tocadas = []
+    if len(crudo):
+        limpio = limpiar(crudo.copy())
+        tocadas = almacen_parquet.escribir(limpio, base, borrar=llaves_sin_datos(crudo, limpio))
+
+    n = min(FIRMA_BYTES, nuevo_offset)
+    _guardar_marca(base, {"csv": str(INP), "bytes": nuevo_offset,
+                          "firma_n": n, "firma": _firma(INP, n)})
+    print(f"Incremental: {len(crudo)} filas crudas nuevas ({nuevo_offset - offset} bytes), "
+          f"{len(tocadas)} particiones reescritas -> {base}")
+
+# ---------------- Benchmark + paridad ----------------
+MUESTRAS = ["1,929.70", "2.723.37", "  15,32 ", "12,345", "1,234,567.8", "3.501.75", "0,5",
+            "-5", ' "3" ', "'7'", "5.", ".5", "+3", "1e5", "", "S/D", "--", "inf", "1.2,3"]
+
+def _valores_aleatorios(n, seed=0):
+    rng = np.random.default_rng(seed)
+    fijos = rng.choice(np.array(MUESTRAS, dtype=object), n)
+    nums = np.round(rng.gamma(2.0, 400.0, n), 2).astype(str)
+    comas = np.char.replace(nums, ".", ",")
+    vals = np.where(rng.random(n) < 0.5, nums, np.where(rng.random(n) < 0.5, comas, fijos))
+    vals = vals.astype(object)
+    vals[rng.random(n) < 0.05] = np.nan
+    return pd.Series(vals, dtype=object)
+
+def bench(n):
+    """Celdas/s de la versión por celda vs la vectorizada, comprobando que coinciden."""
+    import time
+
+    s = _valores_aleatorios(n)
+    t0 = time.perf_counter()
+    ref = s.map(normalize_str).map(limpiar_valor).map(to_float)
+    t_ref = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    vec = limpiar_columna(s)
+    t_vec = time.perf_counter() - t0
+
+    dif = ~((ref == vec) | (ref.isna() & vec.isna()))
+    print(f"por celda:   {t_ref:7.2f}s  {n / t_ref:>14,.0f} celdas/s")
+    print(f"vectorizado: {t_vec:7.2f}s  {n / t_vec:>14,.0f} celdas/s  (x{t_ref / t_vec:.1f})")
+    if dif.any():
+        print(f"{int(dif.sum())} diferencias, p.ej.:")
+        print(pd.DataFrame({"valor": s, "ref": ref, "vec": vec})[dif].head(10))
+        raise SystemExit(1)
+    print(f"paridad OK en {n} celdas")
+
+# ---------------- Modo por bloques (memoria acotada) ----------------
+def limpiar_por_bloques(chunksize=por_bloques.CHUNKSIZE, memoria_mb=por_bloques.MEMORIA_MB,
+                        inp=INP, out=OUT):
+    """
+    Misma salida que main() sin cargar el CSV crudo entero:
+    1) pasada de llaves: un hash uint64 por fila de Estacion/Fecha/Hora
+       normalizadas → máscara con la última aparición de cada llave;
+    2) pasada de datos: cada bloque se limpia, se filtra con la máscara y se
+       reparte en archivos temporales por estación;
+    3) cada estación se ordena por Fecha/Hora y se escribe en orden de nombre.
+    El pico de memoria es un bloque (o la estación más grande) + ~9 bytes por fila.
+    """
+    inp, out = Path(inp), Path(out)
+    if not inp.exists():
+        print(f"No existe {inp}, nada que limpiar.")
+        return
+
+    prog = por_bloques.Progreso("limpiar llaves")
+    hashes = []
+    for _, df in por_bloques.leer_por_bloques(inp, chunksize, memoria_mb, usecols=KEY):
+        llaves = pd.DataFrame({c: normalizar_texto(df[c]) for c in KEY})
+        hashes.append(por_bloques.hash_llaves(llaves, KEY))
+        prog.sumar(len(df))
+    total = prog.fin()
+    ultima = por_bloques.ultimas_ocurrencias(np.concatenate(hashes) if hashes
+                                             else np.empty(0, dtype=np.uint64))
+    del hashes
+
+    tmp = Path(tempfile.mkdtemp(prefix=".limpiar-", dir=out.parent))
+    archivos = {}  # estacion (None = sin nombre) -> csv temporal
+    columnas = None
+    filas = 0
+    try:
+        prog = por_bloques.Progreso("limpiar datos", total=total)
+        for i0, df in por_bloques.leer_por_bloques(inp, chunksize, memoria_mb,
+                                                   reservado_mb=ultima.nbytes / 1e6):
+            n = len(df)
+            df = preparar(df)
+            df = descartar_invalidos(df[ultima[i0:i0 + n]])
+            columnas = list(df.columns)
+            filas += len(df)
+            for est, g in df.groupby(df["Estacion"].fillna(""), sort=False):
+                est = est or None
+                path = archivos.setdefault(est, tmp / f"{len(archivos)}.csv")
+                g.to_csv(path, mode="a", header=not path.exists(), index=False, encoding="utf-8")
+            prog.sumar(n)
+        prog.fin()
+
+        orden = sorted(e for e in archivos if e is not None) + ([None] if None in archivos else [])
+        parcial = tmp / "salida.csv"
+        with open(parcial, "w", encoding="utf-8-sig", newline="") as f:
+            pd.DataFrame(columns=columnas or [c.replace("PM 2,5", "PM 2.5") for c in SCHEMA]).to_csv(f, index=False)
+            for est in orden:
+                # como se escribió: solo la celda vacía es NA ("NA", "null", ... quedan texto)
+                g = pd.read_csv(archivos[est], dtype=str, encoding="utf-8",
+                                keep_default_na=False, na_values=[""])
+                g.sort_values(by=["Fecha","Hora"]).to_csv(f, index=False, header=False)
+        os.replace(parcial, out)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    print(f"Limpieza por bloques completa: {filas} filas -> {out}")
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Limpieza de senamhi_detalle.csv")
+    ap.add_argument("--bench", type=int, metavar="N", help="benchmark + paridad con N celdas aleatorias")
+    ap.add_argument("--almacen", action="store_true", help="leer desde el almacén Parquet")
+    ap.add_argument("--incremental", action="store_true",
+                    help="limpia solo lo nuevo del CSV crudo y lo mezcla en el almacén")
+    ap.add_argument("--rebuild", action="store_true", help="con --incremental: rehace el almacén completo")
+    ap.add_argument("--chunksize", type=int, help="procesa el CSV crudo por bloques de hasta N filas")
+    ap.add_argument("--memoria-mb", type=float, help="techo de memoria del modo por bloques (MB)")
+    ap.add_argument("--estacion", action="append", help="filtra por estación (repetible; con --almacen)")
+    ap.add_argument("--desde", help="YYYY-MM-DD[ HH:MM] (con --almacen)")
+    ap.add_argument("--hasta", help="YYYY-MM-DD[ HH:MM] (con --almacen)")
+    return ap.parse_args()
+
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    if args.bench:
+        bench(args.bench)
+        raise SystemExit(0)
+    if args.incremental:
+        incremental(rebuild=args.rebuild)
+        raise SystemExit(0)
+    if (args.chunksize or args.memoria_mb) and not args.almacen:
+        limpiar_por_bloques(chunksize=args.chunksize or por_bloques.CHUNKSIZE,
+                            memoria_mb=args.memoria_mb or por_bloques.MEMORIA_MB)
+        raise SystemExit(0)
+    main(almacen=args.almacen, estaciones=args.estacion, desde=args.desde, hasta=args.hasta)
@@ -0,0 +1,229 @@
+# parser_popup.py
+"""
+Parser del HTML de los popups con backend intercambiable.
+
+- 'bs4': BeautifulSoup + html.parser, la referencia (mismo recorrido que
+  parse_table_by_position / parse_first_row_by_position / extract_station_name).
+- 'lxml': lxml.html + XPath, mucho más rápido; se usa por defecto si está instalado.
+
+Cada popup se parsea una sola vez: de ese árbol salen el nombre de la estación
+y las celdas de la tabla. El mapeo por posición a Fecha/Hora/contaminantes es
+común a ambos backends, así que la paridad depende solo de la extracción.
+
+Uso:
+    python parser_popup.py --paridad popups/*.html   # compara backends con la referencia
+    python parser_popup.py --bench popups/*.html     # filas parseadas por segundo
+"""
+import argparse
+import time
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+try:
+    import lxml.html as lxml_html
+except ImportError:  # lxml es opcional
+    lxml_html = None
+
+SCHEMA = ["Estacion","Fecha","Hora","PM 2,5","PM 10","SO2","NO2","O3","CO"]
+ORDER_AFTER_TIME = ["PM 2,5","PM 10","SO2","NO2","O3","CO"]
+
+
+# ---------------- Backends: html -> (estacion, [[celdas de cada tr]]) ----------------
+def _extract_bs4(popup_html):
+    soup = BeautifulSoup(popup_html, "html.parser")
+
+    estacion = ""
+    b = soup.find(["b","strong"], string=lambda s: s and "Estación" in s)
+    if b:
+        td_label = b.find_parent("td")
+        td_val = td_label.find_next_sibling("td") if td_label else None
+        if td_val:
+            estacion = td_val.get_text(strip=True)
+
+    content2 = (soup.select_one("div.content > div.content-2")
+                or soup.select_one("div.content-2")
+                or soup.select_one("div.content"))
+    table = content2.find("table") if content2 else None
+    tbody = table.find("tbody") if table else None
+    if not tbody:
+        return estacion, None
+    return estacion, [[td.get_text(" ", strip=True) for td in tr.find_all("td")]
+                      for tr in tbody.find_all("tr")]
+
+
+def _has_class(cls):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {cls} ')"
+
+
+# mismo orden de preferencia que los select_one encadenados
+XP_CONTENT2 = (
+    f"//div[{_has_class('content')}]/div[{_has_class('content-2')}]",
+    f"//div[{_has_class('content-2')}]",
+    f"//div[{_has_class('content')}]",
+)
+
+
+def _bs_string(el):
+    """Equivalente a Tag.string de BeautifulSoup (único hijo de texto, recursivo)."""
+    if len(el) == 0:
+        return el.text
+    if len(el) == 1 and el.text is None and el[0].tail is None:
+        return _bs_string(el[0])
+    return None
+
+
+def _text(el, sep):
+    return sep.join(t.strip() for t in el.itertext() if t.strip())
+
+
+def _extract_lxml(popup_html):
+    root = lxml_html.fragment_fromstring(popup_html, create_parent="div")
+
+    estacion = ""
+    for b in root.iter("b", "strong"):
+        s = _bs_string(b)
+        if s and "Estación" in s:
+            td_label = next(b.iterancestors("td"), None)
+            td_val = next(td_label.itersiblings("td"), None) if td_label is not None else None
+            if td_val is not None:
+                estacion = _text(td_val, "")
+            break
+
+    content2 = None
+    for xp in XP_CONTENT2:
+        found = root.xpath(xp)
+        if found:
+            content2 = found[0]
+            break
+    table = next(content2.iter("table"), None) if content2 is not None else None
+    tbody = next(table.iter("tbody"), None) if table is not None else None
+    if tbody is None:
+        return estacion, None
+    return estacion, [[_text(td, " ") for td in tr.iter("td")] for tr in tbody.iter("tr")]
+
+
+BACKENDS = {"bs4": _extract_bs4}
+if lxml_html is not None:
+    BACKENDS["lxml"] = _extract_lxml
+DEFAULT_BACKEND = "lxml" if lxml_html is not None else "bs4"
+
+
+# ---------------- Mapeo por posición ----------------
+def first_row(trs):
+    """Primera fila (más reciente), como parse_first_row_by_position."""
+    if not trs:
+        return None
+    tds = list(trs[0])
+    if len(tds) < 2:
+        return None
+    while len(tds) < 8:
+        tds.append("")
+
+    def norm(x):
+        if isinstance(x, str) and "," in x:
+            try:
+                float(x.replace(",", "."))
+                return x.replace(",", ".")
+            except ValueError:
+                return x
+        return x
+
+    out = {"Fecha": tds[0], "Hora": tds[1]}
+    for j, col in enumerate(ORDER_AFTER_TIME, start=2):
+        out[col] = norm(tds[j])
+    return out
+
+
+def all_rows(trs):
+    """Todas las filas no vacías, como parse_table_by_position."""
+    rows_out = []
+    for tds in trs or []:
+        if not tds or all(x == "" for x in tds):
+            continue
+        tds = tds + [""] * (2 + len(ORDER_AFTER_TIME) - len(tds))
+        fila = {"Fecha": tds[0], "Hora": tds[1]}
+        for j, col in enumerate(ORDER_AFTER_TIME, start=2):
+            val = tds[j]
+            if "," in val and val.replace(",","").replace(".","").replace("-","").isdigit():
+                val = val.replace(",", ".")
+            fila[col] = val
+        rows_out.append(fila)
+    return rows_out
+
+
+# ---------------- API ----------------
+def parse_popup(popup_html, first_only=False, backend=None):
+    """Filas en formato SCHEMA de un popup (primera fila o tabla completa)."""
+    if not popup_html:
+        return []
+    estacion, trs = BACKENDS[backend or DEFAULT_BACKEND](popup_html)
+    filas = [first_row(trs)] if first_only else all_rows(trs)
+    return [{"Estacion": estacion, **{k: f.get(k, "") for k in SCHEMA[1:]}} for f in filas if f]
+
+
+def parse_many(popups, first_only=False, backend=None):
+    """Parsea muchos popups en una llamada; devuelve todas las filas concatenadas."""
+    extract = BACKENDS[backend or DEFAULT_BACKEND]
+    pick = (lambda trs: [first_row(trs)]) if first_only else all_rows
+    out = []
+    for html in popups:
+        if not html:
+            continue
+        estacion, trs = extract(html)
+        for f in pick(trs):
+            if f:
+                out.append({"Estacion": estacion, **{k: f.get(k, "") for k in SCHEMA[1:]}})
+    return out
+
+
+# ---------------- Paridad y benchmark ----------------
+def _reference(popup_html, first_only):
+    from scraping_senamhi_calidad_aire import parse_table_by_position
+    from senamhi_por_hora import parse_first_row_by_position
+    from senamhi_http import station_name_from_html
+
+    estacion = station_name_from_html(popup_html)
+    filas = [parse_first_row_by_position(popup_html)] if first_only else parse_table_by_position(popup_html)
+    return [{"Estacion": estacion, **{k: f.get(k, "") for k in SCHEMA[1:]}} for f in filas if f]
+
+
+def paridad(popups):
+    fallas = 0
+    for i, html in enumerate(popups):
+        for first_only in (True, False):
+            ref = _reference(html, first_only)
+            for name in BACKENDS:
+                got = parse_popup(html, first_only, backend=name)
+                if got != ref:
+                    fallas += 1
+                    print(f"[{name}] popup {i} first_only={first_only}: difiere de la referencia")
+    print(f"{len(popups)} popups, backends {list(BACKENDS)}: {fallas} diferencias")
+    return fallas == 0
+
+
+def bench(popups, repeticiones=20):
+    lote = popups * repeticiones
+    for name in BACKENDS:
+        t0 = time.perf_counter()
+        n = len(parse_many(lote, backend=name))
+        dt = time.perf_counter() - t0
+        print(f"{name:5s} {n} filas en {dt:.2f}s -> {n / dt:,.0f} filas/s ({len(lote) / dt:,.0f} popups/s)")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Parser de popups con backend intercambiable.")
+    ap.add_argument("archivos", nargs="+", help="HTML de popups grabados (o páginas guardadas)")
+    ap.add_argument("--paridad", action="store_true")
+    ap.add_argument("--bench", action="store_true")
+    args = ap.parse_args()
+
+    from senamhi_http import extract_popups
+    popups = []
+    for f in args.archivos:
+        texto = Path(f).read_text(encoding="utf-8")
+        popups += extract_popups(texto) or [texto]
+    if args.paridad and not paridad(popups):
+        raise SystemExit(1)
+    if args.bench:
+        bench(popups)
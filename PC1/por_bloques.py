@@ -0,0 +1,107 @@
+# por_bloques.py
+"""
+Lectura de CSV por bloques con techo de memoria, para limpiar/subir historias
+que no caben enteras en la máquina del cron.
+
+- `leer_por_bloques`: itera DataFrames de a `chunksize` filas como máximo y
+  achica el bloque siguiente si, con lo que ocupa por fila el último bloque
+  (x un factor por los temporales de la limpieza), se pasaría de `memoria_mb`.
+- `hash_llaves` / `ultimas_ocurrencias`: dedup "última gana" entre bloques con
+  un uint64 por fila (8 bytes/fila) en vez de un set de tuplas de strings.
+- `Progreso`: filas, filas/s y RSS en stderr.
+
+Uso (desde otros módulos):
+    for i0, df in leer_por_bloques(path, chunksize=100_000, memoria_mb=256):
+        ...
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+CHUNKSIZE = 100_000
+MEMORIA_MB = 256
+FACTOR_TEMPORALES = 4  # copias intermedias al limpiar un bloque
+MIN_FILAS = 1_000
+
+
+def rss_mb():
+    """Memoria residente actual del proceso en MB (0 si no se puede leer)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * 4096 / 1e6
+    except (OSError, ValueError, IndexError):
+        try:
+            import resource
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+        except ImportError:
+            return 0.0
+
+
+class Progreso:
+    def __init__(self, etiqueta, total=None, cada=1.0):
+        self.etiqueta = etiqueta
+        self.total = total
+        self.cada = cada
+        self.filas = 0
+        self.bloques = 0
+        self.t0 = time.perf_counter()
+        self._ultimo = 0.0
+
+    def sumar(self, n, forzar=False):
+        self.filas += n
+        self.bloques += 1
+        ahora = time.perf_counter()
+        if forzar or ahora - self._ultimo >= self.cada:
+            self._ultimo = ahora
+            self._print(ahora)
+
+    def _print(self, ahora):
+        dt = max(ahora - self.t0, 1e-9)
+        total = f"/{self.total:,}" if self.total else ""
+        print(f"[{self.etiqueta}] {self.filas:,}{total} filas, {self.bloques} bloques, "
+              f"{self.filas / dt:,.0f} filas/s, RSS {rss_mb():.0f} MB",
+              file=sys.stderr, flush=True)
+
+    def fin(self):
+        self._print(time.perf_counter())
+        return self.filas
+
+
+def leer_por_bloques(path, chunksize=CHUNKSIZE, memoria_mb=MEMORIA_MB, reservado_mb=0.0, **kw):
+    """
+    Genera (fila_inicial, DataFrame) recorriendo el CSV. `reservado_mb` es lo que
+    el llamador ya tiene ocupado (p.ej. el arreglo de hashes) y se descuenta del techo.
+    """
+    kw.setdefault("dtype", str)
+    kw.setdefault("encoding", "utf-8-sig")
+    n = chunksize
+    i0 = 0
+    with pd.read_csv(path, iterator=True, **kw) as reader:
+        while True:
+            try:
+                df = reader.get_chunk(n)
+            except StopIteration:
+                return
+            if df.empty:
+                return
+            yield i0, df
+            i0 += len(df)
+            por_fila = df.memory_usage(deep=True).sum() / len(df) * FACTOR_TEMPORALES
+            libre = max(memoria_mb - reservado_mb, 1.0) * 1e6
+            n = int(min(chunksize, max(MIN_FILAS, libre // por_fila)))
+
+
+def hash_llaves(df, cols):
+    """Un uint64 por fila a partir de las columnas llave (colisiones ~n²/2^65)."""
+    return pd.util.hash_pandas_object(df[cols], index=False).to_numpy(np.uint64)
+
+
+def ultimas_ocurrencias(hashes):
+    """Máscara con True solo en la última aparición de cada hash (dedup keep='last')."""
+    n = len(hashes)
+    _, idx = np.unique(hashes[::-1], return_index=True)
+    mask = np.zeros(n, dtype=bool)
+    mask[n - 1 - idx] = True
+    return mask
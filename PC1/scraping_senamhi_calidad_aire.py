@@ -10,6 +10,11 @@ from selenium.common.exceptions import TimeoutException
 from bs4 import BeautifulSoup
 import pandas as pd
 import time
+import argparse
+
+import parser_popup
+import senamhi_http
+from senamhi_http import station_name_from_html
 
 URL = "https://www.senamhi.gob.pe/?p=calidad-del-aire"
 
@@ -68,15 +73,7 @@ def extract_station_name(d, popup_html_backup=None):
         pass
     if not popup_html_backup:
         popup_html_backup = get_popup_html(d, timeout=4)
-    if popup_html_backup:
-        soup = BeautifulSoup(popup_html_backup, "html.parser")
-        b = soup.find(["b","strong"], string=lambda s: s and "Estación" in s)
-        if b:
-            td_label = b.find_parent("td")
-            td_val = td_label.find_next_sibling("td") if td_label else None
-            if td_val:
-                return td_val.get_text(strip=True)
-    return ""
+    return station_name_from_html(popup_html_backup)
 
 def parse_table_by_position(popup_html):
     """Lee la tabla y asigna columnas por POSICIÓN (tras Fecha y Hora)."""
@@ -121,8 +118,25 @@ def parse_table_by_position(popup_html):
 
     return rows_out
 
+def to_schema_rows(estacion, filas):
+    return [{
+        "Estacion": estacion,
+        "Fecha": f.get("Fecha",""),
+        "Hora": f.get("Hora",""),
+        "PM 2,5": f.get("PM 2,5",""),
+        "PM 10": f.get("PM 10",""),
+        "SO2":    f.get("SO2",""),
+        "NO2":    f.get("NO2",""),
+        "O3":     f.get("O3",""),
+        "CO":     f.get("CO",""),
+    } for f in filas]
+
 # ---------------- Main ----------------
-def main():
+def scrape_http(fuente=None):
+    """Tabla completa de cada estación desde el payload del mapa (sin navegador)."""
+    return parser_popup.parse_many(senamhi_http.collect_popups(URL, fuente=fuente))
+
+def scrape_selenium():
     d = new_driver(headless=False)  # pon True cuando quieras correr en headless
     d.get(URL)
     wait_ready(d, 90)
@@ -130,7 +144,7 @@ def main():
     if not enter_leaflet_iframe(d):
         print("No se encontró el iframe del mapa.")
         d.quit()
-        return
+        return []
 
     markers_css = ".leaflet-marker-pane .leaflet-marker-icon"
     resultados = []
@@ -160,19 +174,7 @@ def main():
 
         estacion = extract_station_name(d, popup_html_backup=html)
         filas = parse_table_by_position(html)
-
-        for f in filas:
-            resultados.append({
-                "Estacion": estacion,
-                "Fecha": f.get("Fecha",""),
-                "Hora": f.get("Hora",""),
-                "PM 2,5": f.get("PM 2,5",""),
-                "PM 10": f.get("PM 10",""),
-                "SO2":    f.get("SO2",""),
-                "NO2":    f.get("NO2",""),
-                "O3":     f.get("O3",""),
-                "CO":     f.get("CO",""),
-            })
+        resultados += to_schema_rows(estacion, filas)
 
         # cierra popup
         d.execute_script("document.dispatchEvent(new KeyboardEvent('keydown', {'key':'Escape'}));")
@@ -180,10 +182,25 @@ def main():
 
     d.switch_to.default_content()
     d.quit()
+    return resultados
+
+def main(modo="auto", fuente=None):
+    resultados = []
+    if modo in ("auto", "http"):
+        try:
+            resultados = scrape_http(fuente=fuente)
+        except Exception as e:
+            print(f"[http] falló la ingesta sin navegador: {e.__class__.__name__}: {e}")
+    if modo == "selenium" or (modo == "auto" and not resultados):
+        resultados = scrape_selenium()
 
     df = pd.DataFrame(resultados, columns=SCHEMA)
     df.to_csv("senamhi_detalle.csv", index=False, encoding="utf-8-sig")
     print(f"Listo: {len(df)} filas guardadas en senamhi_detalle.csv")
 
 if __name__ == "__main__":
-    main()
+    ap = argparse.ArgumentParser(description="Historial completo por estación (tabla del popup).")
+    ap.add_argument("--modo", choices=["auto", "http", "selenium"], default="auto")
+    ap.add_argument("--fuente", help="HTML/JS guardado del mapa para correr sin red (modo http)")
+    args = ap.parse_args()
+    main(modo=args.modo, fuente=args.fuente)
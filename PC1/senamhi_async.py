@@ -0,0 +1,135 @@
+# senamhi_async.py
+"""
+Descarga concurrente (asyncio) de los popups por estación.
+
+- `concurrencia`: máximo de requests en vuelo a la vez.
+- `intervalo_host`: separación mínima (s) entre requests al mismo host.
+- reintentos con backoff exponencial y jitter.
+
+La descarga en sí la hace una función síncrona (`fetch(url, timeout)`, por
+defecto `senamhi_http.fetch_text`) corriendo en un pool de hilos del tamaño
+de la concurrencia, así no hace falta otra dependencia HTTP.
+
+Benchmark contra un servidor local con latencia artificial:
+    python senamhi_async.py --bench popup.html --n 40 --latencia 0.3
+"""
+import argparse
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlsplit
+
+
+class HostRateLimiter:
+    """Espaciado mínimo entre requests al mismo host."""
+
+    def __init__(self, min_interval=0.0):
+        self.min_interval = min_interval
+        self._next = {}
+        self._locks = {}
+
+    async def wait(self, host):
+        if self.min_interval <= 0:
+            return
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            now = time.monotonic()
+            t = max(self._next.get(host, now), now)
+            if t > now:
+                await asyncio.sleep(t - now)
+            self._next[host] = t + self.min_interval
+
+
+async def _fetch_one(url, fetch, pool, sem, limiter, reintentos, backoff, timeout):
+    loop = asyncio.get_running_loop()
+    host = urlsplit(url).netloc
+    for intento in range(reintentos + 1):
+        async with sem:
+            await limiter.wait(host)
+            try:
+                return await loop.run_in_executor(pool, fetch, url, timeout)
+            except Exception as e:
+                err = e
+        if intento < reintentos:
+            # backoff exponencial con jitter (0.5x - 1.5x)
+            await asyncio.sleep(backoff * (2 ** intento) * (0.5 + random.random()))
+    print(f"[async] {url} falló tras {reintentos + 1} intentos: {err.__class__.__name__}")
+    return None
+
+
+async def fetch_all_async(urls, fetch=None, concurrencia=8, intervalo_host=0.0,
+                          reintentos=3, backoff=0.5, timeout=30):
+    """Devuelve el texto de cada URL (None si falló), en el mismo orden de `urls`."""
+    if fetch is None:
+        from senamhi_http import fetch_text as fetch
+    sem = asyncio.Semaphore(concurrencia)
+    limiter = HostRateLimiter(intervalo_host)
+    with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        return await asyncio.gather(*[
+            _fetch_one(u, fetch, pool, sem, limiter, reintentos, backoff, timeout) for u in urls
+        ])
+
+
+def fetch_all(urls, **kw):
+    """Versión síncrona de `fetch_all_async` para los scripts."""
+    if not urls:
+        return []
+    return asyncio.run(fetch_all_async(urls, **kw))
+
+
+# ---------------- Benchmark ----------------
+def _serve(payload, latencia):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latencia)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
+
+
+def bench(popup_file, n, latencia, concurrencia):
+    from senamhi_http import fetch_text
+    from senamhi_por_hora import parse_first_row_by_position
+
+    srv = _serve(Path(popup_file).read_bytes(), latencia)
+    urls = [f"http://127.0.0.1:{srv.server_port}/estacion/{i}" for i in range(n)]
+    try:
+        t0 = time.perf_counter()
+        serial = [fetch_text(u) for u in urls]
+        t_serial = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        conc = fetch_all(urls, concurrencia=concurrencia)
+        t_conc = time.perf_counter() - t0
+    finally:
+        srv.shutdown()
+
+    filas = sum(1 for h in conc if h and parse_first_row_by_position(h))
+    assert serial == conc
+    print(f"{n} popups, latencia {latencia}s")
+    print(f"  serial      : {t_serial:.2f}s")
+    print(f"  concurrente : {t_conc:.2f}s (concurrencia={concurrencia}, {filas} filas) "
+          f"-> x{t_serial / t_conc:.1f}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Benchmark de descarga serial vs concurrente.")
+    ap.add_argument("--bench", required=True, help="HTML de un popup grabado")
+    ap.add_argument("--n", type=int, default=40)
+    ap.add_argument("--latencia", type=float, default=0.3)
+    ap.add_argument("--concurrencia", type=int, default=8)
+    args = ap.parse_args()
+    bench(args.bench, args.n, args.latencia, args.concurrencia)
@@ -0,0 +1,225 @@
+# senamhi_daemon.py
+"""
+Modo daemon del scraper horario: una sola sesión de Chrome que se mantiene
+caliente dentro del iframe de Leaflet entre runs.
+
+- Cada `intervalo` segundos recarga solo el iframe del mapa y recorre los
+  marcadores con `scrape_markers` (mismas esperas adaptativas y reporte).
+- La sesión se recicla (quit + driver nuevo) si no responde, si el mapa no
+  aparece tras recargar, si acumula fallas seguidas o si supera `max_edad`.
+- Un servidor de control en 127.0.0.1 expone GET /health y POST /run.
+
+Uso:
+    python senamhi_daemon.py serve [--intervalo 3600] [--puerto 8765] [--almacen]
+    python senamhi_daemon.py health
+    python senamhi_daemon.py run-now
+
+`driver_factory` se puede inyectar (p.ej. un driver falso) para probar el
+ciclo completo sin navegador.
+"""
+import argparse
+import json
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.request import Request, urlopen
+
+from selenium.webdriver.common.by import By
+
+import senamhi_por_hora as hora
+from tiempos_scraper import TimeoutsAdaptativos, ReporteTiempos
+
+PUERTO = 8765
+
+
+class ScraperDaemon:
+    def __init__(self, driver_factory=None, intervalo=3600, max_edad=6 * 3600,
+                 max_fallas=2, almacen=False):
+        self.driver_factory = driver_factory or (lambda: hora.new_driver(headless=True))
+        self.intervalo = intervalo
+        self.max_edad = max_edad
+        self.max_fallas = max_fallas
+        self.almacen = almacen
+
+        self.d = None
+        self.sesion_desde = None
+        self.sesiones = 0
+        self.fallas_seguidas = 0
+        self.ultimo_run = None
+        self.ultimo_error = None
+        self.runs = 0
+        self.timeouts = TimeoutsAdaptativos()
+
+        self._lock = threading.Lock()
+        self._despertar = threading.Event()
+        self._parar = threading.Event()
+
+    # ---------------- sesión ----------------
+    def _sesion_viva(self):
+        if self.d is None:
+            return False
+        try:
+            return bool(self.d.find_elements(By.CSS_SELECTOR, ".leaflet-container"))
+        except Exception:
+            return False
+
+    def _cerrar_sesion(self):
+        if self.d is not None:
+            try:
+                self.d.quit()
+            except Exception:
+                pass
+        self.d = None
+
+    def _nueva_sesion(self):
+        self._cerrar_sesion()
+        self.d = self.driver_factory()
+        self.sesion_desde = time.monotonic()
+        self.sesiones += 1
+        self.fallas_seguidas = 0
+        if not hora.open_map(self.d):
+            raise RuntimeError("No se encontró el iframe del mapa.")
+
+    def _sesion_vencida(self):
+        return (self.d is None
+                or time.monotonic() - self.sesion_desde > self.max_edad
+                or self.fallas_seguidas >= self.max_fallas
+                or not self._sesion_viva())
+
+    def _recargar_mapa(self):
+        """Recarga solo el documento del iframe, sin salir de él."""
+        # readyState y los marcadores del documento viejo siguen ahí justo
+        # después de reload(): se espera a que ese documento se descarte.
+        viejo = self.d.find_element(By.TAG_NAME, "html")
+        self.d.execute_script("location.reload();")
+        hora.WebDriverWait(self.d, 30).until(hora.EC.staleness_of(viejo))
+        hora.wait_ready(self.d, 90)
+        hora.WebDriverWait(self.d, 30).until(
+            lambda x: x.find_elements(By.CSS_SELECTOR, hora.MARKERS_CSS)
+        )
+
+    # ---------------- runs ----------------
+    def run_now(self):
+        """Un run completo con la sesión caliente. Devuelve un resumen (dict)."""
+        with self._lock:
+            t0 = time.perf_counter()
+            try:
+                if self._sesion_vencida():
+                    self._nueva_sesion()
+                else:
+                    try:
+                        self._recargar_mapa()
+                    except Exception:
+                        self._nueva_sesion()
+
+                reporte = ReporteTiempos()
+                filas = hora.scrape_markers(self.d, self.timeouts, reporte)
+                hora.save_timings(self.timeouts, reporte, etiqueta="daemon")
+                nuevas = hora.save_rows(filas, almacen=self.almacen)
+
+                self.fallas_seguidas = 0 if filas else self.fallas_seguidas + 1
+                self.ultimo_error = None
+                res = {"ok": True, "filas": len(filas), "nuevas": len(nuevas)}
+            except Exception as e:
+                self.fallas_seguidas += 1
+                self.ultimo_error = f"{e.__class__.__name__}: {e}"
+                print(f"[daemon] run falló: {self.ultimo_error}")
+                res = {"ok": False, "error": self.ultimo_error}
+            self.runs += 1
+            self.ultimo_run = datetime.now().isoformat(timespec="seconds")
+            res["segundos"] = round(time.perf_counter() - t0, 2)
+            return res
+
+    def health(self):
+        edad = time.monotonic() - self.sesion_desde if self.sesion_desde else None
+        return {
+            "status": "ok" if self.ultimo_error is None else "degraded",
+            "sesion_activa": self.d is not None,
+            "sesion_edad_s": round(edad, 1) if edad is not None else None,
+            "sesiones_creadas": self.sesiones,
+            "fallas_seguidas": self.fallas_seguidas,
+            "runs": self.runs,
+            "ultimo_run": self.ultimo_run,
+            "ultimo_error": self.ultimo_error,
+            "ocupado": self._lock.locked(),
+        }
+
+    def loop(self):
+        while not self._parar.is_set():
+            self.run_now()
+            self._despertar.wait(self.intervalo)
+            self._despertar.clear()
+        self._cerrar_sesion()
+
+    def stop(self):
+        self._parar.set()
+        self._despertar.set()
+
+
+# ---------------- servidor de control ----------------
+def control_server(daemon, puerto=PUERTO):
+    class Handler(BaseHTTPRequestHandler):
+        def _json(self, code, data):
+            body = json.dumps(data).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._json(200, daemon.health())
+            else:
+                self._json(404, {"error": "NotFound"})
+
+        def do_POST(self):
+            if self.path == "/run":
+                self._json(200, daemon.run_now())
+            else:
+                self._json(404, {"error": "NotFound"})
+
+        def log_message(self, *args):
+            pass
+
+    return ThreadingHTTPServer(("127.0.0.1", puerto), Handler)
+
+
+def serve(intervalo, puerto, almacen):
+    daemon = ScraperDaemon(intervalo=intervalo, almacen=almacen)
+    srv = control_server(daemon, puerto)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    print(f"[daemon] control en http://127.0.0.1:{puerto} (GET /health, POST /run)")
+    try:
+        daemon.loop()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.stop()
+        srv.shutdown()
+        daemon._cerrar_sesion()
+
+
+def cliente(comando, puerto=PUERTO):
+    url = f"http://127.0.0.1:{puerto}"
+    if comando == "health":
+        req = Request(f"{url}/health")
+    else:
+        req = Request(f"{url}/run", data=b"", method="POST")
+    with urlopen(req, timeout=600) as r:
+        print(json.dumps(json.loads(r.read()), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Scraper SENAMHI con sesión de navegador persistente.")
+    ap.add_argument("comando", choices=["serve", "health", "run-now"])
+    ap.add_argument("--intervalo", type=int, default=3600, help="segundos entre runs")
+    ap.add_argument("--puerto", type=int, default=PUERTO)
+    ap.add_argument("--almacen", action="store_true", help="agrega también al almacén Parquet")
+    args = ap.parse_args()
+
+    if args.comando == "serve":
+        serve(args.intervalo, args.puerto, args.almacen)
+    else:
+        cliente(args.comando, args.puerto)
@@ -0,0 +1,151 @@
+# senamhi_http.py
+"""
+Ingesta sin navegador para el mapa de calidad del aire de SENAMHI.
+
+En vez de abrir Chrome y hacer click en cada marcador de Leaflet, descarga la
+página del mapa (y su iframe / scripts propios) y extrae el HTML de los popups
+desde las llamadas `bindPopup(...)` / `setContent(...)` con las que Leaflet
+construye el mapa. Ese HTML es el mismo que Selenium lee de
+`.leaflet-popup-content`, así que se parsea con las funciones de siempre
+(`parse_first_row_by_position`, `parse_table_by_position`).
+
+Si los marcadores cargan el popup desde una URL por estación (AJAX), esas
+páginas se descargan en paralelo con `senamhi_async.fetch_all`.
+
+También acepta un archivo HTML/JS guardado (`fuente=`) para trabajar sin red,
+por ejemplo un `page_source` capturado con Selenium o el HTML del iframe.
+"""
+import re
+from pathlib import Path
+from urllib.parse import urljoin
+from urllib.request import Request, urlopen
+
+from bs4 import BeautifulSoup
+
+import senamhi_async
+
+URL = "https://www.senamhi.gob.pe/?p=calidad-del-aire"
+USER_AGENT = "Mozilla/5.0"
+
+IFRAME_RE = re.compile(r"<iframe[^>]+src=[\"']([^\"']+)[\"']", re.I)
+SCRIPT_RE = re.compile(r"<script[^>]+src=[\"']([^\"']+)[\"']", re.I)
+# bindPopup("...") / setContent('...') / bindPopup(`...`)
+POPUP_JS_RE = re.compile(
+    r"\.(?:bindPopup|setContent)\(\s*([\"'`])((?:\\.|(?!\1).)*)\1", re.S
+)
+# popups cargados por AJAX: $.get("..."), $.ajax({url: "..."}), fetch("..."), .load("...")
+POPUP_URL_RE = re.compile(
+    r"(?:\$\.(?:get|post)|fetch|\.load|url\s*:)\s*\(?\s*[\"']([^\"']+)[\"']", re.I
+)
+# librerías que no traen datos de estaciones
+SCRIPTS_IGNORADOS = ("leaflet", "jquery", "bootstrap", "google", "gtag", "analytics")
+
+
+def fetch_text(url, timeout=30):
+    req = Request(url, headers={"User-Agent": USER_AGENT})
+    with urlopen(req, timeout=timeout) as r:
+        charset = r.headers.get_content_charset() or "utf-8"
+        return r.read().decode(charset, errors="replace")
+
+
+def js_unescape(s):
+    """Decodifica los escapes de un literal de string JS (\\n, \\', \\u00f3, \\x41...)."""
+    simples = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f", "v": "\v", "0": "\0", "\n": ""}
+
+    def repl(m):
+        esc = m.group(1)
+        if esc[0] in "ux" and len(esc) > 1:
+            return chr(int(esc[1:], 16))
+        return simples.get(esc, esc)
+
+    return re.sub(r"\\(u[0-9a-fA-F]{4}|x[0-9a-fA-F]{2}|.)", repl, s, flags=re.S)
+
+
+def map_documents(url=URL, timeout=30):
+    """
+    Devuelve [(url, texto)] con la página principal, los iframes que contiene
+    y los scripts propios de esos iframes (donde suelen estar los marcadores).
+    """
+    docs = []
+    page = fetch_text(url, timeout)
+    docs.append((url, page))
+    for src in IFRAME_RE.findall(page):
+        fr_url = urljoin(url, src)
+        try:
+            fr = fetch_text(fr_url, timeout)
+        except Exception as e:
+            print(f"[http] no se pudo leer iframe {fr_url}: {e.__class__.__name__}")
+            continue
+        docs.append((fr_url, fr))
+        for js in SCRIPT_RE.findall(fr):
+            if any(x in js.lower() for x in SCRIPTS_IGNORADOS):
+                continue
+            js_url = urljoin(fr_url, js)
+            try:
+                docs.append((js_url, fetch_text(js_url, timeout)))
+            except Exception as e:
+                print(f"[http] no se pudo leer script {js_url}: {e.__class__.__name__}")
+    return docs
+
+
+def extract_popups(text):
+    """
+    Extrae el HTML de cada popup de un documento:
+    - literales JS pasados a bindPopup/setContent
+    - divs .leaflet-popup-content ya renderizados (HTML guardado desde el navegador)
+    Solo se quedan los que traen tabla de datos.
+    """
+    popups = [js_unescape(m.group(2)) for m in POPUP_JS_RE.finditer(text)]
+    if "leaflet-popup-content" in text:
+        soup = BeautifulSoup(text, "html.parser")
+        popups += [el.decode_contents() for el in soup.select("div.leaflet-popup-content")]
+    return [p for p in popups if "<table" in p.lower()]
+
+
+def extract_popup_urls(text, base_url):
+    """URLs de popups por estación que el mapa pide por AJAX."""
+    urls = []
+    for u in POPUP_URL_RE.findall(text):
+        if u.lower().endswith((".js", ".css", ".png", ".jpg", ".svg")):
+            continue
+        full = urljoin(base_url, js_unescape(u))
+        if full not in urls:
+            urls.append(full)
+    return urls
+
+
+def collect_popups(url=URL, fuente=None, timeout=30, concurrencia=8, intervalo_host=0.2):
+    """HTML de todos los popups (sin repetir), desde la web o desde un archivo guardado."""
+    if fuente:
+        docs = [(url, Path(fuente).read_text(encoding="utf-8"))]
+    else:
+        docs = map_documents(url, timeout)
+
+    popups = [p for _, t in docs for p in extract_popups(t)]
+    if not fuente:
+        # popups servidos por URL: cada respuesta ya es el HTML del popup
+        popup_urls = [u for base, t in docs for u in extract_popup_urls(t, base)]
+        fragmentos = senamhi_async.fetch_all(popup_urls, concurrencia=concurrencia,
+                                             intervalo_host=intervalo_host, timeout=timeout)
+        popups += [f for f in fragmentos if f and "<table" in f.lower()]
+
+    vistos, out = set(), []
+    for p in popups:
+        if p not in vistos:
+            vistos.add(p)
+            out.append(p)
+    return out
+
+
+def station_name_from_html(popup_html):
+    """Nombre de la estación a partir del HTML del popup (celda junto a 'Estación:')."""
+    if not popup_html:
+        return ""
+    soup = BeautifulSoup(popup_html, "html.parser")
+    b = soup.find(["b","strong"], string=lambda s: s and "Estación" in s)
+    if b:
+        td_label = b.find_parent("td")
+        td_val = td_label.find_next_sibling("td") if td_label else None
+        if td_val:
+            return td_val.get_text(strip=True)
+    return ""
@@ -1,5 +1,5 @@
 # senamhi_hourly.py
-import os, csv, time
+import os, csv, argparse
 from datetime import datetime
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
@@ -8,14 +8,25 @@ from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException
+from selenium.common.exceptions import TimeoutException, StaleElementReferenceException
 from bs4 import BeautifulSoup
 from pathlib import Path
+import pandas as pd
+
+import almacen_parquet
+import limpiar_detalle
+import parser_popup
+import senamhi_http
+from senamhi_http import station_name_from_html
+from indice_llaves import KeyIndex, row_key
+from tiempos_scraper import TIMEOUTS_MAX, TimeoutsAdaptativos, ReporteTiempos
 
 URL = "https://www.senamhi.gob.pe/?p=calidad-del-aire"
 BASE_DIR = Path(__file__).resolve().parent   # apunta a .../PC1
 OUT_CSV = str(BASE_DIR / "senamhi_detalle.csv")
 SCHEMA = ["Estacion","Fecha","Hora","PM 2,5","PM 10","SO2","NO2","O3","CO"]
+MARKERS_CSS = ".leaflet-marker-pane .leaflet-marker-icon"
+POPUP_CSS = ".leaflet-popup-content"
 
 def new_driver(headless=True):
     opts = Options()
@@ -56,28 +67,59 @@ def get_popup_html(d, timeout=12):
     except TimeoutException:
         return None
 
+def wait_popup_changed(d, prev_html, timeout):
+    """Espera un popup visible cuyo contenido sea distinto al del marcador anterior."""
+    def popup_nuevo(x):
+        els = x.find_elements(By.CSS_SELECTOR, POPUP_CSS)
+        if not els or not els[0].is_displayed():
+            return False
+        html = els[0].get_attribute("innerHTML")
+        return html if html and html != prev_html else False
+    try:
+        return WebDriverWait(d, timeout, poll_frequency=0.05,
+                             ignored_exceptions=[StaleElementReferenceException]).until(popup_nuevo)
+    except TimeoutException:
+        return None
+
+def wait_tab_active(d, timeout):
+    """Espera a que el radio de la pestaña de datos (tab-3) quede marcado."""
+    try:
+        WebDriverWait(d, timeout, poll_frequency=0.05).until(
+            lambda x: x.execute_script("var t=document.getElementById('tab-3'); return !t || t.checked;")
+        )
+        return True
+    except TimeoutException:
+        return False
+
+def close_popup(d, timeout):
+    """Envía Escape y espera a que el popup desaparezca del DOM (o deje de verse)."""
+    d.execute_script("document.dispatchEvent(new KeyboardEvent('keydown', {'key':'Escape'}));")
+    try:
+        WebDriverWait(d, timeout, poll_frequency=0.05).until(
+            EC.invisibility_of_element_located((By.CSS_SELECTOR, POPUP_CSS))
+        )
+        return True
+    except TimeoutException:
+        return False
+
 XPATH_ESTACION = ("//div[contains(@class,'leaflet-popup-content')]"
                   "//*[self::b or self::strong][normalize-space()='Estación:']"
                   "/ancestor::td/following-sibling::td[1]")
 
-def extract_station_name(d, popup_html_backup=None):
+def wait_station_name(d, timeout):
+    """Espera la celda junto a 'Estación:' en el popup abierto; None si no aparece a tiempo."""
     try:
-        td = WebDriverWait(d, 5).until(EC.visibility_of_element_located((By.XPATH, XPATH_ESTACION)))
-        name = td.text.strip()
-        if name: return name
+        td = WebDriverWait(d, timeout).until(EC.visibility_of_element_located((By.XPATH, XPATH_ESTACION)))
+        return td.text.strip() or None
     except TimeoutException:
-        pass
+        return None
+
+def extract_station_name(d, popup_html_backup=None, timeout=TIMEOUTS_MAX["estacion"]):
+    name = wait_station_name(d, timeout)
+    if name: return name
     if not popup_html_backup:
-        popup_html_backup = get_popup_html(d, timeout=3)
-    if popup_html_backup:
-        soup = BeautifulSoup(popup_html_backup, "html.parser")
-        b = soup.find(["b","strong"], string=lambda s: s and "Estación" in s)
-        if b:
-            td_label = b.find_parent("td")
-            td_val = td_label.find_next_sibling("td") if td_label else None
-            if td_val:
-                return td_val.get_text(strip=True)
-    return ""
+        popup_html_backup = get_popup_html(d, timeout=timeout)
+    return station_name_from_html(popup_html_backup)
 
 def parse_first_row_by_position(popup_html):
     """
@@ -149,64 +191,188 @@ def append_rows(path, rows):
         for r in rows:
             w.writerow(r)
 
-def run_once():
-    d = new_driver(headless=True)
-    d.get(URL)
-    wait_ready(d, 90)
-
-    if not enter_leaflet_iframe(d):
-        print("No se encontró el iframe del mapa.")
-        d.quit()
-        return
-
-    markers_css = ".leaflet-marker-pane .leaflet-marker-icon"
-    resultados = []
-    seen_keys = read_existing_keys(OUT_CSV)
+def keep_new(rows, seen_keys):
+    """Filtra filas ya vistas (Estacion|Fecha|Hora) y las normaliza al SCHEMA."""
+    nuevos = []
+    for row in rows:
+        key = f"{row['Estacion']}|{row['Fecha']}|{row['Hora']}"
+        if key not in seen_keys:
+            nuevos.append({k: row.get(k, "") for k in SCHEMA})
+            seen_keys.add(key)
+    return nuevos
 
-    total = len(d.find_elements(By.CSS_SELECTOR, markers_css))
-    for i in range(total):
-        ms = d.find_elements(By.CSS_SELECTOR, markers_css)
-        if i >= len(ms): break
-        m = ms[i]
+def scrape_http(fuente=None, concurrencia=8, intervalo_host=0.2):
+    """Primera fila de cada estación leyendo el payload del mapa, sin navegador."""
+    popups = senamhi_http.collect_popups(URL, fuente=fuente, concurrencia=concurrencia,
+                                         intervalo_host=intervalo_host)
+    return parser_popup.parse_many(popups, first_only=True)
 
-        click_js(d, m)
-        html = get_popup_html(d, timeout=12)
-        if not html:
-            click_js(d, m); html = get_popup_html(d, timeout=12)
+def scrape_markers(d, timeouts, reporte):
+    """
+    Recorre los marcadores de un driver ya parado en el iframe del mapa.
+    Las esperas son por cambios del DOM (popup nuevo, tab marcada, popup cerrado)
+    con timeouts adaptativos, y cada fase queda medida en `reporte`.
+    """
+    filas = []
+    prev_html = None
+    markers = d.find_elements(By.CSS_SELECTOR, MARKERS_CSS)
+    for i in range(len(markers)):
+        reporte.marker(i)
+        html = None
+        for intento in range(2):
+            try:
+                click_js(d, markers[i])
+            except StaleElementReferenceException:
+                # el mapa se redibujó: recién aquí se vuelven a pedir los marcadores
+                markers = d.find_elements(By.CSS_SELECTOR, MARKERS_CSS)
+                if i >= len(markers):
+                    break
+                click_js(d, markers[i])
+            html = wait_popup_changed(d, prev_html, timeouts.get("popup"))
+            if html:
+                break
+        # solo las esperas que terminaron entran al historial: un timeout
+        # (o un reintento tras uno) mediría el propio timeout y lo iría
+        # fijando como p95
+        dt = reporte.fase("click_popup")
         if not html:
+            reporte.fin_marker("", False)
             continue
+        if intento == 0:
+            timeouts.record("popup", dt)
 
         # Mostrar/activar la pestaña con la tabla si existe
+        tab_ok = True
         try:
             lab = d.find_elements(By.CSS_SELECTOR, "label[for='tab-3']")
             if lab:
-                click_js(d, lab[0]); time.sleep(0.25)
-                html = get_popup_html(d, timeout=6) or html
+                click_js(d, lab[0])
+                tab_ok = wait_tab_active(d, timeouts.get("tab"))
+                html = get_popup_html(d, timeout=timeouts.get("tab")) or html
         except Exception:
-            pass
+            tab_ok = False
+        dt = reporte.fase("tab")
+        if tab_ok:
+            timeouts.record("tab", dt)
 
-        estacion = extract_station_name(d, popup_html_backup=html)
+        estacion = wait_station_name(d, timeouts.get("estacion"))
+        dt = reporte.fase("nombre")
+        if estacion:
+            timeouts.record("estacion", dt)
+        else:
+            estacion = station_name_from_html(html)
         row = parse_first_row_by_position(html)
-        # Cierra popup
-        d.execute_script("document.dispatchEvent(new KeyboardEvent('keydown', {'key':'Escape'}));")
-        time.sleep(0.15)
+        reporte.fase("parse")
 
+        cerrado = close_popup(d, timeouts.get("close"))
+        dt = reporte.fase("close")
+        if cerrado:
+            timeouts.record("close", dt)
+        prev_html = html
+
+        reporte.fin_marker(estacion, bool(row))
         if not row:
             continue
         row["Estacion"] = estacion
-        key = f"{row['Estacion']}|{row['Fecha']}|{row['Hora']}"
-        if key not in seen_keys:
-            resultados.append({k: row.get(k, "") for k in SCHEMA})
-            seen_keys.add(key)
+        filas.append(row)
+    return filas
+
+def open_map(d):
+    """Carga la página y deja el driver dentro del iframe de Leaflet."""
+    d.get(URL)
+    wait_ready(d, 90)
+    return enter_leaflet_iframe(d)
+
+def save_timings(timeouts, reporte, etiqueta="selenium"):
+    """Escribe el reporte del run y actualiza el historial de tiempos."""
+    resumen = reporte.write()
+    timeouts.record_run({"inicio": resumen["inicio"], "estaciones": resumen["estaciones"],
+                         "p95_total": resumen["total"]["p95"]})
+    timeouts.save()
+    p95 = resumen["total"]["p95"]
+    print(f"[{etiqueta}] {resumen['estaciones']} marcadores, p95 por estación: "
+          f"{p95:.2f}s" if p95 is not None else f"[{etiqueta}] sin marcadores")
+    return resumen
+
+def scrape_selenium():
+    """Primera fila de cada estación haciendo click en los marcadores (fallback)."""
+    timeouts = TimeoutsAdaptativos()
+    reporte = ReporteTiempos()
+
+    d = new_driver(headless=True)
+    if not open_map(d):
+        print("No se encontró el iframe del mapa.")
+        d.quit()
+        return []
+
+    filas = scrape_markers(d, timeouts, reporte)
 
     d.switch_to.default_content()
     d.quit()
 
+    save_timings(timeouts, reporte)
+    return filas
+
+def scrape(modo="auto", fuente=None, concurrencia=8, intervalo_host=0.2):
+    """
+    Filas crudas (SCHEMA) del run, sin escribir nada.
+    modo: 'http' (sin navegador), 'selenium' (click por marcador) o
+    'auto' (http y, si no trae filas, cae a selenium).
+    concurrencia / intervalo_host: límites de la descarga paralela de popups (modo http).
+    """
+    filas = []
+    if modo in ("auto", "http"):
+        try:
+            filas = scrape_http(fuente=fuente, concurrencia=concurrencia,
+                                intervalo_host=intervalo_host)
+        except Exception as e:
+            print(f"[http] falló la ingesta sin navegador: {e.__class__.__name__}: {e}")
+        if not filas and modo == "auto":
+            print("[http] sin popups en el payload, usando Selenium.")
+    if modo == "selenium" or (modo == "auto" and not filas):
+        filas = scrape_selenium()
+    return filas
+
+def run_once(modo="auto", fuente=None, concurrencia=8, intervalo_host=0.2, almacen=False):
+    """
+    scrape() + save_rows().
+    almacen: además del CSV, agrega las filas nuevas (limpias) al almacén Parquet.
+    """
+    filas = scrape(modo=modo, fuente=fuente, concurrencia=concurrencia, intervalo_host=intervalo_host)
+    return save_rows(filas, almacen=almacen)
+
+def save_rows(filas, almacen=False):
+    """Agrega al CSV (y opcionalmente al almacén) las filas que no estaban. Devuelve las nuevas."""
+    # llaves ya escritas: probe al índice persistente, solo por las filas recién leídas
+    with KeyIndex(OUT_CSV) as idx:
+        seen_keys = idx.existing(row_key(r) for r in filas)
+        resultados = keep_new(filas, seen_keys)
+        idx.append(resultados, append_rows)
+
+    if resultados and almacen:
+        tocadas = almacen_parquet.escribir(limpiar_detalle.limpiar(pd.DataFrame(resultados)))
+        print(f"[almacen] {len(tocadas)} particiones actualizadas")
+
     if resultados:
-        append_rows(OUT_CSV, resultados)
         print(f"{datetime.now()} -> añadidas {len(resultados)} filas a {OUT_CSV}")
     else:
         print(f"{datetime.now()} -> no hubo filas nuevas (posible duplicado o sin datos).")
+    return resultados
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Scraper horario SENAMHI (primera fila por estación).")
+    ap.add_argument("--modo", choices=["auto", "http", "selenium"],
+                    default=os.getenv("SENAMHI_MODO", "auto"))
+    ap.add_argument("--fuente", help="HTML/JS guardado del mapa para correr sin red (modo http)")
+    ap.add_argument("--concurrencia", type=int, default=int(os.getenv("SENAMHI_CONCURRENCIA", "8")),
+                    help="requests de popups en paralelo (modo http)")
+    ap.add_argument("--intervalo-host", type=float, default=0.2,
+                    help="segundos mínimos entre requests al mismo host")
+    ap.add_argument("--almacen", action="store_true",
+                    help="agrega también las filas nuevas al almacén Parquet")
+    return ap.parse_args()
 
 if __name__ == "__main__":
-    run_once()
+    args = parse_args()
+    run_once(modo=args.modo, fuente=args.fuente, concurrencia=args.concurrencia,
+             intervalo_host=args.intervalo_host, almacen=args.almacen)
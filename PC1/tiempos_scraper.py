@@ -0,0 +1,111 @@
+# tiempos_scraper.py
+"""
+Timeouts adaptativos y reporte de tiempos por estación para el scraper Selenium.
+
+- `TimeoutsAdaptativos`: para cada fase (popup, tab, estacion, close) guarda
+  las últimas duraciones observadas en `tiempos_historial.json` y usa
+  p95 * margen como timeout del próximo run, acotado entre un mínimo y el
+  valor fijo de antes.
+- `ReporteTiempos`: mide por estación click→popup, cambio de tab, espera del
+  nombre de la estación, parseo y cierre, y al final escribe
+  `tiempos_ultimo_run.json` con el detalle y los percentiles; el p95 total de
+  cada run queda en el historial para seguirlo.
+"""
+import json
+import time
+from datetime import datetime
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+HISTORIAL = BASE_DIR / "tiempos_historial.json"
+REPORTE = BASE_DIR / "tiempos_ultimo_run.json"
+
+# timeouts fijos que usaba el scraper: ahora son el techo
+TIMEOUTS_MAX = {"popup": 12.0, "tab": 6.0, "close": 5.0, "estacion": 5.0}
+# fases del reporte por estación ("nombre" es la espera que usa el timeout "estacion")
+FASES = ["click_popup", "tab", "nombre", "parse", "close"]
+
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    xs = sorted(valores)
+    k = (len(xs) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(xs) - 1)
+    return round(xs[lo] + (xs[hi] - xs[lo]) * (k - lo), 4)
+
+
+def _load(path):
+    try:
+        return json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+class TimeoutsAdaptativos:
+    def __init__(self, path=HISTORIAL, margen=2.0, minimo=1.0, ventana=500):
+        self.path = Path(path)
+        self.margen = margen
+        self.minimo = minimo
+        self.ventana = ventana
+        self.data = _load(self.path)
+        self.data.setdefault("fases", {})
+        self.data.setdefault("runs", [])
+
+    def get(self, fase):
+        techo = TIMEOUTS_MAX[fase]
+        p95 = percentil(self.data["fases"].get(fase, []), 95)
+        if p95 is None:
+            return techo
+        return max(self.minimo, min(techo, p95 * self.margen))
+
+    def record(self, fase, segundos):
+        hist = self.data["fases"].setdefault(fase, [])
+        hist.append(round(segundos, 4))
+        del hist[:-self.ventana]
+
+    def record_run(self, resumen):
+        self.data["runs"].append(resumen)
+        del self.data["runs"][:-self.ventana]
+
+    def save(self):
+        self.path.write_text(json.dumps(self.data, indent=1), encoding="utf-8")
+
+
+class ReporteTiempos:
+    def __init__(self):
+        self.inicio = datetime.now()
+        self.estaciones = []
+        self._actual = None
+        self._t = None
+
+    def marker(self, i):
+        self._actual = {"marker": i, "estacion": "", "ok": False}
+        self.estaciones.append(self._actual)
+        self._t = time.perf_counter()
+
+    def fase(self, nombre):
+        """Cierra la fase `nombre` (desde la marca anterior) y devuelve su duración."""
+        now = time.perf_counter()
+        dt = now - self._t
+        self._actual[nombre] = round(dt, 4)
+        self._t = now
+        return dt
+
+    def fin_marker(self, estacion, ok):
+        self._actual["estacion"] = estacion
+        self._actual["ok"] = ok
+        self._actual["total"] = round(sum(self._actual.get(f, 0) for f in FASES), 4)
+
+    def resumen(self):
+        out = {"inicio": self.inicio.isoformat(timespec="seconds"), "estaciones": len(self.estaciones)}
+        for f in FASES + ["total"]:
+            xs = [e[f] for e in self.estaciones if f in e]
+            out[f] = {"p50": percentil(xs, 50), "p95": percentil(xs, 95), "max": max(xs) if xs else None}
+        return out
+
+    def write(self, path=REPORTE):
+        data = {"resumen": self.resumen(), "detalle": self.estaciones}
+        Path(path).write_text(json.dumps(data, indent=1, ensure_ascii=False), encoding="utf-8")
+        return data["resumen"]
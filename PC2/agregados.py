@@ -0,0 +1,153 @@
+# agregados.py
+"""
+Rollups horarios, diarios y mensuales de measurements (ver sql/05_agregados.sql).
+
+Cada nivel guarda suma, conteo, mínimo y máximo por estación y bucket:
+- measurements_hourly  se recalcula desde measurements;
+- measurements_daily   desde measurements_hourly;
+- measurements_monthly desde measurements_daily.
+Recalcular (en vez de sumar deltas) hace que re-subir o corregir una fila
+deje el bucket bien, y como cada nivel sale del anterior el costo es el de
+los buckets tocados, no el de la historia.
+
+El loader llama a actualizar(cur, out) con cada lote subido; --backfill
+reconstruye todo (o desde una fecha) mes a mes.
+
+Uso:
+    python agregados.py --backfill [--desde 2024-01-01]
+"""
+import argparse
+import time
+
+import pandas as pd
+
+from response_cache import bump_version
+
+POLS = ["pm2_5", "pm10", "so2", "no2", "o3", "co"]
+
+NIVELES = {
+    # nombre: (tabla, tabla origen, expresión del bucket sobre la columna de tiempo)
+    "hourly": ("measurements_hourly", "measurements",
+               "TIMESTAMP(DATE({c}), MAKETIME(HOUR({c}), 0, 0))"),
+    "daily": ("measurements_daily", "measurements_hourly", "TIMESTAMP(DATE({c}))"),
+    "monthly": ("measurements_monthly", "measurements_daily",
+                "TIMESTAMP(DATE({c}) - INTERVAL (DAYOFMONTH({c}) - 1) DAY)"),
+}
+ORDEN = ["hourly", "daily", "monthly"]
+
+COLS = [f"{p}_{s}" for p in POLS for s in ("sum", "n", "min", "max")]
+
+
+def _select(nivel):
+    tabla, origen, bucket = NIVELES[nivel]
+    if origen == "measurements":
+        c, exprs = "ts", []
+        for p in POLS:
+            exprs += [f"SUM({p})", f"COUNT({p})", f"MIN({p})", f"MAX({p})"]
+    else:
+        c, exprs = "bucket", []
+        for p in POLS:
+            exprs += [f"SUM({p}_sum)", f"SUM({p}_n)", f"MIN({p}_min)", f"MAX({p}_max)"]
+    return (f"INSERT INTO {tabla} (station_id, bucket, {', '.join(COLS)})\n"
+            f"SELECT station_id, {bucket.format(c=c)} AS b, {', '.join(exprs)}\n"
+            f"FROM {origen}\n"
+            "WHERE {where}\n"
+            "GROUP BY station_id, b\n"
+            "ON DUPLICATE KEY UPDATE " + ", ".join(f"{k}=VALUES({k})" for k in COLS))
+
+
+RECALCULAR_SQL = {n: _select(n) for n in ORDEN}
+
+
+def _col_tiempo(nivel):
+    return "ts" if NIVELES[nivel][1] == "measurements" else "bucket"
+
+
+def piso(ts, nivel):
+    """Inicio del bucket de `nivel` que contiene a ts (Timestamp)."""
+    if nivel == "hourly":
+        return ts.floor("h")
+    if nivel == "daily":
+        return ts.normalize()
+    return ts.normalize() - pd.Timedelta(days=ts.day - 1)
+
+
+def siguiente(ts, nivel):
+    """Inicio del bucket siguiente al que empieza en ts."""
+    if nivel == "hourly":
+        return ts + pd.Timedelta(hours=1)
+    if nivel == "daily":
+        return ts + pd.Timedelta(days=1)
+    return ts + pd.offsets.MonthBegin(1)
+
+
+def recalcular(cur, nivel, rangos):
+    """
+    Recalcula los buckets de `nivel` que caen en `rangos` = [(station_id, desde, hasta)],
+    con desde/hasta alineados al bucket y `hasta` exclusivo. Un solo INSERT ... SELECT:
+    cada rango es un intervalo sobre la PK/uq_station_ts del origen.
+    """
+    if not rangos:
+        return 0
+    col = _col_tiempo(nivel)
+    where, params = [], []
+    for sid, desde, hasta in rangos:
+        where.append(f"(station_id = %s AND {col} >= %s AND {col} < %s)")
+        params += [int(sid), desde.to_pydatetime(), hasta.to_pydatetime()]
+    cur.execute(RECALCULAR_SQL[nivel].format(where=" OR ".join(where)), params)
+    return cur.rowcount
+
+
+def actualizar(cur, out):
+    """Recalcula los buckets (hora, día, mes) que tocan las filas de `out` (station_id, ts)."""
+    if out.empty:
+        return
+    extremos = out.groupby("station_id")["ts"].agg(["min", "max"])
+    for nivel in ORDEN:
+        rangos = []
+        for sid, (lo, hi) in extremos.iterrows():
+            rangos.append((sid, piso(lo, nivel), siguiente(piso(hi, nivel), nivel)))
+        recalcular(cur, nivel, rangos)
+
+
+def backfill(cn, cur, desde=None):
+    """Reconstruye los tres niveles mes a mes (desde `desde`, o desde el inicio), commit por mes."""
+    cur.execute("SELECT MIN(ts), MAX(ts) FROM measurements")
+    lo, hi = cur.fetchone()
+    if lo is None:
+        return 0
+    inicio = piso(pd.Timestamp(desde) if desde else pd.Timestamp(lo), "monthly")
+    fin = siguiente(piso(pd.Timestamp(hi), "monthly"), "monthly")
+    meses = 0
+    mes = inicio
+    while mes < fin:
+        prox = siguiente(mes, "monthly")
+        for nivel in ORDEN:
+            col = _col_tiempo(nivel)
+            cur.execute(RECALCULAR_SQL[nivel].format(where=f"{col} >= %s AND {col} < %s"),
+                        [mes.to_pydatetime(), prox.to_pydatetime()])
+        bump_version(cur)
+        cn.commit()
+        meses += 1
+        print(f"[agregados] {mes:%Y-%m} listo")
+        mes = prox
+    return meses
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Rollups horarios/diarios/mensuales de measurements.")
+    ap.add_argument("--backfill", action="store_true", help="recalcula los rollups desde measurements")
+    ap.add_argument("--desde", help="YYYY-MM-DD: solo desde el mes de esa fecha")
+    args = ap.parse_args()
+    if not args.backfill:
+        ap.error("nada que hacer: usa --backfill")
+
+    import subir_mysql
+
+    cn = subir_mysql.connect()
+    cur = cn.cursor()
+    t0 = time.perf_counter()
+    n = backfill(cn, cur, args.desde)
+    cur.close()
+    cn.close()
+    print(f"✅ Rollups reconstruidos: {n} meses en {time.perf_counter() - t0:.1f}s")
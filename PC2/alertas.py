@@ -0,0 +1,422 @@
+# alertas.py
+"""
+Evaluación de reglas de alerta (alert_rules) contra la última medición de cada
+estación (station_latest) o, en las reglas con ventana, contra el agregado
+móvil que guarda alert_window_state (ver ventanas.py), en SQL por conjuntos:
+
+- un solo SELECT arma los candidatos: cada regla habilitada se cruza con las
+  estaciones a las que aplica (la suya, o todas si station_id es NULL), se
+  elige la columna del contaminante con un CASE y se aplica el operador;
+- los candidatos que todavía no tienen evento (LEFT JOIN a alert_events por
+  uq_rule_station_ts) son los eventos nuevos que se reportan;
+- un solo INSERT ... SELECT ... ON DUPLICATE KEY UPDATE los escribe, con la
+  misma deduplicación por (rule_id, station_id, ts) de siempre.
+
+Son dos consultas por evaluación, sin importar cuántas reglas o estaciones haya.
+
+En la ingesta, EvaluadorAlertas recibe del loader las filas recién subidas
+(station_id, ts, contaminantes) y, en un hilo aparte con su propia conexión,
+las cruza solo con las reglas de esos contaminantes/estaciones (IndiceReglas)
+y escribe los eventos en lote. Así también se revisan las horas que llegan
+atrasadas en un backfill, no solo la última de cada estación, y el costo
+depende de lo que se sube, no del tamaño de measurements.
+
+Uso:
+    from alertas import evaluar
+    nuevos = evaluar(cur)              # todas las reglas habilitadas
+    nuevos = evaluar(cur, rule_id=3)   # una sola
+
+    with EvaluadorAlertas(subir_mysql.connect) as ev:
+        ev.encolar(out)                # DataFrame ya commiteado en measurements
+
+Backfill histórico (¿cuántas veces habría disparado?): lee measurements por
+tramos de tiempo, evalúa las reglas elegidas con el mismo IndiceReglas (las de
+ventana con rolling por estación, arrastrando la cola del tramo anterior) y
+escribe los eventos con upsert, así repetirlo no duplica nada.
+
+    python alertas.py --backfill --regla 3 --regla 7 [--desde 2022-01-01] [--hasta 2025-01-01]
+                      [--dias 31] [--sin-escribir]
+"""
+import argparse
+import queue
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import ventanas
+
+POLLUTANT_DB_COL = {
+    "pm25": "pm2_5",
+    "pm10": "pm10",
+    "so2":  "so2",
+    "no2":  "no2",
+    "o3":   "o3",
+    "co":   "co",
+}
+
+VALID_OPERATORS = {"gt", "ge", "lt", "le"}
+
+_VALOR = "CASE LOWER(r.pollutant) " + " ".join(
+    f"WHEN '{p}' THEN l.{c}" for p, c in POLLUTANT_DB_COL.items()) + " END"
+
+# reglas x estaciones que aplican, con el valor del contaminante de la regla:
+# las instantáneas contra station_latest, las de ventana (ventanas.py) contra el
+# agregado de su alert_window_state
+CANDIDATOS_SQL = f"""
+SELECT r.id AS rule_id, l.station_id, l.ts, LOWER(r.pollutant) AS pollutant,
+       {_VALOR} AS value, LOWER(r.operator) AS operator, r.threshold
+FROM alert_rules r
+JOIN station_latest l ON (r.station_id IS NULL OR l.station_id = r.station_id)
+WHERE r.enabled = 1 AND (r.window_hours IS NULL OR r.window_hours <= 1) {{filtro}}
+UNION ALL
+SELECT r.id, w.station_id, w.end_ts, LOWER(r.pollutant),
+       IF(LOWER(r.aggregation) = 'max', w.max_val, w.sum_val / w.n),
+       LOWER(r.operator), r.threshold
+FROM alert_rules r
+JOIN alert_window_state w ON w.rule_id = r.id
+WHERE r.enabled = 1 AND r.window_hours > 1
+  AND w.n >= GREATEST(1, CEIL(r.window_hours * {ventanas.COBERTURA_MIN})) {{filtro}}
+"""
+
+DISPARADAS_SQL = """
+SELECT * FROM ({candidatos}) c
+WHERE c.value IS NOT NULL
+  AND ((c.operator = 'gt' AND c.value >  c.threshold)
+    OR (c.operator = 'ge' AND c.value >= c.threshold)
+    OR (c.operator = 'lt' AND c.value <  c.threshold)
+    OR (c.operator = 'le' AND c.value <= c.threshold))
+"""
+
+CONTAR_NUEVOS_SQL = """
+SELECT COUNT(*) AS n
+FROM ({disparadas}) d
+LEFT JOIN alert_events e
+  ON e.rule_id = d.rule_id AND e.station_id = d.station_id AND e.ts = d.ts
+WHERE e.id IS NULL
+"""
+
+INSERTAR_SQL = """
+INSERT INTO alert_events (rule_id, station_id, ts, pollutant, value, operator, threshold)
+SELECT d.rule_id, d.station_id, d.ts, d.pollutant, d.value, d.operator, d.threshold
+FROM ({disparadas}) d
+ON DUPLICATE KEY UPDATE
+  value=VALUES(value), operator=VALUES(operator), threshold=VALUES(threshold)
+"""
+
+
+def _disparadas(rule_id=None):
+    filtro, params = "", []
+    if rule_id:
+        filtro, params = "AND r.id = %s", [rule_id, rule_id]  # una vez por rama del UNION
+    return DISPARADAS_SQL.format(candidatos=CANDIDATOS_SQL.format(filtro=filtro)), params
+
+
+def evaluar(cur, rule_id=None) -> int:
+    """
+    Genera los alert_events de las reglas habilitadas (o solo `rule_id`) y devuelve
+    cuántos son nuevos; los que ya existían se actualizan. No commitea.
+    """
+    ventanas.sembrar(cur, rule_id)
+    disparadas, params = _disparadas(rule_id)
+    cur.execute(CONTAR_NUEVOS_SQL.format(disparadas=disparadas), params)
+    row = cur.fetchone()
+    nuevos = int(row["n"] if isinstance(row, dict) else row[0])
+    cur.execute(INSERTAR_SQL.format(disparadas=disparadas), params)
+    return nuevos
+
+
+# ---------------- Evaluación incremental (ingesta) ----------------
+
+REGLAS_SQL = """
+SELECT id, station_id, pollutant, operator, threshold, window_hours, aggregation
+FROM alert_rules WHERE enabled = 1
+"""
+
+EVENTO_SQL = """
+INSERT INTO alert_events (rule_id, station_id, ts, pollutant, value, operator, threshold)
+VALUES (%s,%s,%s,%s,%s,%s,%s)
+ON DUPLICATE KEY UPDATE
+  value=VALUES(value), operator=VALUES(operator), threshold=VALUES(threshold)
+"""
+
+_OPS = {"gt": np.greater, "ge": np.greater_equal, "lt": np.less, "le": np.less_equal}
+LOTE_EVENTOS = 5000
+
+
+class IndiceReglas:
+    """
+    Reglas habilitadas indexadas por columna de contaminante y, dentro de ella,
+    en globales (station_id NULL) y por estación. Las de ventana quedan aparte
+    en `ventanas` (las evalúa ventanas.procesar).
+    """
+
+    def __init__(self, filas):
+        reglas = pd.DataFrame(list(filas), columns=["rule_id", "station_id", "pollutant", "operator",
+                                                    "threshold", "w", "agregacion"])
+        reglas["pollutant"] = reglas["pollutant"].fillna("").str.lower()
+        reglas["operator"] = reglas["operator"].fillna("").str.lower()
+        reglas["agregacion"] = reglas["agregacion"].fillna("avg").str.lower()
+        reglas = reglas[reglas["pollutant"].isin(POLLUTANT_DB_COL.keys())
+                        & reglas["operator"].isin(VALID_OPERATORS)]
+        reglas = reglas.assign(col=reglas["pollutant"].map(POLLUTANT_DB_COL),
+                               threshold=reglas["threshold"].astype("float64"))
+        self.ids = sorted(int(x) for x in reglas["rule_id"])
+        en_ventana = reglas["w"].fillna(1).astype("int64") > 1
+        self.ventanas = reglas[en_ventana].astype({"w": "int64"})
+        reglas = reglas[~en_ventana].drop(columns=["w", "agregacion"])
+        self.n = len(reglas) + len(self.ventanas)
+        self.globales = {}
+        self.por_estacion = {}
+        for col, g in reglas.groupby("col"):
+            glob = g["station_id"].isna()
+            self.globales[col] = g[glob].drop(columns="station_id")
+            self.por_estacion[col] = g[~glob].astype({"station_id": "int64"})
+
+    @classmethod
+    def cargar(cls, cur):
+        cur.execute(REGLAS_SQL)
+        return cls(tuple(r.values()) if isinstance(r, dict) else r for r in cur.fetchall())
+
+    def disparadas(self, out):
+        """Eventos (tuplas para EVENTO_SQL) que generan las filas de `out`."""
+        partes = []
+        for col in self.globales.keys() & set(out.columns):
+            filas = out.loc[out[col].notna(), ["station_id", "ts", col]].rename(columns={col: "value"})
+            if filas.empty:
+                continue
+            glob, prop = self.globales[col], self.por_estacion[col]
+            cand = []
+            if len(glob):
+                cand.append(filas.merge(glob, how="cross"))
+            prop = prop[prop["station_id"].isin(filas["station_id"].unique())]
+            if len(prop):
+                cand.append(filas.merge(prop, on="station_id"))
+            for c in cand:
+                ok = np.zeros(len(c), dtype=bool)
+                for op, fn in _OPS.items():
+                    m = (c["operator"] == op).to_numpy()
+                    ok[m] = fn(c["value"].to_numpy()[m], c["threshold"].to_numpy()[m])
+                partes.append(c[ok])
+        if not partes:
+            return []
+        ev = pd.concat(partes, ignore_index=True)
+        return list(zip(ev["rule_id"].astype(int).tolist(), ev["station_id"].astype(int).tolist(),
+                        list(ev["ts"].dt.to_pydatetime()), ev["pollutant"].tolist(),
+                        ev["value"].astype(float).tolist(), ev["operator"].tolist(),
+                        ev["threshold"].astype(float).tolist()))
+
+
+def evaluar_filas(cn, cur, out, indice=None):
+    """Evalúa las filas `out` contra las reglas y escribe los eventos en lote; devuelve cuántos dispararon."""
+    if indice is None:
+        indice = IndiceReglas.cargar(cur)
+    eventos = indice.disparadas(out)
+    eventos += ventanas.procesar(cur, out, indice.ventanas)
+    for i in range(0, len(eventos), LOTE_EVENTOS):
+        cur.executemany(EVENTO_SQL.strip(), eventos[i:i + LOTE_EVENTOS])
+    cn.commit()
+    return len(eventos)
+
+
+class EvaluadorAlertas:
+    """
+    Hilo de fondo que evalúa las filas que le pasa el loader. Las reglas se leen
+    una vez por lote recibido (son pocas filas), así un cambio de reglas vale
+    desde el lote siguiente. Los errores se cuentan y se informan, no cortan la carga.
+    """
+
+    def __init__(self, conectar):
+        self.conectar = conectar
+        self.cola = queue.Queue()
+        self.cuenta = {"lotes": 0, "filas": 0, "eventos": 0, "errores": 0}
+        self._hilo = threading.Thread(target=self._trabajar, name="evaluador-alertas", daemon=True)
+
+    def __enter__(self):
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+    def encolar(self, out):
+        """Entrega filas ya commiteadas (station_id, ts, pm2_5, ...)."""
+        if len(out):
+            self.cola.put(out[["station_id", "ts", *POLLUTANT_DB_COL.values()]].copy())
+
+    def cerrar(self):
+        """Espera a que se evalúe todo lo encolado."""
+        self.cola.put(None)
+        self._hilo.join()
+
+    def _trabajar(self):
+        cn = cur = None
+        while True:
+            out = self.cola.get()
+            if out is None:
+                break
+            try:
+                if cn is None:
+                    cn = self.conectar()
+                    cur = cn.cursor()
+                self.cuenta["eventos"] += evaluar_filas(cn, cur, out)
+                self.cuenta["lotes"] += 1
+                self.cuenta["filas"] += len(out)
+            except Exception as e:
+                self.cuenta["errores"] += 1
+                print(f"[alertas] error evaluando {len(out)} filas: {e}", file=sys.stderr)
+                if cn is not None:
+                    try:
+                        cn.rollback()
+                    except Exception:
+                        cn = None
+        if cn is not None:
+            cur.close()
+            cn.close()
+
+    def resumen(self):
+        c = self.cuenta
+        txt = f"{c['filas']} filas evaluadas, {c['eventos']} eventos"
+        return txt + (f", {c['errores']} lotes con error" if c["errores"] else "")
+
+
+# ---------------- Backfill histórico ----------------
+
+REGLAS_ID_SQL = """
+SELECT id, station_id, pollutant, operator, threshold, window_hours, aggregation
+FROM alert_rules WHERE id IN ({ids})
+"""
+
+TRAMO_SQL = """
+SELECT station_id, ts, pm2_5, pm10, so2, no2, o3, co
+FROM measurements
+WHERE ts >= %s AND ts < %s {filtro}
+"""
+
+
+def _ventanas_historicas(df, reglas, desde):
+    """
+    Eventos de las reglas de ventana sobre `df` (tramo + cola del anterior), con
+    rolling por tiempo por estación; solo se emiten los de ts >= desde. Misma
+    cobertura mínima que ventanas.Ventana.
+    """
+    if reglas.empty or df.empty:
+        return []
+    df = df.sort_values(["station_id", "ts"])
+    cache = {}
+    eventos = []
+    for r in reglas.to_dict("records"):
+        clave = (r["col"], r["w"], r["agregacion"])
+        if clave not in cache:
+            g = df.set_index("ts").groupby("station_id")[r["col"]]
+            rol = g.rolling(f"{r['w']}h", min_periods=ventanas.minimo_horas(r["w"]))
+            cache[clave] = (rol.max() if r["agregacion"] == "max" else rol.mean()).dropna()
+        serie = cache[clave]
+        sid_idx = serie.index.get_level_values(0)
+        ts_idx = serie.index.get_level_values(1)
+        ok = (ts_idx >= desde) & _OPS[r["operator"]](serie.to_numpy(), r["threshold"])
+        if not pd.isna(r["station_id"]):
+            ok &= sid_idx == int(r["station_id"])
+        if not ok.any():
+            continue
+        for sid, ts, val in zip(sid_idx[ok].tolist(), ts_idx[ok].to_pydatetime(), serie.to_numpy()[ok].tolist()):
+            eventos.append((r["rule_id"], sid, ts, r["pollutant"], val, r["operator"], r["threshold"]))
+    return eventos
+
+
+def backfill(cn, cur, rule_ids=None, desde=None, hasta=None, dias=31, escribir=True):
+    """
+    Evalúa `rule_ids` (o todas las habilitadas) sobre measurements en [desde, hasta),
+    leyendo tramos de `dias`. Devuelve conteos por estación y por regla.
+    escribir=False solo cuenta (no toca alert_events).
+    """
+    t0 = time.perf_counter()
+    if rule_ids:
+        cur.execute(REGLAS_ID_SQL.format(ids=",".join(["%s"] * len(rule_ids))), list(rule_ids))
+    else:
+        cur.execute(REGLAS_SQL)
+    indice = IndiceReglas(tuple(r.values()) if isinstance(r, dict) else r for r in cur.fetchall())
+    res = {"rules": indice.ids, "filas": 0, "eventos": 0, "por_estacion": {}, "por_regla": {}}
+    if indice.n == 0:
+        return res
+
+    cur.execute("SELECT MIN(ts), MAX(ts) FROM measurements")
+    row = cur.fetchone()
+    lo, hi = row.values() if isinstance(row, dict) else row
+    if lo is None:
+        return res
+    desde = pd.Timestamp(desde) if desde else pd.Timestamp(lo)
+    hasta = pd.Timestamp(hasta) if hasta else pd.Timestamp(hi) + pd.Timedelta(seconds=1)
+    res.update({"desde": desde.isoformat(), "hasta": hasta.isoformat()})
+
+    # si ninguna regla es global, solo hace falta leer sus estaciones
+    todas = (any(len(g) for g in indice.globales.values())
+             or indice.ventanas["station_id"].isna().any())
+    filtro, extra = "", []
+    if not todas:
+        sids = sorted({int(x) for g in indice.por_estacion.values() for x in g["station_id"]}
+                      | {int(x) for x in indice.ventanas["station_id"]})
+        filtro, extra = "AND station_id IN (" + ",".join(["%s"] * len(sids)) + ")", sids
+
+    w_max = int(indice.ventanas["w"].max()) if len(indice.ventanas) else 0
+    cola = None
+    primero = True
+    columnas = ["station_id", "ts", *POLLUTANT_DB_COL.values()]
+    inicio = desde - pd.Timedelta(hours=w_max)  # la primera ventana también mira hacia atrás
+    # solo el primer tramo lee desde `inicio`; los siguientes desde `a` (la cola
+    # de las ventanas ya viene del tramo anterior)
+    a = desde
+    while a < hasta:
+        b = min(a + pd.Timedelta(days=dias), hasta)
+        cur.execute(TRAMO_SQL.format(filtro=filtro),
+                    [(inicio if primero else a).to_pydatetime(), b.to_pydatetime(), *extra])
+        df = pd.DataFrame([tuple(r.values()) if isinstance(r, dict) else r for r in cur.fetchall()],
+                          columns=columnas)
+        df = df.astype({c: "float64" for c in POLLUTANT_DB_COL.values()})
+        df["ts"] = pd.to_datetime(df["ts"])
+        if cola is not None:
+            df = pd.concat([cola, df], ignore_index=True)
+
+        eventos = indice.disparadas(df[df["ts"] >= a])
+        eventos += _ventanas_historicas(df, indice.ventanas, a)
+        if escribir:
+            for i in range(0, len(eventos), LOTE_EVENTOS):
+                cur.executemany(EVENTO_SQL.strip(), eventos[i:i + LOTE_EVENTOS])
+            cn.commit()
+
+        res["filas"] += int((df["ts"] >= a).sum())
+        res["eventos"] += len(eventos)
+        for rid, sid, *_ in eventos:
+            res["por_estacion"][sid] = res["por_estacion"].get(sid, 0) + 1
+            res["por_regla"][rid] = res["por_regla"].get(rid, 0) + 1
+        cola = df[df["ts"] >= b - pd.Timedelta(hours=w_max)] if w_max else None
+        primero = False
+        a = b
+    res["segundos"] = round(time.perf_counter() - t0, 3)
+    return res
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Evaluación histórica de reglas de alerta.")
+    ap.add_argument("--backfill", action="store_true", help="evalúa reglas sobre el histórico de measurements")
+    ap.add_argument("--regla", type=int, action="append", help="id de regla (repetible; default: habilitadas)")
+    ap.add_argument("--desde", help="YYYY-MM-DD[ HH:MM]")
+    ap.add_argument("--hasta", help="YYYY-MM-DD[ HH:MM] (exclusivo)")
+    ap.add_argument("--dias", type=int, default=31, help="días por tramo de lectura")
+    ap.add_argument("--sin-escribir", action="store_true", help="solo cuenta, no inserta alert_events")
+    args = ap.parse_args()
+    if not args.backfill:
+        ap.error("nada que hacer: usa --backfill")
+
+    import subir_mysql
+
+    cn = subir_mysql.connect()
+    cur = cn.cursor()
+    res = backfill(cn, cur, args.regla, args.desde, args.hasta, args.dias, not args.sin_escribir)
+    cur.close()
+    cn.close()
+    print(f"✅ {res['eventos']} eventos sobre {res['filas']} filas en {res.get('segundos', 0)}s")
+    for sid, n in sorted(res["por_estacion"].items()):
+        print(f"  estación {sid:>5}: {n}")
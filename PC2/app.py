@@ -1,9 +1,10 @@
 # PC2/app.py
 from __future__ import annotations
-import os, csv, io
+import os, csv, io, json, base64, zlib
 from datetime import datetime, date
 from zoneinfo import ZoneInfo
 from typing import List, Dict, Any, Optional, Tuple
+from functools import wraps
 
 from flask import Flask, jsonify, request, Response, abort
 from flask_cors import CORS
@@ -11,6 +12,10 @@ from dotenv import load_dotenv
 import mysql.connector
 from mysql.connector import pooling
 
+from response_cache import ResponseCache, read_version, etag_matches
+from alertas import POLLUTANT_DB_COL, VALID_OPERATORS, evaluar, backfill
+from ventanas import AGREGACIONES, horas_ventana
+
 # ---------------------------
 # Config & bootstrap
 # ---------------------------
@@ -27,10 +32,280 @@ DB_CFG = dict(
 
 API_KEY = os.getenv("API_KEY")  # si None, no se valida
 DEFAULT_TZ = os.getenv("DEFAULT_TZ", "America/Lima")
+EXPORT_LOTE = int(os.getenv("EXPORT_LOTE", "2000"))  # filas por fetchmany en /v1/export/csv
+
+# cache de respuestas (ver response_cache.py)
+CACHE_TTL = float(os.getenv("CACHE_TTL", "300"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "512"))
+CACHE_VERSION_CHECK = float(os.getenv("CACHE_VERSION_CHECK", "5"))  # s entre lecturas de data_version
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL")  # si se define, cache compartida entre workers
 
 POOL: pooling.MySQLConnectionPool | None = None
 
 
+# --- helpers de consulta (también los usa app_async.py) ---
+# Reciben los query params (`request.args` de Flask o `request.query_params` de
+# Starlette: ambos tienen get/getlist) y no tocan el framework; un parámetro
+# inválido levanta InvalidParam y cada app lo responde como 400.
+
+class InvalidParam(ValueError):
+    pass
+
+
+def parse_limit_offset(args) -> Tuple[int, int]:
+    def clamp(v, lo, hi, default):
+        try:
+            x = int(v)
+            return max(lo, min(hi, x))
+        except:
+            return default
+    limit = clamp(args.get("limit"), 1, 1000, 100)
+    offset = clamp(args.get("offset"), 0, 10**9, 0)
+    return limit, offset
+
+
+def parse_tz(args) -> ZoneInfo:
+    tz_name = args.get("tz") or DEFAULT_TZ
+    try:
+        return ZoneInfo(tz_name)
+    except Exception:
+        return ZoneInfo(DEFAULT_TZ)
+
+
+def parse_order(args) -> str:
+    order = (args.get("order") or "asc").lower()
+    return "ASC" if order != "desc" else "DESC"
+
+
+def parse_dt(x: Optional[str]) -> Optional[datetime]:
+    """ISO-8601 (con o sin tz) -> hora local DEFAULT_TZ sin tzinfo, como ts en DB; None si no parsea."""
+    if not x: return None
+    try:
+        dt = datetime.fromisoformat(x.replace("Z","+00:00"))
+        return dt.astimezone(ZoneInfo(DEFAULT_TZ)).replace(tzinfo=None)
+    except Exception:
+        return None
+
+
+def to_iso(dt: datetime | date, tz: ZoneInfo) -> str:
+    """
+    Suponemos que en DB ts está en hora local Lima (naive).
+    Lo tratamos como 'DEFAULT_TZ' y convertimos a la tz destino.
+    """
+    if isinstance(dt, date) and not isinstance(dt, datetime):
+        dt = datetime.combine(dt, datetime.min.time())
+    if dt.tzinfo is None:
+        src = ZoneInfo(DEFAULT_TZ)
+        dt = dt.replace(tzinfo=src)
+    return dt.astimezone(tz).isoformat()
+
+
+def row_to_measurement_dict(row: Dict[str, Any], tz: ZoneInfo) -> Dict[str, Any]:
+    # row keys from SQL must include: ts, pm2_5, pm10, so2, no2, o3, co
+    out = {
+        "ts": to_iso(row["ts"], tz),
+        "pm25": row.get("pm2_5"),
+        "pm10": row.get("pm10"),
+        "so2":  row.get("so2"),
+        "no2":  row.get("no2"),
+        "o3":   row.get("o3"),
+        "co":   row.get("co"),
+    }
+    return out
+
+
+def dict_rows(cursor) -> List[Dict[str, Any]]:
+    cols = [c[0] for c in cursor.description]
+    return [dict(zip(cols, r)) for r in cursor.fetchall()]
+
+
+def build_fields_clause(args) -> Tuple[str, List[str]]:
+    """
+    fields=pm25,pm10  -> solo selecciona esas columnas.
+    En DB las columnas son: pm2_5, pm10, so2, no2, o3, co
+    """
+    allowed = {
+        "pm25": "pm2_5",
+        "pm10": "pm10",
+        "so2": "so2",
+        "no2": "no2",
+        "o3": "o3",
+        "co": "co",
+    }
+    fields_param = args.get("fields")
+    if not fields_param:
+        return "m.ts, m.pm2_5, m.pm10, m.so2, m.no2, m.o3, m.co", list(allowed.keys())
+
+    req = [f.strip().lower() for f in fields_param.split(",") if f.strip()]
+    db_cols = []
+    for f in req:
+        if f in allowed:
+            db_cols.append(allowed[f])
+    if not db_cols:
+        return "m.ts", []
+    select = ", ".join(["m.ts"] + [f"m.{c}" for c in db_cols])
+    return select, req
+
+
+def parse_station_ids(args) -> List[int]:
+    try:
+        return [int(x) for x in args.getlist("station_id")]
+    except ValueError:
+        raise InvalidParam("station_id must be integer.")
+
+
+def parse_station_ids_required(args) -> List[int]:
+    ids = parse_station_ids(args)
+    if not ids:
+        raise InvalidParam("station_id is required (one or more).")
+    return ids
+
+
+def measurement_filters(args) -> Tuple[List[str], List[Any]]:
+    """station_id=1&station_id=2, station_name=foo,bar, start/end de /v1/measurements y /v1/export/csv."""
+    where: List[str] = []
+    params: List[Any] = []
+    station_ids = parse_station_ids(args)
+    if station_ids:
+        where.append("m.station_id IN (" + ",".join(["%s"] * len(station_ids)) + ")")
+        params += station_ids
+    station_name_csv = args.get("station_name")
+    if station_name_csv:
+        names = [x.strip() for x in station_name_csv.split(",") if x.strip()]
+        if names:
+            where.append("s.name IN (" + ",".join(["%s"] * len(names)) + ")")
+            params += names
+    p_start = parse_dt(args.get("start"))
+    p_end = parse_dt(args.get("end"))
+    if p_start:
+        where.append("m.ts >= %s"); params.append(p_start)
+    if p_end:
+        where.append("m.ts <= %s"); params.append(p_end)
+    return where, params
+
+
+# --- paginación por cursor (keyset) ---
+# El cursor es opaco para el cliente: base64 de {"ts", "id", "o"} con la
+# última fila entregada; la página siguiente arranca estrictamente después
+# de ella usando el índice, sin recorrer las filas previas como OFFSET.
+
+def encode_cursor(ts: datetime, key: Optional[int], order: str) -> str:
+    raw = json.dumps({"ts": ts.strftime("%Y-%m-%d %H:%M:%S"), "id": key, "o": order})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def parse_cursor(args, order: str) -> Optional[Dict[str, Any]]:
+    token = args.get("cursor")
+    if not token:
+        return None
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        datetime.strptime(data["ts"], "%Y-%m-%d %H:%M:%S")
+        if data.get("id") is not None:
+            data["id"] = int(data["id"])
+    except Exception:
+        raise InvalidParam("Invalid cursor")
+    if data.get("o") != order:
+        raise InvalidParam("Cursor was issued for a different order")
+    return data
+
+
+def keyset_clause(ts_col: str, id_col: Optional[str], order: str, cur: Dict[str, Any]) -> Tuple[str, List[Any]]:
+    """Condición 'después del cursor' para ORDER BY ts_col, id_col en la dirección `order`."""
+    op = ">" if order == "ASC" else "<"
+    if id_col is None:
+        return f"{ts_col} {op} %s", [cur["ts"]]
+    return (f"({ts_col} {op} %s OR ({ts_col} = %s AND {id_col} {op} %s))",
+            [cur["ts"], cur["ts"], cur["id"]])
+
+
+def page_and_cursor(rows: List[Dict[str, Any]], limit: int, order: str, id_key: Optional[str]):
+    """Se piden limit+1 filas: si sobra una, hay página siguiente."""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(last["ts"], last[id_key] if id_key else None, order)
+
+
+# --- agregados ---
+# Salen de los rollups measurements_hourly/daily/monthly (sql/05_agregados.sql),
+# que el loader mantiene por lote: se filtra por (station_id, bucket) sobre la
+# PK en vez de agrupar measurements en cada request.
+
+AGG_TABLES = {
+    "hourly": "measurements_hourly",
+    "daily": "measurements_daily",
+    "monthly": "measurements_monthly",
+}
+
+
+def aggregate_sql(granularity: str, agg: str = "avg") -> str:
+    """
+    granularity: 'hourly'|'daily'|'monthly'
+    agg: 'avg'|'max'|'min'  (cualquier otro valor -> avg)
+    """
+    agg = agg.lower()
+    cols = []
+    for c in ("pm2_5", "pm10", "so2", "no2", "o3", "co"):
+        if agg in ("max", "min"):
+            cols.append(f"r.{c}_{agg} AS {c}")
+        else:
+            cols.append(f"r.{c}_sum / NULLIF(r.{c}_n, 0) AS {c}")
+    return f"""
+        SELECT r.station_id,
+               r.bucket,
+               {", ".join(cols)}
+        FROM {AGG_TABLES[granularity]} r
+        WHERE r.station_id IN ({{station_ids}})
+          {{time_filter}}
+        ORDER BY r.bucket ASC
+    """
+
+
+def bucket_start(dt: datetime, granularity: str) -> datetime:
+    """Inicio del bucket que contiene dt: un start a media hora/día incluye ese bucket."""
+    if granularity == "hourly":
+        return dt.replace(minute=0, second=0, microsecond=0)
+    if granularity == "daily":
+        return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    return dt.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def aggregate_query(args, granularity: str) -> Tuple[str, List[Any]]:
+    """SQL y parámetros de /v1/aggregates/<granularity> a partir de los query params."""
+    station_ids = parse_station_ids_required(args)
+    p_start = parse_dt(args.get("start"))
+    p_end = parse_dt(args.get("end"))
+    time_filter = ""
+    params: List[Any] = []
+    if p_start:
+        time_filter += " AND r.bucket >= %s"; params.append(bucket_start(p_start, granularity))
+    if p_end:
+        time_filter += " AND r.bucket <= %s"; params.append(p_end)
+    sql = aggregate_sql(granularity, args.get("agg") or "avg").format(
+        station_ids=",".join(["%s"] * len(station_ids)),
+        time_filter=time_filter
+    )
+    return sql, station_ids + params
+
+
+def aggregate_items(rows: List[Dict[str, Any]], tz: ZoneInfo) -> List[Dict[str, Any]]:
+    items = []
+    for r in rows:
+        items.append({
+            "station_id": r["station_id"],
+            "ts": to_iso(r["bucket"], tz),
+            "pm25": r["pm2_5"],
+            "pm10": r["pm10"],
+            "so2":  r["so2"],
+            "no2":  r["no2"],
+            "o3":   r["o3"],
+            "co":   r["co"],
+        })
+    return items
+
+
 def create_app() -> Flask:
     app = Flask(__name__)
     app.config["JSON_SORT_KEYS"] = False
@@ -50,203 +325,65 @@ def create_app() -> Flask:
     def get_conn():
         return POOL.get_connection()
 
+    def read_data_version() -> Optional[int]:
+        with get_conn() as cn, cn.cursor() as cur:
+            return read_version(cur)
+
+    cache = ResponseCache(read_data_version, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL,
+                          check_interval=CACHE_VERSION_CHECK, redis_url=CACHE_REDIS_URL)
+
+    def cached_get(view):
+        """
+        Sirve la respuesta desde la cache (llave: ruta + query normalizada + data_version)
+        y responde 304 si If-None-Match coincide con la ETag. Solo se guardan los 200.
+        """
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = cache.key(request.path, request.args)
+            hit = cache.get(key)
+            status = "HIT"
+            if hit is None:
+                resp = app.make_response(view(*args, **kwargs))
+                if resp.status_code != 200 or resp.is_streamed:
+                    return resp
+                hit = cache.put(key, resp.get_data(), resp.mimetype)
+                status = "MISS"
+            if etag_matches(request.headers.get("If-None-Match"), hit.etag):
+                cache.counters["not_modified"] += 1
+                resp = Response(status=304)
+            else:
+                resp = Response(hit.body, mimetype=hit.mimetype)
+            resp.headers["ETag"] = hit.etag
+            resp.headers["Cache-Control"] = "no-cache"  # el cliente revalida con If-None-Match
+            resp.headers["X-Cache"] = status
+            return resp
+        return wrapper
+
     def require_api_key():
         if API_KEY:
             sent = request.headers.get("X-API-Key")
             if not sent or sent != API_KEY:
                 abort(401, description="Unauthorized")
 
-    def parse_limit_offset() -> Tuple[int, int]:
-        def clamp(v, lo, hi, default):
-            try:
-                x = int(v)
-                return max(lo, min(hi, x))
-            except:
-                return default
-        limit = clamp(request.args.get("limit"), 1, 1000, 100)
-        offset = clamp(request.args.get("offset"), 0, 10**9, 0)
-        return limit, offset
-
-    def parse_tz() -> ZoneInfo:
-        tz_name = request.args.get("tz") or DEFAULT_TZ
-        try:
-            return ZoneInfo(tz_name)
-        except Exception:
-            return ZoneInfo(DEFAULT_TZ)
-
-    def to_iso(dt: datetime | date, tz: ZoneInfo) -> str:
-        """
-        Suponemos que en DB ts está en hora local Lima (naive).
-        Lo tratamos como 'DEFAULT_TZ' y convertimos a la tz destino.
-        """
-        if isinstance(dt, date) and not isinstance(dt, datetime):
-            dt = datetime.combine(dt, datetime.min.time())
-        if dt.tzinfo is None:
-            src = ZoneInfo(DEFAULT_TZ)
-            dt = dt.replace(tzinfo=src)
-        return dt.astimezone(tz).isoformat()
-
-    def row_to_measurement_dict(row: Dict[str, Any], tz: ZoneInfo) -> Dict[str, Any]:
-        # row keys from SQL must include: ts, pm2_5, pm10, so2, no2, o3, co
-        out = {
-            "ts": to_iso(row["ts"], tz),
-            "pm25": row.get("pm2_5"),
-            "pm10": row.get("pm10"),
-            "so2":  row.get("so2"),
-            "no2":  row.get("no2"),
-            "o3":   row.get("o3"),
-            "co":   row.get("co"),
-        }
-        return out
-
-    def dict_rows(cursor) -> List[Dict[str, Any]]:
-        cols = [c[0] for c in cursor.description]
-        return [dict(zip(cols, r)) for r in cursor.fetchall()]
-
-    def build_fields_clause() -> Tuple[str, List[str]]:
-        """
-        fields=pm25,pm10  -> solo selecciona esas columnas.
-        En DB las columnas son: pm2_5, pm10, so2, no2, o3, co
-        """
-        allowed = {
-            "pm25": "pm2_5",
-            "pm10": "pm10",
-            "so2": "so2",
-            "no2": "no2",
-            "o3": "o3",
-            "co": "co",
-        }
-        fields_param = request.args.get("fields")
-        if not fields_param:
-            return "m.ts, m.pm2_5, m.pm10, m.so2, m.no2, m.o3, m.co", list(allowed.keys())
-
-        req = [f.strip().lower() for f in fields_param.split(",") if f.strip()]
-        db_cols = []
-        for f in req:
-            if f in allowed:
-                db_cols.append(allowed[f])
-        if not db_cols:
-            return "m.ts", []
-        select = ", ".join(["m.ts"] + [f"m.{c}" for c in db_cols])
-        return select, req
-
     # ==== ALERTAS: helpers y endpoints ====
 
-    POLLUTANT_DB_COL = {
-        "pm25": "pm2_5",
-        "pm10": "pm10",
-        "so2":  "so2",
-        "no2":  "no2",
-        "o3":   "o3",
-        "co":   "co",
-    }
-
-    VALID_OPERATORS = {"gt", "ge", "lt", "le"}
-
-    def _compare(val: float | None, op: str, thr: float) -> bool:
-        if val is None:
-            return False
-        if op == "gt": return val >  thr
-        if op == "ge": return val >= thr
-        if op == "lt": return val <  thr
-        if op == "le": return val <= thr
-        return False
-
-    def _fetch_latest_by_station(cur, station_ids: list[int] | None = None) -> dict[int, dict]:
-        """
-        Devuelve {station_id: { 'ts': datetime, 'pm2_5':..., 'pm10':... }} con la última medición por estación.
-        Si station_ids es None => todas las estaciones.
-        """
-        if station_ids:
-            cur.execute(
-                """
-                SELECT m.*
-                FROM measurements m
-                JOIN (
-                    SELECT station_id, MAX(ts) AS mx FROM measurements
-                    WHERE station_id IN (%s)
-                    GROUP BY station_id
-                ) t ON t.station_id=m.station_id AND t.mx=m.ts
-                """ % (",".join(["%s"] * len(station_ids))),
-                station_ids
-            )
-        else:
-            cur.execute(
-                """
-                SELECT m.*
-                FROM measurements m
-                JOIN (
-                    SELECT station_id, MAX(ts) AS mx FROM measurements GROUP BY station_id
-                ) t ON t.station_id=m.station_id AND t.mx=m.ts
-                """
-            )
-        rows = cur.fetchall()
-        by_station = { r["station_id"]: r for r in rows }
-        return by_station
-
     def evaluate_rules(rule_id: int | None = None) -> int:
         """
         Evalúa reglas habilitadas (o una en particular) contra la última medición por estación
         y genera alert_events (sin duplicar) cuando se cumple la condición.
-        Retorna cantidad de eventos insertados (nuevos).
+        Retorna cantidad de eventos insertados (nuevos). Ver alertas.evaluar().
         """
-        inserted = 0
         with POOL.get_connection() as cn, cn.cursor(dictionary=True) as cur:
-            # 1) Carga reglas habilitadas
-            if rule_id:
-                cur.execute("SELECT * FROM alert_rules WHERE enabled=1 AND id=%s", (rule_id,))
-            else:
-                cur.execute("SELECT * FROM alert_rules WHERE enabled=1")
-            rules = cur.fetchall()
-            if not rules:
-                return 0
-
-            # 2) Evalúa
-            for rule in rules:
-                pollutant = (rule["pollutant"] or "").lower()
-                op = (rule["operator"] or "").lower()
-                thr = float(rule["threshold"])
-                if pollutant not in POLLUTANT_DB_COL or op not in VALID_OPERATORS:
-                    continue
-                col = POLLUTANT_DB_COL[pollutant]
-
-                # estaciones objetivo
-                if rule["station_id"]:
-                    stations = [rule["station_id"]]
-                else:
-                    # todas
-                    cur.execute("SELECT id FROM stations")
-                    stations = [r["id"] for r in cur.fetchall()]
-
-                # Últimas mediciones por estación (solo las involucradas)
-                latest = _fetch_latest_by_station(cur, stations)
-
-                # 3) Inserta eventos cuando corresponda
-                for sid in stations:
-                    meas = latest.get(sid)
-                    if not meas:
-                        continue
-                    ts = meas["ts"]
-                    val = meas.get(col)
-
-                    if _compare(val, op, thr):
-                        # inserta con upsert para no duplicar
-                        cur.execute(
-                            """
-                            INSERT INTO alert_events
-                              (rule_id, station_id, ts, pollutant, value, operator, threshold)
-                            VALUES (%s,%s,%s,%s,%s,%s,%s)
-                            ON DUPLICATE KEY UPDATE
-                              value=VALUES(value), operator=VALUES(operator), threshold=VALUES(threshold)
-                            """,
-                            (rule["id"], sid, ts, pollutant, val, op, thr)
-                        )
-                        # rowcount será 1 si insertó, 2 si actualizó; contamos solo insert nuevos
-                        if cur.rowcount == 1:
-                            inserted += 1
+            inserted = evaluar(cur, rule_id)
             cn.commit()
         return inserted
 
+    def parse_window(window: Any) -> Optional[int]:
+        try:
+            return horas_ventana(window)
+        except ValueError:
+            abort(400, description="window must look like '8h' or '1d'")
+
     # ---------- Endpoints de reglas ----------
 
     @app.route("/v1/alerts/rules", methods=["GET"])
@@ -254,7 +391,8 @@ def create_app() -> Flask:
         with POOL.get_connection() as cn, cn.cursor(dictionary=True) as cur:
             cur.execute("""
                 SELECT r.id, r.name, r.station_id, s.name AS station_name,
-                       r.pollutant, r.operator, r.threshold, r.time_window, r.enabled, r.created_at
+                       r.pollutant, r.operator, r.threshold, r.time_window, r.aggregation,
+                       r.enabled, r.created_at
                 FROM alert_rules r
                 LEFT JOIN stations s ON s.id=r.station_id
                 ORDER BY r.created_at DESC
@@ -272,7 +410,8 @@ def create_app() -> Flask:
         pollutant = (data.get("pollutant") or "").lower()
         operator = (data.get("operator") or "").lower()
         threshold = data.get("threshold")
-        window = data.get("window")  # opcional
+        window = data.get("window")  # opcional: '8h', '24h', '1d' (sin ventana = lectura puntual)
+        aggregation = (data.get("aggregation") or "avg").lower()  # cómo se resume la ventana
         enabled = bool(data.get("enabled", True))
 
         # Validación
@@ -291,6 +430,9 @@ def create_app() -> Flask:
                 station_id = int(station_id)
             except:
                 abort(400, description="station_id must be integer or null")
+        window_hours = parse_window(window)
+        if aggregation not in AGREGACIONES:
+            abort(400, description="aggregation must be one of: " + ",".join(sorted(AGREGACIONES)))
 
         with POOL.get_connection() as cn, cn.cursor(dictionary=True) as cur:
             # si station_id viene, valida que exista
@@ -301,9 +443,11 @@ def create_app() -> Flask:
 
             cur.execute(
                 """INSERT INTO alert_rules
-                   (name, station_id, pollutant, operator, threshold, time_window, enabled)
-                   VALUES (%s,%s,%s,%s,%s,%s,%s)""",
-                (name, station_id, pollutant, operator, threshold, window, 1 if enabled else 0)
+                   (name, station_id, pollutant, operator, threshold, time_window, window_hours,
+                    aggregation, enabled)
+                   VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)""",
+                (name, station_id, pollutant, operator, threshold, window, window_hours,
+                 aggregation, 1 if enabled else 0)
             )
             rid = cur.lastrowid
             cn.commit()
@@ -343,6 +487,11 @@ def create_app() -> Flask:
             fields.append("threshold=%s"); params.append(th)
         if "window" in data:
             fields.append("time_window=%s"); params.append(data["window"])
+            fields.append("window_hours=%s"); params.append(parse_window(data["window"]))
+        if "aggregation" in data:
+            agg = (data["aggregation"] or "").lower()
+            if agg not in AGREGACIONES: abort(400, description="invalid aggregation")
+            fields.append("aggregation=%s"); params.append(agg)
         if "enabled" in data:
             en = 1 if bool(data["enabled"]) else 0
             fields.append("enabled=%s"); params.append(en)
@@ -355,6 +504,9 @@ def create_app() -> Flask:
             cur.execute(f"UPDATE alert_rules SET {', '.join(fields)} WHERE id=%s", tuple(params))
             if cur.rowcount == 0:
                 abort(404, description="rule not found")
+            if {"window", "pollutant", "station_id"} & data.keys():
+                # el buffer ya no corresponde: se vuelve a sembrar en la próxima evaluación
+                cur.execute("DELETE FROM alert_window_state WHERE rule_id=%s", (rule_id,))
             cn.commit()
         return jsonify({"updated_id": rule_id})
 
@@ -367,6 +519,61 @@ def create_app() -> Flask:
             cn.commit()
         return jsonify({"deleted_id": rule_id})
 
+    # ---------- Suscriptores de webhooks (ver notificaciones.py) ----------
+
+    @app.route("/v1/alerts/subscribers", methods=["GET"])
+    def list_subscribers():
+        with POOL.get_connection() as cn, cn.cursor(dictionary=True) as cur:
+            cur.execute("""
+                SELECT s.id, s.name, s.url, s.rule_id, s.station_id, s.enabled, s.created_at,
+                       SUM(o.status='pending') AS pending, SUM(o.status='failed') AS failed
+                FROM alert_subscribers s
+                LEFT JOIN alert_outbox o ON o.subscriber_id = s.id
+                GROUP BY s.id
+                ORDER BY s.id
+            """)
+            items = cur.fetchall()
+        for it in items:
+            it["pending"] = int(it["pending"] or 0)
+            it["failed"] = int(it["failed"] or 0)
+        return jsonify({"items": items})
+
+    @app.route("/v1/alerts/subscribers", methods=["POST"])
+    def create_subscriber():
+        data = request.get_json(force=True, silent=True) or {}
+        name = (data.get("name") or "").strip()
+        url = (data.get("url") or "").strip()
+        if not name:
+            abort(400, description="name is required")
+        if not url.startswith(("http://", "https://")):
+            abort(400, description="url must be http(s)")
+        ids = {}
+        for k in ("rule_id", "station_id"):
+            v = data.get(k)
+            if v is not None:
+                try: v = int(v)
+                except: abort(400, description=f"{k} must be integer or null")
+            ids[k] = v
+        with POOL.get_connection() as cn, cn.cursor() as cur:
+            cur.execute(
+                """INSERT INTO alert_subscribers (name, url, secret, rule_id, station_id, enabled)
+                   VALUES (%s,%s,%s,%s,%s,%s)""",
+                (name, url, data.get("secret"), ids["rule_id"], ids["station_id"],
+                 1 if data.get("enabled", True) else 0)
+            )
+            sid = cur.lastrowid
+            cn.commit()
+        return jsonify({"created_id": sid}), 201
+
+    @app.route("/v1/alerts/subscribers/<int:subscriber_id>", methods=["DELETE"])
+    def delete_subscriber(subscriber_id: int):
+        with POOL.get_connection() as cn, cn.cursor() as cur:
+            cur.execute("DELETE FROM alert_subscribers WHERE id=%s", (subscriber_id,))
+            if cur.rowcount == 0:
+                abort(404, description="subscriber not found")
+            cn.commit()
+        return jsonify({"deleted_id": subscriber_id})
+
     # ---------- Evaluación manual (genera eventos) ----------
 
     @app.route("/v1/alerts/evaluate", methods=["POST"])
@@ -383,11 +590,54 @@ def create_app() -> Flask:
         created = evaluate_rules(rule_id=rid)
         return jsonify({"events_created": created})
 
+    @app.route("/v1/alerts/backfill", methods=["POST"])
+    def backfill_alerts_endpoint():
+        """
+        Evalúa reglas sobre el histórico: body {"rule_ids": [..], "start": ISO, "end": ISO,
+        "write": true}. Sin rule_ids usa todas las habilitadas; write=false solo cuenta.
+        Retorna eventos por estación y por regla (ver alertas.backfill).
+        """
+        data = request.get_json(force=True, silent=True) or {}
+        ids = data.get("rule_ids")
+        if ids is None and data.get("rule_id") is not None:
+            ids = [data["rule_id"]]
+        try:
+            ids = [int(x) for x in ids] if ids else None
+        except (TypeError, ValueError):
+            abort(400, description="rule_ids must be a list of integers")
+
+        def fecha(campo: str) -> Optional[str]:
+            x = data.get(campo)
+            if not x: return None
+            dt = parse_dt(x) if isinstance(x, str) else None
+            if dt is None:
+                abort(400, description="start/end must be ISO-8601")
+            return dt.strftime("%Y-%m-%d %H:%M:%S")
+
+        write = data.get("write", True)
+        if not isinstance(write, bool):
+            abort(400, description="write must be a boolean")
+        with POOL.get_connection() as cn, cn.cursor() as cur:
+            res = backfill(cn, cur, ids, fecha("start"), fecha("end"), escribir=write)
+        if ids and not res["rules"]:
+            abort(404, description="rule not found")
+        return jsonify({
+            "rules": res["rules"],
+            "start": res.get("desde"),
+            "end": res.get("hasta"),
+            "rows_scanned": res["filas"],
+            "events": res["eventos"],
+            "written": write,
+            "by_station": [{"station_id": k, "events": v} for k, v in sorted(res["por_estacion"].items())],
+            "by_rule": [{"rule_id": k, "events": v} for k, v in sorted(res["por_regla"].items())],
+            "seconds": res.get("segundos"),
+        })
+
     # ---------- Listado de eventos ----------
 
     @app.route("/v1/alerts/events", methods=["GET"])
     def list_events():
-        limit, offset =  parse_limit_offset()
+        limit, offset = parse_limit_offset(request.args)
         rid = request.args.get("rule_id")
         sid = request.args.get("station_id")
         start = request.args.get("start")
@@ -406,20 +656,17 @@ def create_app() -> Flask:
             except: abort(400, description="station_id must be integer")
             where.append("e.station_id=%s"); params.append(sid)
 
-        # parse fechas (ISO) a local naive
-        def parse_dt(x):
-            if not x: return None
-            try:
-                dt = datetime.fromisoformat(x.replace("Z","+00:00"))
-                local = dt.astimezone(ZoneInfo(DEFAULT_TZ)).replace(tzinfo=None)
-                return local.strftime("%Y-%m-%d %H:%M:%S")
-            except:
-                return None
-
         p_start = parse_dt(start); p_end = parse_dt(end)
         if p_start: where.append("e.ts >= %s"); params.append(p_start)
         if p_end:   where.append("e.ts <= %s"); params.append(p_end)
 
+        # cursor=... (keyset sobre ts, id); si viene, offset se ignora
+        cursor = parse_cursor(request.args, "desc")
+        if cursor:
+            cond, cparams = keyset_clause("e.ts", "e.id", "DESC", cursor)
+            where.append(cond); params += cparams
+            offset = 0
+
         where_sql = "WHERE " + " AND ".join(where) if where else ""
         sql = f"""
           SELECT e.id, e.rule_id, r.name AS rule_name, e.station_id, s.name AS station_name,
@@ -428,15 +675,16 @@ def create_app() -> Flask:
           JOIN alert_rules r ON r.id=e.rule_id
           JOIN stations s ON s.id=e.station_id
           {where_sql}
-          ORDER BY e.ts DESC
+          ORDER BY e.ts DESC, e.id DESC
           LIMIT %s OFFSET %s
         """
 
-        params += [limit, offset]
+        params += [limit + 1, offset]
         with POOL.get_connection() as cn, cn.cursor(dictionary=True) as cur:
             cur.execute(sql, tuple(params))
             rows = cur.fetchall()
-        return jsonify({"items": rows, "limit": limit, "offset": offset})
+        rows, next_cursor = page_and_cursor(rows, limit, "desc", "id")
+        return jsonify({"items": rows, "limit": limit, "offset": offset, "next_cursor": next_cursor})
 
     # ---------------------------
     # Routes
@@ -444,7 +692,7 @@ def create_app() -> Flask:
 
     @app.route("/v1/health", methods=["GET"])
     def health():
-        tz = parse_tz()
+        tz = parse_tz(request.args)
         try:
             with get_conn() as cn, cn.cursor() as cur:
                 cur.execute("SELECT 1")
@@ -453,13 +701,18 @@ def create_app() -> Flask:
         except Exception as e:
             return jsonify({"status": "degraded", "db": f"error: {e.__class__.__name__}"}), 500
 
+    @app.route("/v1/cache/stats", methods=["GET"])
+    def cache_stats():
+        return jsonify(cache.stats())
+
     # ---------- Stations ----------
 
     @app.route("/v1/stations", methods=["GET"])
+    @cached_get
     def list_stations():
         # require_api_key()  # descomenta si quieres proteger
         q = request.args.get("q", "").strip()
-        limit, offset = parse_limit_offset()
+        limit, offset = parse_limit_offset(request.args)
         where = []
         params: List[Any] = []
         if q:
@@ -481,6 +734,7 @@ def create_app() -> Flask:
         return jsonify({"items": items, "total": total, "limit": limit, "offset": offset})
 
     @app.route("/v1/stations/<int:station_id>", methods=["GET"])
+    @cached_get
     def get_station(station_id: int):
         with get_conn() as cn, cn.cursor(dictionary=True) as cur:
             cur.execute("SELECT id, name FROM stations WHERE id=%s", (station_id,))
@@ -492,8 +746,9 @@ def create_app() -> Flask:
     # ---------- Latest per station ----------
 
     @app.route("/v1/stations/<int:station_id>/latest", methods=["GET"])
+    @cached_get
     def station_latest(station_id: int):
-        tz = parse_tz()
+        tz = parse_tz(request.args)
         with get_conn() as cn, cn.cursor(dictionary=True) as cur:
             cur.execute("SELECT id, name FROM stations WHERE id=%s", (station_id,))
             st = cur.fetchone()
@@ -502,10 +757,8 @@ def create_app() -> Flask:
             cur.execute(
                 """
                 SELECT m.ts, m.pm2_5, m.pm10, m.so2, m.no2, m.o3, m.co
-                FROM measurements m
+                FROM station_latest m
                 WHERE m.station_id=%s
-                ORDER BY m.ts DESC
-                LIMIT 1
                 """,
                 (station_id,),
             )
@@ -516,22 +769,18 @@ def create_app() -> Flask:
             return jsonify({"station_id": station_id, "station_name": st["name"], "item": item})
 
     @app.route("/v1/measurements/latest", methods=["GET"])
+    @cached_get
     def latest_all():
-        tz = parse_tz()
-        limit, offset = parse_limit_offset()
+        tz = parse_tz(request.args)
+        limit, offset = parse_limit_offset(request.args)
         with get_conn() as cn, cn.cursor(dictionary=True) as cur:
-            # Última por estación usando subconsulta
+            # Última por estación desde la tabla materializada
             cur.execute(
                 """
                 SELECT s.id AS station_id, s.name AS station_name,
                        m.ts, m.pm2_5, m.pm10, m.so2, m.no2, m.o3, m.co
                 FROM stations s
-                JOIN (
-                    SELECT station_id, MAX(ts) AS max_ts
-                    FROM measurements
-                    GROUP BY station_id
-                ) t ON t.station_id = s.id
-                JOIN measurements m ON m.station_id = t.station_id AND m.ts = t.max_ts
+                JOIN station_latest m ON m.station_id = s.id
                 ORDER BY s.name ASC
                 LIMIT %s OFFSET %s
                 """,
@@ -551,30 +800,17 @@ def create_app() -> Flask:
 
     @app.route("/v1/stations/<int:station_id>/measurements", methods=["GET"])
     def station_measurements(station_id: int):
-        tz = parse_tz()
-        limit, offset = parse_limit_offset()
+        tz = parse_tz(request.args)
+        limit, offset = parse_limit_offset(request.args)
         start = request.args.get("start")
         end = request.args.get("end")
-        order = (request.args.get("order") or "asc").lower()
-        order = "ASC" if order != "desc" else "DESC"
+        order = parse_order(request.args)
 
-        select_clause, _ = build_fields_clause()
+        select_clause, _ = build_fields_clause(request.args)
 
         where = ["m.station_id=%s"]
         params: List[Any] = [station_id]
 
-        # parse start/end as ISO
-        def parse_dt(x: Optional[str]) -> Optional[str]:
-            if not x: return None
-            try:
-                # Acepta ISO con tz; lo convertimos a DEFAULT_TZ sin tzinfo
-                dt = datetime.fromisoformat(x.replace("Z","+00:00"))
-                # normaliza a DEFAULT_TZ naive
-                local = dt.astimezone(ZoneInfo(DEFAULT_TZ)).replace(tzinfo=None)
-                return local.strftime("%Y-%m-%d %H:%M:%S")
-            except Exception:
-                return None
-
         p_start = parse_dt(start)
         p_end = parse_dt(end)
         if p_start:
@@ -584,6 +820,14 @@ def create_app() -> Flask:
             where.append("m.ts <= %s")
             params.append(p_end)
 
+        # cursor=... (keyset sobre ts; único por estación), usa uq_station_ts
+        cursor = parse_cursor(request.args, order.lower())
+        if cursor:
+            cond, cparams = keyset_clause("m.ts", None, order, cursor)
+            where.append(cond)
+            params += cparams
+            offset = 0
+
         where_sql = "WHERE " + " AND ".join(where)
         sql = f"""
             SELECT {select_clause}
@@ -592,7 +836,7 @@ def create_app() -> Flask:
             ORDER BY m.ts {order}
             LIMIT %s OFFSET %s
         """
-        params += [limit, offset]
+        params += [limit + 1, offset]
 
         with get_conn() as cn, cn.cursor(dictionary=True) as cur:
             cur.execute("SELECT id, name FROM stations WHERE id=%s", (station_id,))
@@ -602,49 +846,27 @@ def create_app() -> Flask:
             cur.execute(sql, tuple(params))
             rows = cur.fetchall()
 
+        rows, next_cursor = page_and_cursor(rows, limit, order.lower(), None)
         items = [row_to_measurement_dict(r, tz) for r in rows]
-        return jsonify({"station": {"id": st["id"], "name": st["name"]}, "items": items, "limit": limit, "offset": offset})
+        return jsonify({"station": {"id": st["id"], "name": st["name"]}, "items": items,
+                        "limit": limit, "offset": offset, "next_cursor": next_cursor})
 
     @app.route("/v1/measurements", methods=["GET"])
     def measurements_multi():
-        tz = parse_tz()
-        limit, offset = parse_limit_offset()
-        order = (request.args.get("order") or "asc").lower()
-        order = "ASC" if order != "desc" else "DESC"
-        select_clause, _ = build_fields_clause()
+        tz = parse_tz(request.args)
+        limit, offset = parse_limit_offset(request.args)
+        order = parse_order(request.args)
+        select_clause, _ = build_fields_clause(request.args)
 
-        where = []
-        params: List[Any] = []
+        # station_id=1&station_id=2..., station_name=foo,bar, start/end
+        where, params = measurement_filters(request.args)
 
-        # station_id=1&station_id=2...
-        station_ids = request.args.getlist("station_id")
-        if station_ids:
-            where.append("m.station_id IN (" + ",".join(["%s"] * len(station_ids)) + ")")
-            params += [int(x) for x in station_ids]
-
-        # station_name=foo,bar
-        station_name_csv = request.args.get("station_name")
-        if station_name_csv:
-            names = [x.strip() for x in station_name_csv.split(",") if x.strip()]
-            if names:
-                where.append("s.name IN (" + ",".join(["%s"] * len(names)) + ")")
-                params += names
-
-        # start/end
-        def parse_dt(x: Optional[str]) -> Optional[str]:
-            if not x: return None
-            try:
-                dt = datetime.fromisoformat(x.replace("Z","+00:00"))
-                local = dt.astimezone(ZoneInfo(DEFAULT_TZ)).replace(tzinfo=None)
-                return local.strftime("%Y-%m-%d %H:%M:%S")
-            except Exception:
-                return None
-        p_start = parse_dt(request.args.get("start"))
-        p_end = parse_dt(request.args.get("end"))
-        if p_start:
-            where.append("m.ts >= %s"); params.append(p_start)
-        if p_end:
-            where.append("m.ts <= %s"); params.append(p_end)
+        # cursor=... (keyset sobre ts, station_id), usa idx_ts_station
+        cursor = parse_cursor(request.args, order.lower())
+        if cursor:
+            cond, cparams = keyset_clause("m.ts", "m.station_id", order, cursor)
+            where.append(cond); params += cparams
+            offset = 0
 
         where_sql = ("WHERE " + " AND ".join(where)) if where else ""
         sql = f"""
@@ -652,14 +874,15 @@ def create_app() -> Flask:
             FROM measurements m
             JOIN stations s ON s.id = m.station_id
             {where_sql}
-            ORDER BY m.ts {order}
+            ORDER BY m.ts {order}, m.station_id {order}
             LIMIT %s OFFSET %s
         """
-        params += [limit, offset]
+        params += [limit + 1, offset]
 
         with get_conn() as cn, cn.cursor(dictionary=True) as cur:
             cur.execute(sql, tuple(params))
             rows = cur.fetchall()
+        rows, next_cursor = page_and_cursor(rows, limit, order.lower(), "station_id")
 
         items = []
         for r in rows:
@@ -669,156 +892,32 @@ def create_app() -> Flask:
                 **row_to_measurement_dict(r, tz)
             }
             items.append(itm)
-        return jsonify({"items": items, "limit": limit, "offset": offset})
+        return jsonify({"items": items, "limit": limit, "offset": offset, "next_cursor": next_cursor})
 
-    # ---------- Aggregates ----------
+    # ---------- Aggregates (rollups, ver aggregate_sql) ----------
 
-    def aggregate_sql(granularity: str, agg: str = "avg") -> str:
-        """
-        granularity: 'hourly'|'daily'
-        agg: 'avg'|'median'|'max'|'min'  (implementamos avg y max/min; median se emula si quisieras)
-        """
-        bucket = "DATE_FORMAT(m.ts, '%Y-%m-%d %H:00:00')" if granularity == "hourly" else "DATE(m.ts)"
-        fn = {"avg":"AVG","max":"MAX","min":"MIN"}.get(agg.lower(), "AVG")
-        return f"""
-            SELECT m.station_id,
-                   {bucket} AS bucket,
-                   {fn}(m.pm2_5) AS pm2_5,
-                   {fn}(m.pm10)  AS pm10,
-                   {fn}(m.so2)   AS so2,
-                   {fn}(m.no2)   AS no2,
-                   {fn}(m.o3)    AS o3,
-                   {fn}(m.co)    AS co
-            FROM measurements m
-            WHERE m.station_id IN ({{station_ids}})
-              {{time_filter}}
-            GROUP BY m.station_id, bucket
-            ORDER BY bucket ASC
-        """
-
-    def parse_station_ids_required() -> List[int]:
-        ids = request.args.getlist("station_id")
-        if not ids:
-            abort(400, description="station_id is required (one or more).")
-        try:
-            return [int(x) for x in ids]
-        except:
-            abort(400, description="station_id must be integer.")
-
-    @app.route("/v1/aggregates/hourly", methods=["GET"])
-    def agg_hourly():
-        tz = parse_tz()
-        station_ids = parse_station_ids_required()
-        start = request.args.get("start")
-        end = request.args.get("end")
-        agg = request.args.get("agg", "avg")
-
-        def parse_dt(x: Optional[str]) -> Optional[str]:
-            if not x: return None
-            try:
-                dt = datetime.fromisoformat(x.replace("Z","+00:00"))
-                local = dt.astimezone(ZoneInfo(DEFAULT_TZ)).replace(tzinfo=None)
-                return local.strftime("%Y-%m-%d %H:%M:%S")
-            except Exception:
-                return None
-
-        p_start = parse_dt(start)
-        p_end = parse_dt(end)
-        time_filter = ""
-        params: List[Any] = []
-        if p_start:
-            time_filter += " AND m.ts >= %s"; params.append(p_start)
-        if p_end:
-            time_filter += " AND m.ts <= %s"; params.append(p_end)
-
-        sql_template = aggregate_sql("hourly", agg)
-        sql = sql_template.format(
-            station_ids=",".join(["%s"] * len(station_ids)),
-            time_filter=time_filter
-        )
+    def aggregate_response(granularity: str):
+        tz = parse_tz(request.args)
+        sql, params = aggregate_query(request.args, granularity)
         with get_conn() as cn, cn.cursor(dictionary=True) as cur:
-            cur.execute(sql, tuple(station_ids + params))
+            cur.execute(sql, tuple(params))
             rows = cur.fetchall()
+        return jsonify({"granularity": granularity, "items": aggregate_items(rows, tz)})
 
-        items = []
-        for r in rows:
-            bucket = r["bucket"]
-            # bucket viene como str/datetime depend. Convertimos:
-            if isinstance(bucket, str):
-                try:
-                    bucket_dt = datetime.strptime(bucket, "%Y-%m-%d %H:%M:%S")
-                except:
-                    bucket_dt = datetime.strptime(bucket, "%Y-%m-%d")
-            else:
-                bucket_dt = bucket
-            items.append({
-                "station_id": r["station_id"],
-                "ts": to_iso(bucket_dt, tz),
-                "pm25": r["pm2_5"],
-                "pm10": r["pm10"],
-                "so2":  r["so2"],
-                "no2":  r["no2"],
-                "o3":   r["o3"],
-                "co":   r["co"],
-            })
-        return jsonify({"granularity": "hourly", "items": items})
+    @app.route("/v1/aggregates/hourly", methods=["GET"])
+    @cached_get
+    def agg_hourly():
+        return aggregate_response("hourly")
 
     @app.route("/v1/aggregates/daily", methods=["GET"])
+    @cached_get
     def agg_daily():
-        tz = parse_tz()
-        station_ids = parse_station_ids_required()
-        start = request.args.get("start")
-        end = request.args.get("end")
-        agg = request.args.get("agg", "avg")
-
-        def parse_dt(x: Optional[str]) -> Optional[str]:
-            if not x: return None
-            try:
-                dt = datetime.fromisoformat(x.replace("Z","+00:00"))
-                local = dt.astimezone(ZoneInfo(DEFAULT_TZ)).replace(tzinfo=None)
-                return local.strftime("%Y-%m-%d %H:%M:%S")
-            except Exception:
-                return None
+        return aggregate_response("daily")
 
-        p_start = parse_dt(start)
-        p_end = parse_dt(end)
-        time_filter = ""
-        params: List[Any] = []
-        if p_start:
-            time_filter += " AND m.ts >= %s"; params.append(p_start)
-        if p_end:
-            time_filter += " AND m.ts <= %s"; params.append(p_end)
-
-        sql_template = aggregate_sql("daily", agg)
-        sql = sql_template.format(
-            station_ids=",".join(["%s"] * len(station_ids)),
-            time_filter=time_filter
-        )
-        with get_conn() as cn, cn.cursor(dictionary=True) as cur:
-            cur.execute(sql, tuple(station_ids + params))
-            rows = cur.fetchall()
-
-        items = []
-        for r in rows:
-            bucket = r["bucket"]
-            if isinstance(bucket, str):
-                try:
-                    bucket_dt = datetime.strptime(bucket, "%Y-%m-%d %H:%M:%S")
-                except:
-                    bucket_dt = datetime.strptime(bucket, "%Y-%m-%d")
-            else:
-                bucket_dt = bucket
-            items.append({
-                "station_id": r["station_id"],
-                "ts": to_iso(bucket_dt, tz),
-                "pm25": r["pm2_5"],
-                "pm10": r["pm10"],
-                "so2":  r["so2"],
-                "no2":  r["no2"],
-                "o3":   r["o3"],
-                "co":   r["co"],
-            })
-        return jsonify({"granularity": "daily", "items": items})
+    @app.route("/v1/aggregates/monthly", methods=["GET"])
+    @cached_get
+    def agg_monthly():
+        return aggregate_response("monthly")
 
     # ---------- Export CSV ----------
 
@@ -826,41 +925,12 @@ def create_app() -> Flask:
     def export_csv():
         # Opcionalmente protegemos con API key
         # require_api_key()
-        tz = parse_tz()
+        tz = parse_tz(request.args)
         # Reusamos /v1/measurements multi para construir CSV
-        select_clause, _ = build_fields_clause()
-        order = (request.args.get("order") or "asc").lower()
-        order = "ASC" if order != "desc" else "DESC"
+        select_clause, _ = build_fields_clause(request.args)
+        order = parse_order(request.args)
 
-        where = []
-        params: List[Any] = []
-
-        station_ids = request.args.getlist("station_id")
-        if station_ids:
-            where.append("m.station_id IN (" + ",".join(["%s"] * len(station_ids)) + ")")
-            params += [int(x) for x in station_ids]
-
-        station_name_csv = request.args.get("station_name")
-        if station_name_csv:
-            names = [x.strip() for x in station_name_csv.split(",") if x.strip()]
-            if names:
-                where.append("s.name IN (" + ",".join(["%s"] * len(names)) + ")")
-                params += names
-
-        def parse_dt(x: Optional[str]) -> Optional[str]:
-            if not x: return None
-            try:
-                dt = datetime.fromisoformat(x.replace("Z","+00:00"))
-                local = dt.astimezone(ZoneInfo(DEFAULT_TZ)).replace(tzinfo=None)
-                return local.strftime("%Y-%m-%d %H:%M:%S")
-            except Exception:
-                return None
-        p_start = parse_dt(request.args.get("start"))
-        p_end = parse_dt(request.args.get("end"))
-        if p_start:
-            where.append("m.ts >= %s"); params.append(p_start)
-        if p_end:
-            where.append("m.ts <= %s"); params.append(p_end)
+        where, params = measurement_filters(request.args)
 
         where_sql = ("WHERE " + " AND ".join(where)) if where else ""
         sql = f"""
@@ -871,29 +941,77 @@ def create_app() -> Flask:
             ORDER BY m.ts {order}
         """
 
-        with get_conn() as cn, cn.cursor(dictionary=True) as cur:
-            cur.execute(sql, tuple(params))
-            rows = cur.fetchall()
-
-        # construir CSV en memoria
-        output = io.StringIO()
-        writer = csv.writer(output)
-        headers = ["station_name", "ts", "pm25", "pm10", "so2", "no2", "o3", "co"]
-        writer.writerow(headers)
-        for r in rows:
-            md = row_to_measurement_dict(r, tz)
-            writer.writerow([
-                r["station_name"],
-                md["ts"], md["pm25"], md["pm10"], md["so2"], md["no2"], md["o3"], md["co"]
-            ])
-        output.seek(0)
-        return Response(output.getvalue(), mimetype="text/csv; charset=utf-8")
+        # gzip=1 -> Content-Encoding: gzip (comprimido en streaming)
+        comprimir = (request.args.get("gzip") or "").lower() in ("1", "true", "yes")
+
+        def generar():
+            # Cursor sin buffer: MySQL va enviando filas a medida que se leen con
+            # fetchmany, así que la memoria no depende del tamaño del export y la
+            # cabecera sale antes de que termine la consulta.
+            gz = zlib.compressobj(6, zlib.DEFLATED, 31) if comprimir else None
+
+            def salida(texto: str) -> bytes:
+                data = texto.encode("utf-8")
+                if gz is None:
+                    return data
+                return gz.compress(data) + gz.flush(zlib.Z_SYNC_FLUSH)
+
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            writer.writerow(["station_name", "ts", "pm25", "pm10", "so2", "no2", "o3", "co"])
+            yield salida(buf.getvalue())
+
+            cn = get_conn()
+            cur = cn.cursor(dictionary=True, buffered=False)
+            terminado = False
+            try:
+                cur.execute(sql, tuple(params))
+                while True:
+                    rows = cur.fetchmany(EXPORT_LOTE)
+                    if not rows:
+                        break
+                    buf.seek(0); buf.truncate()
+                    for r in rows:
+                        md = row_to_measurement_dict(r, tz)
+                        writer.writerow([
+                            r["station_name"],
+                            md["ts"], md["pm25"], md["pm10"], md["so2"], md["no2"], md["o3"], md["co"]
+                        ])
+                    yield salida(buf.getvalue())
+                terminado = True
+                if gz is not None:
+                    yield gz.flush()
+            finally:
+                if terminado:
+                    try:
+                        cur.close()
+                    finally:
+                        cn.close()
+                else:
+                    # el cliente cortó a mitad: drenar el resultado sería leer el
+                    # resto del export para nada, así que se cierra el socket
+                    # (sin cur.close(), que también drena). La conexión vuelve al
+                    # pool desconectada y get_connection la reconecta al sacarla.
+                    cn.shutdown()
+                    try:
+                        cn.close()
+                    except Exception:
+                        pass  # reset_session sobre el socket cerrado
+
+        headers = {"Cache-Control": "no-store", "X-Accel-Buffering": "no"}
+        if comprimir:
+            headers.update({"Content-Encoding": "gzip", "Vary": "Accept-Encoding"})
+        return Response(generar(), mimetype="text/csv; charset=utf-8", headers=headers)
 
     # ---------- Error handlers ----------
     @app.errorhandler(400)
     def bad_request(e):
         return jsonify({"error": "BadRequest", "message": str(e.description)}), 400
 
+    @app.errorhandler(InvalidParam)
+    def invalid_param(e):
+        return jsonify({"error": "BadRequest", "message": str(e)}), 400
+
     @app.errorhandler(401)
     def unauthorized(e):
         return jsonify({"error": "Unauthorized", "message": str(e.description)}), 401
@@ -0,0 +1,428 @@
+# PC2/app_async.py
+"""
+Modo ASGI de la API: las mismas rutas /v1/* y los mismos JSON que app.py, pero
+las de lectura (estaciones, últimas, rangos, agregados, export) corren en
+Starlette sobre un pool async de aiomysql. Una ráfaga de dashboards ya no hace
+fila detrás de las 5 conexiones del pool de Flask, y un agregado lento no
+bloquea un worker: mientras espera a MySQL el event loop atiende a los demás.
+
+El parseo de parámetros, cursores, filtros y el armado de filas son los helpers
+de módulo de app.py, y el JSON se serializa con el mismo provider de Flask: los
+cuerpos (y por lo tanto las ETags) son idénticos byte a byte en ambos modos.
+Las rutas de alertas y suscriptores (escrituras, poco tráfico) se sirven con la
+app Flask montada como WSGI.
+
+Config (env, además de la de app.py):
+    ASYNC_POOL_MIN / ASYNC_POOL_MAX   tamaño del pool (1 / 20)
+    ASYNC_CONNECT_TIMEOUT            s para abrir una conexión (5)
+    ASYNC_ACQUIRE_TIMEOUT            s esperando conexión libre antes de 503 (5)
+    ASYNC_QUERY_TIMEOUT              s por consulta antes de 504; también MAX_EXECUTION_TIME en MySQL (30)
+    ASYNC_POOL_RECYCLE               s de vida de una conexión (3600)
+
+Uso:
+    uvicorn app_async:app --host 0.0.0.0 --port 8001 [--workers 2]
+"""
+from __future__ import annotations
+import asyncio
+import csv
+import io
+import os
+import zlib
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from zoneinfo import ZoneInfo
+
+import aiomysql
+import pymysql
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:  # la de Starlette sirve igual, solo está deprecada
+    from starlette.middleware.wsgi import WSGIMiddleware
+
+import app as flask_api  # config compartida + rutas de alertas vía WSGI
+from app import (
+    InvalidParam, aggregate_items, aggregate_query, build_fields_clause, keyset_clause,
+    measurement_filters, page_and_cursor, parse_cursor, parse_dt, parse_limit_offset,
+    parse_order, parse_tz, row_to_measurement_dict,
+)
+from response_cache import ResponseCache, etag_matches
+
+DB_CFG = flask_api.DB_CFG
+DEFAULT_TZ = flask_api.DEFAULT_TZ
+EXPORT_LOTE = flask_api.EXPORT_LOTE
+
+POOL_MIN = int(os.getenv("ASYNC_POOL_MIN", "1"))
+POOL_MAX = int(os.getenv("ASYNC_POOL_MAX", "20"))
+CONNECT_TIMEOUT = float(os.getenv("ASYNC_CONNECT_TIMEOUT", "5"))
+ACQUIRE_TIMEOUT = float(os.getenv("ASYNC_ACQUIRE_TIMEOUT", "5"))
+QUERY_TIMEOUT = float(os.getenv("ASYNC_QUERY_TIMEOUT", "30"))
+POOL_RECYCLE = int(os.getenv("ASYNC_POOL_RECYCLE", "3600"))
+
+ER_QUERY_TIMEOUT = 3024  # MAX_EXECUTION_TIME excedido
+
+POOL: aiomysql.Pool | None = None
+
+# la versión de datos la refresca una tarea de fondo; la cache solo la lee
+_version: Dict[str, Optional[int]] = {"v": None}
+cache = ResponseCache(lambda: _version["v"], max_entries=flask_api.CACHE_MAX_ENTRIES,
+                      ttl=flask_api.CACHE_TTL, check_interval=0, redis_url=flask_api.CACHE_REDIS_URL)
+
+
+def json_response(content: Any, status_code: int = 200) -> Response:
+    """Mismo JSON que jsonify() de app.py (claves ordenadas, ASCII, compacto, \\n final)."""
+    body = flask_api.app.json.dumps(content, separators=(",", ":")) + "\n"
+    return Response(body, status_code=status_code, media_type="application/json")
+
+
+# ---------------------------
+# DB
+# ---------------------------
+
+async def create_pool() -> aiomysql.Pool:
+    return await aiomysql.create_pool(
+        host=DB_CFG["host"], user=DB_CFG["user"], password=DB_CFG["password"], db=DB_CFG["database"],
+        charset="utf8mb4", autocommit=True, minsize=POOL_MIN, maxsize=POOL_MAX,
+        connect_timeout=CONNECT_TIMEOUT, pool_recycle=POOL_RECYCLE,
+        init_command=f"SET SESSION MAX_EXECUTION_TIME={int(QUERY_TIMEOUT * 1000)}",
+    )
+
+
+@asynccontextmanager
+async def conn():
+    try:
+        cn = await asyncio.wait_for(POOL.acquire(), ACQUIRE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(503, "Database pool exhausted")
+    try:
+        yield cn
+    except BaseException:
+        # una consulta cortada a mitad (timeout, cancelación, cliente que se va)
+        # deja paquetes sin leer en el socket: cerrada, el pool la descarta al
+        # liberarla en vez de dársela al siguiente request
+        cn.close()
+        raise
+    finally:
+        POOL.release(cn)
+
+
+async def fetch_all(sql: str, params=()) -> List[Dict[str, Any]]:
+    try:
+        async with conn() as cn:
+            cur = await cn.cursor(aiomysql.DictCursor)
+            await asyncio.wait_for(cur.execute(sql, params), QUERY_TIMEOUT)
+            rows = await cur.fetchall()
+            await cur.close()
+            return list(rows)
+    except asyncio.TimeoutError:
+        raise HTTPException(504, "Query timed out")
+    except pymysql.err.OperationalError as e:
+        if e.args and e.args[0] == ER_QUERY_TIMEOUT:
+            raise HTTPException(504, "Query timed out")
+        raise
+
+
+async def fetch_one(sql: str, params=()) -> Optional[Dict[str, Any]]:
+    rows = await fetch_all(sql, params)
+    return rows[0] if rows else None
+
+
+async def refrescar_version():
+    while True:
+        try:
+            row = await fetch_one("SELECT version FROM data_version WHERE id = 1")
+            _version["v"] = int(row["version"]) if row else None
+        except Exception:
+            cache.counters["version_errors"] += 1
+        await asyncio.sleep(flask_api.CACHE_VERSION_CHECK)
+
+
+def cached(view):
+    """Igual que cached_get de app.py: cache por ruta+query+data_version, ETag y 304."""
+    async def wrapper(request: Request):
+        key = cache.key(request.url.path, request.query_params)
+        hit = cache.get(key)
+        status = "HIT"
+        if hit is None:
+            resp = await view(request)
+            if resp.status_code != 200:
+                return resp
+            hit = cache.put(key, resp.body, resp.media_type)
+            status = "MISS"
+        headers = {"ETag": hit.etag, "Cache-Control": "no-cache", "X-Cache": status}
+        if etag_matches(request.headers.get("if-none-match"), hit.etag):
+            cache.counters["not_modified"] += 1
+            return Response(status_code=304, headers=headers)
+        return Response(hit.body, media_type=hit.mimetype, headers=headers)
+    return wrapper
+
+
+# ---------------------------
+# Routes
+# ---------------------------
+
+async def health(request: Request):
+    tz = parse_tz(request.query_params)
+    try:
+        await fetch_one("SELECT 1")
+        return json_response({"status": "ok", "db": "ok",
+                              "time": datetime.now(ZoneInfo(DEFAULT_TZ)).astimezone(tz).isoformat()})
+    except Exception as e:  # incluye el 503 de pool agotado: la base no está atendiendo
+        return json_response({"status": "degraded", "db": f"error: {e.__class__.__name__}"}, 500)
+
+
+async def cache_stats(request: Request):
+    return json_response(cache.stats())
+
+
+@cached
+async def list_stations(request: Request):
+    q = request.query_params
+    name_q = (q.get("q") or "").strip()
+    limit, offset = parse_limit_offset(q)
+    where_sql, params = ("WHERE name LIKE %s", [f"%{name_q}%"]) if name_q else ("", [])
+    total = (await fetch_one(f"SELECT COUNT(*) AS n FROM stations {where_sql}", params))["n"]
+    rows = await fetch_all(f"SELECT id, name FROM stations {where_sql} ORDER BY name ASC LIMIT %s OFFSET %s",
+                           params + [limit, offset])
+    items = [{"id": r["id"], "name": r["name"]} for r in rows]
+    return json_response({"items": items, "total": total, "limit": limit, "offset": offset})
+
+
+@cached
+async def get_station(request: Request):
+    row = await fetch_one("SELECT id, name FROM stations WHERE id=%s", (request.path_params["station_id"],))
+    if not row:
+        raise HTTPException(404, "Station not found")
+    return json_response(row)
+
+
+@cached
+async def station_latest(request: Request):
+    tz = parse_tz(request.query_params)
+    station_id = request.path_params["station_id"]
+    st = await fetch_one("SELECT id, name FROM stations WHERE id=%s", (station_id,))
+    if not st:
+        raise HTTPException(404, "Station not found")
+    row = await fetch_one("SELECT m.ts, m.pm2_5, m.pm10, m.so2, m.no2, m.o3, m.co "
+                          "FROM station_latest m WHERE m.station_id=%s", (station_id,))
+    item = row_to_measurement_dict(row, tz) if row else None
+    return json_response({"station_id": station_id, "station_name": st["name"], "item": item})
+
+
+@cached
+async def latest_all(request: Request):
+    tz = parse_tz(request.query_params)
+    limit, offset = parse_limit_offset(request.query_params)
+    rows = await fetch_all(
+        """
+        SELECT s.id AS station_id, s.name AS station_name,
+               m.ts, m.pm2_5, m.pm10, m.so2, m.no2, m.o3, m.co
+        FROM stations s
+        JOIN station_latest m ON m.station_id = s.id
+        ORDER BY s.name ASC
+        LIMIT %s OFFSET %s
+        """,
+        (limit, offset),
+    )
+    items = [{"station_id": r["station_id"], "station_name": r["station_name"], **row_to_measurement_dict(r, tz)}
+             for r in rows]
+    return json_response({"items": items, "limit": limit, "offset": offset})
+
+
+async def station_measurements(request: Request):
+    q = request.query_params
+    tz = parse_tz(q)
+    limit, offset = parse_limit_offset(q)
+    order = parse_order(q)
+    station_id = request.path_params["station_id"]
+    select_clause, _ = build_fields_clause(q)
+
+    where = ["m.station_id=%s"]
+    params: List[Any] = [station_id]
+    p_start, p_end = parse_dt(q.get("start")), parse_dt(q.get("end"))
+    if p_start:
+        where.append("m.ts >= %s"); params.append(p_start)
+    if p_end:
+        where.append("m.ts <= %s"); params.append(p_end)
+    cursor = parse_cursor(q, order.lower())
+    if cursor:
+        cond, cparams = keyset_clause("m.ts", None, order, cursor)
+        where.append(cond); params += cparams
+        offset = 0
+
+    st = await fetch_one("SELECT id, name FROM stations WHERE id=%s", (station_id,))
+    if not st:
+        raise HTTPException(404, "Station not found")
+    rows = await fetch_all(
+        f"SELECT {select_clause} FROM measurements m WHERE {' AND '.join(where)} "
+        f"ORDER BY m.ts {order} LIMIT %s OFFSET %s",
+        params + [limit + 1, offset],
+    )
+    rows, next_cursor = page_and_cursor(rows, limit, order.lower(), None)
+    items = [row_to_measurement_dict(r, tz) for r in rows]
+    return json_response({"station": {"id": st["id"], "name": st["name"]}, "items": items,
+                          "limit": limit, "offset": offset, "next_cursor": next_cursor})
+
+
+async def measurements_multi(request: Request):
+    q = request.query_params
+    tz = parse_tz(q)
+    limit, offset = parse_limit_offset(q)
+    order = parse_order(q)
+    select_clause, _ = build_fields_clause(q)
+    where, params = measurement_filters(q)
+    cursor = parse_cursor(q, order.lower())
+    if cursor:
+        cond, cparams = keyset_clause("m.ts", "m.station_id", order, cursor)
+        where.append(cond); params += cparams
+        offset = 0
+    where_sql = ("WHERE " + " AND ".join(where)) if where else ""
+    rows = await fetch_all(
+        f"""
+        SELECT s.id AS station_id, s.name AS station_name, {select_clause}
+        FROM measurements m
+        JOIN stations s ON s.id = m.station_id
+        {where_sql}
+        ORDER BY m.ts {order}, m.station_id {order}
+        LIMIT %s OFFSET %s
+        """,
+        params + [limit + 1, offset],
+    )
+    rows, next_cursor = page_and_cursor(rows, limit, order.lower(), "station_id")
+    items = [{"station_id": r["station_id"], "station_name": r["station_name"], **row_to_measurement_dict(r, tz)}
+             for r in rows]
+    return json_response({"items": items, "limit": limit, "offset": offset, "next_cursor": next_cursor})
+
+
+def aggregate_view(granularity: str):
+    @cached
+    async def view(request: Request):
+        q = request.query_params
+        sql, params = aggregate_query(q, granularity)
+        rows = await fetch_all(sql, params)
+        return json_response({"granularity": granularity, "items": aggregate_items(rows, parse_tz(q))})
+    return view
+
+
+# ---------- Export CSV (streaming, cursor sin buffer) ----------
+
+async def export_csv(request: Request):
+    q = request.query_params
+    tz = parse_tz(q)
+    order = parse_order(q)
+    select_clause, _ = build_fields_clause(q)
+    where, params = measurement_filters(q)
+    where_sql = ("WHERE " + " AND ".join(where)) if where else ""
+    sql = f"""
+        SELECT s.name AS station_name, {select_clause}
+        FROM measurements m
+        JOIN stations s ON s.id = m.station_id
+        {where_sql}
+        ORDER BY m.ts {order}
+    """
+    comprimir = (q.get("gzip") or "").lower() in ("1", "true", "yes")
+
+    async def generar():
+        gz = zlib.compressobj(6, zlib.DEFLATED, 31) if comprimir else None
+
+        def salida(texto: str) -> bytes:
+            data = texto.encode("utf-8")
+            return data if gz is None else gz.compress(data) + gz.flush(zlib.Z_SYNC_FLUSH)
+
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(["station_name", "ts", "pm25", "pm10", "so2", "no2", "o3", "co"])
+        yield salida(buf.getvalue())
+        # si el cliente corta a mitad, conn() cierra la conexión con el resultado sin leer
+        async with conn() as cn:
+            cur = await cn.cursor(aiomysql.SSDictCursor)
+            await cur.execute(sql, params)
+            while True:
+                rows = await cur.fetchmany(EXPORT_LOTE)
+                if not rows:
+                    break
+                buf.seek(0); buf.truncate()
+                for r in rows:
+                    md = row_to_measurement_dict(r, tz)
+                    writer.writerow([r["station_name"], md["ts"], md["pm25"], md["pm10"],
+                                     md["so2"], md["no2"], md["o3"], md["co"]])
+                yield salida(buf.getvalue())
+            await cur.close()
+        if gz is not None:
+            yield gz.flush()
+
+    headers = {"Cache-Control": "no-store", "X-Accel-Buffering": "no"}
+    if comprimir:
+        headers.update({"Content-Encoding": "gzip", "Vary": "Accept-Encoding"})
+    return StreamingResponse(generar(), media_type="text/csv; charset=utf-8", headers=headers)
+
+
+# ---------- Errores: mismo formato que los errorhandler de app.py ----------
+
+ERROR_NAMES = {400: "BadRequest", 401: "Unauthorized", 404: "NotFound",
+               503: "ServiceUnavailable", 504: "GatewayTimeout"}
+
+
+async def http_error(request: Request, exc: HTTPException):
+    name = ERROR_NAMES.get(exc.status_code, "ServerError")
+    return json_response({"error": name, "message": str(exc.detail)}, exc.status_code)
+
+
+async def invalid_param(request: Request, exc: InvalidParam):
+    return json_response({"error": "BadRequest", "message": str(exc)}, 400)
+
+
+async def server_error(request: Request, exc: Exception):
+    return json_response({"error": "ServerError", "message": str(exc)}, 500)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global POOL
+    POOL = await create_pool()
+    tarea = asyncio.create_task(refrescar_version())
+    try:
+        yield
+    finally:
+        tarea.cancel()
+        POOL.close()
+        await POOL.wait_closed()
+
+
+routes = [
+    Route("/v1/health", health),
+    Route("/v1/cache/stats", cache_stats),
+    Route("/v1/stations", list_stations),
+    Route("/v1/stations/{station_id:int}", get_station),
+    Route("/v1/stations/{station_id:int}/latest", station_latest),
+    Route("/v1/measurements/latest", latest_all),
+    Route("/v1/stations/{station_id:int}/measurements", station_measurements),
+    Route("/v1/measurements", measurements_multi),
+    Route("/v1/aggregates/hourly", aggregate_view("hourly")),
+    Route("/v1/aggregates/daily", aggregate_view("daily")),
+    Route("/v1/aggregates/monthly", aggregate_view("monthly")),
+    Route("/v1/export/csv", export_csv),
+    # alertas, suscriptores, backfill: la app Flask tal cual
+    Mount("/", app=WSGIMiddleware(flask_api.app)),
+]
+
+app = Starlette(
+    routes=routes,
+    lifespan=lifespan,
+    exception_handlers={HTTPException: http_error, InvalidParam: invalid_param, Exception: server_error},
+    middleware=[Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"],
+                           allow_headers=["Content-Type", "X-API-Key"])],
+)
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run("app_async:app", host="0.0.0.0", port=int(os.getenv("PORT", "8001")))
@@ -0,0 +1,159 @@
+# bench_api.py
+"""
+Carga lado a lado de la API Flask (app.py) y la ASGI (app_async.py): N clientes
+concurrentes repiten pedidos a una mezcla de endpoints de lectura durante unos
+segundos y se reporta req/s, p50 y p99 por endpoint y en total.
+
+Los clientes son hilos con conexiones keep-alive de http.client, así el
+generador de carga no depende de los paquetes que se comparan. La cache de
+respuestas está en ambas apps: --sin-cache agrega un parámetro aleatorio a cada
+pedido para medir el camino hasta MySQL.
+
+Uso:
+    # con las dos apps ya levantadas
+    python bench_api.py --flask http://127.0.0.1:8000 --async http://127.0.0.1:8001 \
+        --concurrencia 8 32 128 --segundos 20 [--sin-cache]
+    # o que el bench las levante (flask --with-threads y uvicorn)
+    python bench_api.py --lanzar --concurrencia 32 128
+"""
+import argparse
+import http.client
+import json
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+
+AQUI = Path(__file__).resolve().parent
+
+ENDPOINTS = [
+    "/v1/stations",
+    "/v1/measurements/latest",
+    "/v1/stations/{sid}/latest",
+    "/v1/stations/{sid}/measurements?limit=200&order=desc",
+    "/v1/aggregates/daily?station_id={sid}&start=2024-01-01T00:00:00",
+]
+
+
+def _estaciones(base):
+    u = urllib.parse.urlsplit(base)
+    c = http.client.HTTPConnection(u.hostname, u.port, timeout=10)
+    c.request("GET", "/v1/stations?limit=1000")
+    r = c.getresponse()
+    ids = [s["id"] for s in json.loads(r.read())["items"]]
+    c.close()
+    return ids or [1]
+
+
+def _cliente(base, ids, hasta, sin_cache, tiempos, errores, semilla):
+    u = urllib.parse.urlsplit(base)
+    rng = random.Random(semilla)
+    c = http.client.HTTPConnection(u.hostname, u.port, timeout=30)
+    while time.perf_counter() < hasta:
+        plantilla = rng.choice(ENDPOINTS)
+        ruta = plantilla.format(sid=rng.choice(ids))
+        if sin_cache:
+            ruta += ("&" if "?" in ruta else "?") + f"_r={rng.random()}"
+        t0 = time.perf_counter()
+        try:
+            c.request("GET", ruta)
+            r = c.getresponse()
+            r.read()
+            ok = r.status == 200
+        except (OSError, http.client.HTTPException):
+            ok = False
+            c.close()
+            c = http.client.HTTPConnection(u.hostname, u.port, timeout=30)
+        ms = (time.perf_counter() - t0) * 1000
+        if ok:
+            tiempos[plantilla.split("?")[0]].append(ms)
+        else:
+            errores[0] += 1
+    c.close()
+
+
+def correr(base, concurrencia, segundos, sin_cache):
+    ids = _estaciones(base)
+    tiempos = defaultdict(list)  # list.append es atómico con el GIL
+    errores = [0]
+    hasta = time.perf_counter() + segundos
+    hilos = [threading.Thread(target=_cliente, args=(base, ids, hasta, sin_cache, tiempos, errores, i))
+             for i in range(concurrencia)]
+    t0 = time.perf_counter()
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    total = time.perf_counter() - t0
+    return tiempos, errores[0], total
+
+
+def _fila(nombre, ms, total):
+    if not ms:
+        return f"  {nombre:<45s} {'-':>9s}"
+    a = np.asarray(ms)
+    return (f"  {nombre:<45s} {len(a) / total:>9.1f} {np.percentile(a, 50):>8.1f}ms "
+            f"{np.percentile(a, 99):>8.1f}ms")
+
+
+def _esperar(base, intentos=50):
+    u = urllib.parse.urlsplit(base)
+    for _ in range(intentos):
+        try:
+            c = http.client.HTTPConnection(u.hostname, u.port, timeout=2)
+            c.request("GET", "/v1/health")
+            c.getresponse().read()
+            c.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{base} no responde")
+
+
+def lanzar():
+    flask = subprocess.Popen([sys.executable, "-m", "flask", "--app", "app", "run",
+                              "--port", "8000", "--with-threads"], cwd=AQUI)
+    asgi = subprocess.Popen([sys.executable, "-m", "uvicorn", "app_async:app",
+                             "--port", "8001", "--no-access-log"], cwd=AQUI)
+    return [flask, asgi], "http://127.0.0.1:8000", "http://127.0.0.1:8001"
+
+
+def main(apps, concurrencias, segundos, sin_cache):
+    for base in apps.values():
+        _esperar(base)
+    print(f"  {'endpoint':<45s} {'req/s':>9s} {'p50':>10s} {'p99':>10s}")
+    for n in concurrencias:
+        for nombre, base in apps.items():
+            tiempos, errores, total = correr(base, n, segundos, sin_cache)
+            todos = [x for ms in tiempos.values() for x in ms]
+            print(f"{nombre} · concurrencia {n} · {segundos}s · errores {errores}")
+            for ep in ENDPOINTS:
+                ep = ep.split("?")[0]
+                print(_fila(ep, tiempos.get(ep, []), total))
+            print(_fila("TOTAL", todos, total))
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="req/s y p99: API Flask vs API ASGI.")
+    ap.add_argument("--flask", default="http://127.0.0.1:8000")
+    ap.add_argument("--async", dest="asgi", default="http://127.0.0.1:8001")
+    ap.add_argument("--lanzar", action="store_true", help="levanta flask (8000) y uvicorn (8001)")
+    ap.add_argument("--concurrencia", type=int, nargs="+", default=[8, 32, 128])
+    ap.add_argument("--segundos", type=float, default=20)
+    ap.add_argument("--sin-cache", action="store_true")
+    args = ap.parse_args()
+
+    procesos = []
+    if args.lanzar:
+        procesos, args.flask, args.asgi = lanzar()
+    try:
+        main({"flask": args.flask, "async": args.asgi}, args.concurrencia, args.segundos, args.sin_cache)
+    finally:
+        for p in procesos:
+            p.terminate()
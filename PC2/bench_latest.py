@@ -0,0 +1,107 @@
+# bench_latest.py
+"""
+Benchmark de "última medición por estación": consulta original (GROUP BY
+MAX(ts) + join a measurements) vs station_latest, a medida que measurements
+crece. Trabaja en una base aparte (por defecto <DB_NAME>_bench) con las tablas
+copiadas con CREATE TABLE ... LIKE de la base real, así que no toca datos.
+
+Uso:
+    python bench_latest.py --filas 1000000 5000000 20000000 [--estaciones 30] [--repeticiones 20]
+"""
+import argparse
+import statistics
+import time
+
+import numpy as np
+import pandas as pd
+
+import subir_mysql
+
+TABLAS = ["stations", "measurements", "station_latest",
+          "measurements_hourly", "measurements_daily", "measurements_monthly", "data_version"]
+
+Q_ORIGINAL = """
+SELECT s.id, s.name, m.ts, m.pm2_5, m.pm10, m.so2, m.no2, m.o3, m.co
+FROM stations s
+JOIN (SELECT station_id, MAX(ts) AS max_ts FROM measurements GROUP BY station_id) t
+  ON t.station_id = s.id
+JOIN measurements m ON m.station_id = t.station_id AND m.ts = t.max_ts
+ORDER BY s.name
+"""
+
+Q_LATEST = """
+SELECT s.id, s.name, m.ts, m.pm2_5, m.pm10, m.so2, m.no2, m.o3, m.co
+FROM stations s
+JOIN station_latest m ON m.station_id = s.id
+ORDER BY s.name
+"""
+
+
+def preparar(cur, base, n_estaciones):
+    cur.execute(f"CREATE DATABASE IF NOT EXISTS `{base}`")
+    for t in reversed(TABLAS):
+        cur.execute(f"DROP TABLE IF EXISTS `{base}`.{t}")
+    for t in TABLAS:
+        cur.execute(f"CREATE TABLE `{base}`.{t} LIKE `{subir_mysql.DB_NAME}`.{t}")
+    cur.execute(f"USE `{base}`")
+    cur.execute("INSERT INTO data_version (id, version) VALUES (1, 0)")
+    cur.executemany("INSERT INTO stations (name) VALUES (%s)",
+                    [(f"BENCH {i:03d}",) for i in range(n_estaciones)])
+    cur.execute("SELECT id FROM stations ORDER BY id")
+    return [r[0] for r in cur.fetchall()]
+
+
+def crecer(cn, cur, ids, desde, hasta, lote=20_000):
+    """Agrega filas horarias [desde, hasta) repartidas entre las estaciones."""
+    rng = np.random.default_rng(desde)
+    t0 = pd.Timestamp("2000-01-01")
+    for i in range(desde, hasta, lote):
+        j = np.arange(i, min(i + lote, hasta))
+        out = pd.DataFrame({
+            "station_id": np.array(ids)[j % len(ids)],
+            "ts": t0 + pd.to_timedelta(j // len(ids), unit="h"),
+        })
+        for _, col in subir_mysql.POL_COLS:
+            out[col] = rng.gamma(2.0, 20.0, len(j)).round(2)
+        subir_mysql.subir_lotes(cn, cur, out, lote)
+
+
+def medir(cur, sql, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        cur.execute(sql)
+        cur.fetchall()
+        tiempos.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(tiempos), max(tiempos)
+
+
+def main(filas, n_estaciones, repeticiones, base):
+    cn = subir_mysql.connect()
+    cur = cn.cursor()
+    ids = preparar(cur, base, n_estaciones)
+    cn.commit()
+
+    print(f"{'filas':>12s} {'original p50':>14s} {'max':>9s} {'latest p50':>12s} {'max':>9s}")
+    actual = 0
+    for objetivo in sorted(filas):
+        crecer(cn, cur, ids, actual, objetivo)
+        actual = objetivo
+        cur.execute("ANALYZE TABLE measurements")
+        cur.fetchall()
+        o50, omax = medir(cur, Q_ORIGINAL, repeticiones)
+        l50, lmax = medir(cur, Q_LATEST, repeticiones)
+        print(f"{actual:>12,d} {o50:>12.2f}ms {omax:>7.2f}ms {l50:>10.2f}ms {lmax:>7.2f}ms")
+
+    cur.close()
+    cn.close()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Latencia de latest-por-estación vs tamaño de measurements.")
+    ap.add_argument("--filas", type=int, nargs="+", default=[1_000_000, 5_000_000, 20_000_000])
+    ap.add_argument("--estaciones", type=int, default=30)
+    ap.add_argument("--repeticiones", type=int, default=20)
+    ap.add_argument("--base", default=f"{subir_mysql.DB_NAME}_bench")
+    args = ap.parse_args()
+    main(args.filas, args.estaciones, args.repeticiones, args.base)
@@ -0,0 +1,84 @@
+# estaciones.py
+"""
+Resolución nombre -> stations.id por conjuntos, para cualquier punto de ingesta.
+
+En vez de un SELECT (y quizá un INSERT) por nombre:
+1) la primera vez se trae toda la tabla stations en una consulta;
+2) los nombres que faltan se insertan juntos con un solo INSERT IGNORE;
+3) se re-resuelven en un solo SELECT ... WHERE name IN (...).
+
+La tabla usa utf8mb4_0900_ai_ci (sin distinguir mayúsculas ni tildes), así que
+"Campo de Marte" y "CAMPO DE MARTE" son la misma fila: si el nombre pedido no
+aparece tal cual, se busca por su forma plegada (casefold + sin diacríticos).
+
+Uso:
+    from estaciones import ResolverEstaciones
+    resolver = ResolverEstaciones(cur)
+    ids = resolver.resolver(df["Estacion"].unique())   # {nombre: id}
+"""
+import unicodedata
+
+LOTE_IN = 1000
+
+
+def plegar(nombre):
+    """Aproximación en Python de la comparación de utf8mb4_0900_ai_ci."""
+    s = unicodedata.normalize("NFKD", nombre)
+    return "".join(c for c in s if not unicodedata.combining(c)).casefold()
+
+
+class ResolverEstaciones:
+    def __init__(self, cur):
+        self.cur = cur
+        self.ids = {}        # nombre exacto -> id
+        self._plegados = {}  # nombre plegado -> id
+        self._cargado = False
+
+    def _registrar(self, filas):
+        for sid, name in filas:
+            self.ids[name] = sid
+            self._plegados.setdefault(plegar(name), sid)
+
+    def _buscar(self, nombre):
+        sid = self.ids.get(nombre)
+        if sid is None:
+            sid = self._plegados.get(plegar(nombre))
+            if sid is not None:
+                self.ids[nombre] = sid
+        return sid
+
+    def precargar(self):
+        self.cur.execute("SELECT id, name FROM stations")
+        self._registrar(self.cur.fetchall())
+        self._cargado = True
+
+    def resolver(self, nombres):
+        """{nombre: id} para todos los `nombres`, creando los que falten."""
+        if not self._cargado:
+            self.precargar()
+        nombres = list(dict.fromkeys(n for n in nombres if n))
+        faltan = [n for n in nombres if self._buscar(n) is None]
+        if faltan:
+            self._crear(faltan)
+        return {n: self._buscar(n) for n in nombres}
+
+    def __getitem__(self, nombre):
+        return self.resolver([nombre])[nombre]
+
+    def _crear(self, faltan):
+        # dos nombres nuevos que el collation considera iguales: se inserta uno
+        unicos = list({plegar(n): n for n in reversed(faltan)}.values())
+        for i in range(0, len(unicos), LOTE_IN):
+            parte = unicos[i:i + LOTE_IN]
+            self.cur.execute(
+                "INSERT IGNORE INTO stations (name) VALUES " + ",".join(["(%s)"] * len(parte)),
+                parte,
+            )
+            self.cur.execute(
+                "SELECT id, name FROM stations WHERE name IN (" + ",".join(["%s"] * len(parte)) + ")",
+                parte,
+            )
+            self._registrar(self.cur.fetchall())
+        sin_id = [n for n in faltan if self._buscar(n) is None]
+        if sin_id:
+            raise RuntimeError(f"No se pudo resolver el id de {len(sin_id)} estaciones: {sin_id[:5]}")
@@ -0,0 +1,410 @@
+# notificaciones.py
+"""
+Despachador de notificaciones: lleva los alert_events nuevos a los webhooks de
+alert_subscribers usando un outbox persistente (sql/08_notificaciones.sql).
+
+Ciclo del coordinador (un hilo, una conexión):
+1) encolar: INSERT IGNORE al outbox de los eventos con id mayor que la marca
+   persistida en alert_outbox_mark, para los suscriptores cuyos filtros
+   cumplan. La marca avanza en la misma transacción, solo hasta eventos
+   creados hace más de ASENTAR_S segundos: un lote de eventos que commitea
+   tarde con ids menores no queda atrás, y lo que se creó con el despachador
+   caído se encola al volver. Los eventos de un backfill histórico (ts más de
+   EDAD_MAX_H horas anterior a su created_at) no se notifican.
+2) tomar: por suscriptor, las filas pendientes y vencidas, cuando la más vieja
+   lleva al menos `ventana` segundos esperando (o ya hay `lote_max`): así los
+   eventos que llegan juntos salen en un solo POST. Se toman con
+   SELECT ... FOR UPDATE SKIP LOCKED y se les corre next_attempt_at LEASE_S
+   hacia adelante en la misma transacción, así dos despachadores (o uno que
+   reinicia encima del anterior) no mandan la misma fila; si el proceso muere,
+   vuelven solas al vencer el lease.
+3) el POST lo hace un pool de `workers` hilos (urllib, JSON, firma HMAC si el
+   suscriptor tiene secret);
+4) resultado: 2xx -> sent; error -> reintento con backoff exponencial con
+   jitter (BACKOFF_BASE_S * 2^(intentos-1), tope BACKOFF_MAX_S) y, pasados
+   `max_intentos`, failed.
+
+La latencia de entrega (desde que la fila entró al outbox hasta el 2xx) se
+guarda por evento y se reporta en percentiles.
+
+Uso:
+    python notificaciones.py [--workers 4] [--ventana 2] [--intervalo 0.5]
+    python notificaciones.py --prueba 2000 [--fallos 0.2] [--latencia-ms 50]
+        (levanta un webhook stub local, le manda eventos existentes y reporta
+         p50/p90/p99; el suscriptor de prueba se borra al final)
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+ASENTAR_S = 60
+EDAD_MAX_H = 48
+LEASE_S = 60
+BACKOFF_BASE_S = 2.0
+BACKOFF_MAX_S = 600.0
+TIMEOUT_S = 10.0
+
+ENCOLAR_SQL = """
+INSERT IGNORE INTO alert_outbox (subscriber_id, event_id)
+SELECT s.id, e.id
+FROM alert_events e
+JOIN alert_subscribers s
+  ON s.enabled = 1
+ AND (s.rule_id IS NULL OR s.rule_id = e.rule_id)
+ AND (s.station_id IS NULL OR s.station_id = e.station_id)
+WHERE e.id > %s
+  AND e.ts >= e.created_at - INTERVAL %s HOUR
+"""
+
+MARCA_SQL = "SELECT last_event_id FROM alert_outbox_mark WHERE id = 1 FOR UPDATE"
+
+# hasta dónde avanzar: los eventos ya asentados (ver ASENTAR_S)
+NUEVA_MARCA_SQL = """
+SELECT COALESCE(MAX(id), %s) AS marca FROM alert_events
+WHERE id > %s AND created_at <= NOW() - INTERVAL %s SECOND
+"""
+
+GUARDAR_MARCA_SQL = "UPDATE alert_outbox_mark SET last_event_id = %s WHERE id = 1"
+
+LISTOS_SQL = """
+SELECT o.subscriber_id
+FROM alert_outbox o
+JOIN alert_subscribers s ON s.id = o.subscriber_id AND s.enabled = 1
+WHERE o.status = 'pending' AND o.next_attempt_at <= NOW(3)
+GROUP BY o.subscriber_id
+HAVING MIN(o.created_at) <= NOW(3) - INTERVAL %s MICROSECOND OR COUNT(*) >= %s
+"""
+
+TOMAR_SQL = """
+SELECT o.id, TIMESTAMPDIFF(MICROSECOND, o.created_at, NOW(3)) AS edad_us,
+       e.id AS event_id, e.rule_id, r.name AS rule_name, e.station_id, st.name AS station_name,
+       e.ts, e.pollutant, e.value, e.operator, e.threshold
+FROM alert_outbox o
+JOIN alert_events e ON e.id = o.event_id
+JOIN alert_rules r ON r.id = e.rule_id
+JOIN stations st ON st.id = e.station_id
+WHERE o.subscriber_id = %s AND o.status = 'pending' AND o.next_attempt_at <= NOW(3)
+ORDER BY o.id
+LIMIT %s
+FOR UPDATE OF o SKIP LOCKED
+"""
+
+LEASE_SQL = "UPDATE alert_outbox SET next_attempt_at = NOW(3) + INTERVAL %s SECOND WHERE id IN ({ids})"
+
+ENVIADO_SQL = """
+UPDATE alert_outbox
+SET status = 'sent', sent_at = NOW(3), attempts = attempts + 1, last_error = NULL
+WHERE id IN ({ids})
+"""
+
+# MySQL asigna de izquierda a derecha: status y el backoff ya ven attempts + 1
+FALLIDO_SQL = """
+UPDATE alert_outbox
+SET attempts = attempts + 1,
+    last_error = %s,
+    status = IF(attempts >= %s, 'failed', 'pending'),
+    next_attempt_at = NOW(3) + INTERVAL
+      ROUND(LEAST(%s, %s * POW(2, attempts - 1)) * (0.75 + RAND() / 2) * 1000000) MICROSECOND
+WHERE id IN ({ids})
+"""
+
+
+def _json(v):
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()
+    return v
+
+
+def entregar(sub, eventos, timeout=TIMEOUT_S):
+    """POST de un lote a un suscriptor; devuelve (ok, error)."""
+    cuerpo = json.dumps({"subscriber": sub["name"], "count": len(eventos), "events": eventos},
+                        default=_json).encode("utf-8")
+    headers = {"Content-Type": "application/json", "User-Agent": "senamhi-alertas/1"}
+    if sub.get("secret"):
+        firma = hmac.new(sub["secret"].encode(), cuerpo, hashlib.sha256).hexdigest()
+        headers["X-Signature"] = f"sha256={firma}"
+    req = urllib.request.Request(sub["url"], data=cuerpo, headers=headers, method="POST")
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            resp.read()
+            return 200 <= resp.status < 300, None if resp.status < 300 else f"HTTP {resp.status}"
+    except urllib.error.HTTPError as e:
+        return False, f"HTTP {e.code}"
+    except Exception as e:
+        return False, f"{e.__class__.__name__}: {e}"[:300]
+
+
+class Despachador:
+    def __init__(self, conectar, workers=4, ventana=2.0, lote_max=100, max_intentos=8,
+                 intervalo=0.5, entregar_fn=entregar):
+        self.conectar = conectar
+        self.ventana = ventana
+        self.lote_max = lote_max
+        self.max_intentos = max_intentos
+        self.intervalo = intervalo
+        self.entregar_fn = entregar_fn
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="webhook")
+        self.en_vuelo = {}  # subscriber_id -> (future, ids, edades_s, t0)
+        self.latencias = deque(maxlen=100_000)
+        self.cuenta = {"lotes": 0, "entregados": 0, "reintentos": 0, "fallidos": 0}
+        self._parar = threading.Event()
+        self.cn = None
+        self.cur = None
+
+    # --- base ---
+
+    def _abrir(self):
+        if self.cn is None:
+            self.cn = self.conectar()
+            self.cn.autocommit = True
+            self.cur = self.cn.cursor(dictionary=True)
+
+    def _ids(self, ids):
+        return ",".join(str(int(i)) for i in ids)
+
+    def _cerrar(self):
+        """Descarta la conexión tras un error; se reabre en la siguiente vuelta."""
+        if self.cn is None:
+            return
+        try:
+            self.cur.close()
+            self.cn.close()
+        except Exception:
+            pass
+        self.cn = self.cur = None
+
+    def encolar(self):
+        self.cn.start_transaction()
+        try:
+            self.cur.execute(MARCA_SQL)
+            marca = self.cur.fetchone()["last_event_id"]
+            self.cur.execute(ENCOLAR_SQL, (marca, EDAD_MAX_H))
+            n = self.cur.rowcount
+            self.cur.execute(NUEVA_MARCA_SQL, (marca, marca, ASENTAR_S))
+            self.cur.execute(GUARDAR_MARCA_SQL, (self.cur.fetchone()["marca"],))
+            self.cn.commit()
+        except Exception:
+            self.cn.rollback()
+            raise
+        return n
+
+    def _suscriptores(self, ids):
+        self.cur.execute(f"SELECT id, name, url, secret FROM alert_subscribers WHERE id IN ({self._ids(ids)})")
+        return {r["id"]: r for r in self.cur.fetchall()}
+
+    def tomar(self):
+        """Lanza un lote por cada suscriptor listo que no tenga otro en vuelo."""
+        self.cur.execute(LISTOS_SQL, (int(self.ventana * 1_000_000), self.lote_max))
+        listos = [r["subscriber_id"] for r in self.cur.fetchall() if r["subscriber_id"] not in self.en_vuelo]
+        if not listos:
+            return 0
+        subs = self._suscriptores(listos)
+        for sid in listos:
+            self.cn.start_transaction()
+            try:
+                self.cur.execute(TOMAR_SQL, (sid, self.lote_max))
+                filas = self.cur.fetchall()
+                if filas:
+                    self.cur.execute(LEASE_SQL.format(ids=self._ids(f["id"] for f in filas)), (LEASE_S,))
+                self.cn.commit()
+            except Exception:
+                self.cn.rollback()
+                raise
+            if not filas:
+                continue
+            ids = [f.pop("id") for f in filas]
+            edades = [f.pop("edad_us") / 1e6 for f in filas]
+            fut = self.pool.submit(self.entregar_fn, subs[sid], filas)
+            self.en_vuelo[sid] = (fut, ids, edades, time.perf_counter())
+        return len(listos)
+
+    def cerrar_hechos(self):
+        for sid in [s for s, v in self.en_vuelo.items() if v[0].done()]:
+            fut, ids, edades, t0 = self.en_vuelo.pop(sid)
+            try:
+                ok, error = fut.result()
+            except Exception as e:  # entregar_fn no debería lanzar, pero por si acaso
+                ok, error = False, repr(e)[:300]
+            self.cuenta["lotes"] += 1
+            if ok:
+                self.cur.execute(ENVIADO_SQL.format(ids=self._ids(ids)))
+                dt = time.perf_counter() - t0
+                self.latencias.extend(e + dt for e in edades)
+                self.cuenta["entregados"] += len(ids)
+            else:
+                self.cur.execute(FALLIDO_SQL.format(ids=self._ids(ids)),
+                                 (error, self.max_intentos, BACKOFF_MAX_S, BACKOFF_BASE_S))
+                self.cur.execute(f"SELECT COUNT(*) AS n FROM alert_outbox WHERE status='failed' "
+                                 f"AND id IN ({self._ids(ids)})")
+                fallidos = self.cur.fetchone()["n"]
+                self.cuenta["fallidos"] += fallidos
+                self.cuenta["reintentos"] += len(ids) - fallidos
+
+    def paso(self):
+        """Una vuelta del coordinador."""
+        self._abrir()
+        self.cerrar_hechos()
+        self.encolar()
+        self.tomar()
+
+    def correr(self, hasta=None):
+        """Bucle hasta parar() (o hasta que hasta() devuelva True)."""
+        try:
+            while not self._parar.is_set():
+                try:
+                    self.paso()
+                except Exception as e:
+                    print(f"[notificaciones] error: {e}", file=sys.stderr)
+                    self._cerrar()
+                if hasta is not None and not self.en_vuelo and hasta():
+                    break
+                self._parar.wait(self.intervalo)
+        finally:
+            # los POST en curso terminan y su resultado queda registrado
+            self.pool.shutdown(wait=True)
+            if self.en_vuelo:
+                try:
+                    self._abrir()
+                    self.cerrar_hechos()
+                except Exception as e:  # quedan en lease y se reintentan al vencer
+                    print(f"[notificaciones] error cerrando lotes: {e}", file=sys.stderr)
+            self._cerrar()
+
+    def parar(self):
+        self._parar.set()
+
+    def percentiles(self):
+        if not self.latencias:
+            return {}
+        p = np.percentile(np.fromiter(self.latencias, float), [50, 90, 99])
+        return {"p50_s": round(p[0], 3), "p90_s": round(p[1], 3), "p99_s": round(p[2], 3),
+                "max_s": round(max(self.latencias), 3)}
+
+    def resumen(self):
+        c = self.cuenta
+        txt = (f"{c['entregados']} entregados en {c['lotes']} POST, {c['reintentos']} a reintentar, "
+               f"{c['fallidos']} fallidos")
+        p = self.percentiles()
+        if p:
+            txt += f" | latencia p50 {p['p50_s']}s p90 {p['p90_s']}s p99 {p['p99_s']}s max {p['max_s']}s"
+        return txt
+
+
+# ---------------- Prueba contra un webhook stub local ----------------
+
+class _Stub(BaseHTTPRequestHandler):
+    fallos = 0.0
+    latencia_s = 0.0
+    recibidos = 0
+    posts = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        cuerpo = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.latencia_s)
+        if random.random() < self.fallos:
+            self.send_response(503)
+            self.end_headers()
+            return
+        n = json.loads(cuerpo)["count"]
+        with _Stub.lock:
+            _Stub.recibidos += n
+            _Stub.posts += 1
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def prueba(conectar, n, fallos, latencia_ms, workers, ventana):
+    global BACKOFF_BASE_S
+    BACKOFF_BASE_S = 0.2  # reintentos rápidos para que la prueba termine pronto
+    _Stub.fallos, _Stub.latencia_s = fallos, latencia_ms / 1000
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _Stub)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{srv.server_address[1]}/hook"
+
+    cn = conectar()
+    cn.autocommit = True
+    cur = cn.cursor()
+    cur.execute("SELECT id FROM alert_events ORDER BY id DESC LIMIT %s", (n,))
+    eventos = [r[0] for r in cur.fetchall()]
+    if not eventos:
+        print("❌ No hay alert_events para la prueba")
+        return
+    cur.execute("INSERT INTO alert_subscribers (name, url, enabled) VALUES (%s, %s, 1)", ("stub-prueba", url))
+    sub_id = cur.lastrowid
+
+    def sin_pendientes():
+        cur.execute("SELECT COUNT(*) FROM alert_outbox WHERE subscriber_id=%s AND status='pending'", (sub_id,))
+        return cur.fetchone()[0] == 0
+
+    # los eventos llegan en ráfagas, como desde el loader
+    def productor():
+        for i in range(0, len(eventos), 50):
+            parte = eventos[i:i + 50]
+            cur2 = cn2.cursor()
+            cur2.execute("INSERT IGNORE INTO alert_outbox (subscriber_id, event_id) VALUES "
+                         + ",".join(["(%s,%s)"] * len(parte)),
+                         [x for e in parte for x in (sub_id, e)])
+            cur2.close()
+            time.sleep(0.1)
+
+    cn2 = conectar()
+    cn2.autocommit = True
+    d = Despachador(conectar, workers=workers, ventana=ventana, intervalo=0.05, max_intentos=20)
+    hilo = threading.Thread(target=productor)
+    t0 = time.perf_counter()
+    hilo.start()
+    try:
+        d.correr(hasta=lambda: not hilo.is_alive() and sin_pendientes())
+    finally:
+        hilo.join()
+        cur.execute("DELETE FROM alert_subscribers WHERE id=%s", (sub_id,))
+        cn.close()
+        cn2.close()
+        srv.shutdown()
+    dt = time.perf_counter() - t0
+    print(f"✅ {len(eventos)} eventos en {dt:.1f}s; stub recibió {_Stub.recibidos} en {_Stub.posts} POST "
+          f"(fallos simulados {fallos:.0%}, {latencia_ms} ms por POST)")
+    print(f"   {d.resumen()}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Despacha alert_events a los webhooks suscritos.")
+    ap.add_argument("--workers", type=int, default=4, help="hilos que hacen los POST")
+    ap.add_argument("--ventana", type=float, default=2.0, help="segundos para juntar eventos por suscriptor")
+    ap.add_argument("--lote-max", type=int, default=100, help="eventos máximos por POST")
+    ap.add_argument("--max-intentos", type=int, default=8)
+    ap.add_argument("--intervalo", type=float, default=0.5, help="segundos entre vueltas del coordinador")
+    ap.add_argument("--prueba", type=int, metavar="N", help="prueba con N eventos contra un webhook stub local")
+    ap.add_argument("--fallos", type=float, default=0.2, help="fracción de POST que el stub rechaza (--prueba)")
+    ap.add_argument("--latencia-ms", type=float, default=50, help="demora del stub por POST (--prueba)")
+    args = ap.parse_args()
+
+    import subir_mysql
+
+    if args.prueba:
+        prueba(subir_mysql.connect, args.prueba, args.fallos, args.latencia_ms, args.workers, args.ventana)
+    else:
+        d = Despachador(subir_mysql.connect, workers=args.workers, ventana=args.ventana,
+                        lote_max=args.lote_max, max_intentos=args.max_intentos, intervalo=args.intervalo)
+        try:
+            d.correr()
+        except KeyboardInterrupt:
+            pass
+        print(f"[notificaciones] {d.resumen()}")
@@ -0,0 +1,149 @@
+# pipeline_horario.py
+"""
+Flujo horario en un solo proceso: scrape -> limpieza -> carga a MySQL, pasando
+las filas en memoria de una etapa a la siguiente (nada se re-parsea desde disco).
+
+- scrape: senamhi_por_hora.scrape() (http / selenium / auto)
+- limpieza: limpiar_detalle.limpiar() solo sobre las filas del run
+- almacén (opcional): almacen_parquet.escribir()
+- carga: subir_mysql.cargar() (lotes + marcas por estación) con todas las filas
+  del run; las marcas por estación descartan las que ya estaban
+- alertas: las filas subidas se evalúan contra las reglas en un hilo aparte
+  (alertas.EvaluadorAlertas); --sin-alertas lo salta
+- auditoría (por defecto): las filas nuevas se agregan a senamhi_detalle.csv
+  con el índice de llaves, como el scraper de siempre; --sin-csv la salta.
+  Va después de la carga: si la carga falla, las filas no quedan en el índice
+  y el próximo run que las vuelva a leer las sube.
+
+Al final imprime el tiempo de cada etapa y lo deja en pipeline_ultimo_run.json.
+Es el punto de entrada del job horario de GitHub Actions.
+
+Uso:
+    python pipeline_horario.py [--modo http] [--sin-csv] [--almacen] [--sin-db]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import contextlib
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+BASE_DIR = Path(__file__).resolve().parent
+PC1_DIR = BASE_DIR.parent / "PC1"
+sys.path.insert(0, str(PC1_DIR))
+import almacen_parquet  # noqa: E402
+import limpiar_detalle  # noqa: E402
+import senamhi_por_hora as hora  # noqa: E402
+
+REPORTE = BASE_DIR / "pipeline_ultimo_run.json"
+
+
+class Etapas:
+    def __init__(self):
+        self.tiempos = {}
+        self.filas = {}
+
+    @contextmanager
+    def etapa(self, nombre):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.tiempos[nombre] = round(time.perf_counter() - t0, 3)
+
+    def imprimir(self):
+        for nombre, dt in self.tiempos.items():
+            n = self.filas.get(nombre)
+            extra = f"  {n} filas" if n is not None else ""
+            print(f"  {nombre:10s} {dt:8.3f}s{extra}")
+        print(f"  {'total':10s} {sum(self.tiempos.values()):8.3f}s")
+
+
+def run(modo="auto", fuente=None, concurrencia=8, intervalo_host=0.2,
+        csv=True, almacen=False, db=True, modo_carga="lotes", reconcile=None, alertas=True):
+    et = Etapas()
+    res = {"inicio": datetime.now().isoformat(timespec="seconds")}
+
+    with et.etapa("scrape"):
+        filas = hora.scrape(modo=modo, fuente=fuente, concurrencia=concurrencia,
+                            intervalo_host=intervalo_host)
+    et.filas["scrape"] = len(filas)
+
+    limpio = None
+    if filas:
+        with et.etapa("limpieza"):
+            limpio = limpiar_detalle.limpiar(pd.DataFrame(filas))
+        et.filas["limpieza"] = len(limpio)
+
+    if limpio is not None and len(limpio) and almacen:
+        with et.etapa("almacen"):
+            tocadas = almacen_parquet.escribir(limpio)
+        et.filas["almacen"] = len(tocadas)
+
+    if limpio is not None and len(limpio) and db:
+        import subir_mysql
+        from alertas import EvaluadorAlertas
+
+        ev = EvaluadorAlertas(subir_mysql.connect) if alertas else None
+        with ev or contextlib.nullcontext():
+            with et.etapa("carga"):
+                cn = subir_mysql.connect(local_infile=(modo_carga == "infile"))
+                cur = cn.cursor()
+                try:
+                    cuenta = subir_mysql.cargar(cn, cur, [subir_mysql.tipar_limpio(limpio)],
+                                                modo=modo_carga, reconcile=reconcile, evaluador=ev)
+                finally:
+                    cur.close()
+                    cn.close()
+            # la salida del with espera a que el hilo termine de evaluar
+            et_alertas = time.perf_counter()
+        et.filas["carga"] = subir_mysql.enviadas(cuenta)
+        res["carga"] = cuenta
+        print(f"[carga] {subir_mysql.resumen(cuenta)}")
+        if ev is not None:
+            et.tiempos["alertas"] = round(time.perf_counter() - et_alertas, 3)
+            et.filas["alertas"] = ev.cuenta["filas"]
+            res["alertas"] = ev.cuenta
+            print(f"[alertas] {ev.resumen()}")
+
+    # recién con la carga commiteada: una fila en el índice ya está en la base
+    if csv and filas:
+        with et.etapa("auditoria"):
+            nuevas = hora.save_rows(filas)
+        et.filas["auditoria"] = len(nuevas)
+
+    if not filas:
+        print("[pipeline] sin filas en este run.")
+    print("[pipeline] tiempos por etapa:")
+    et.imprimir()
+
+    res.update({"tiempos": et.tiempos, "filas": et.filas})
+    REPORTE.write_text(json.dumps(res, indent=1, ensure_ascii=False), encoding="utf-8")
+    return res
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Scrape + limpieza + carga en un solo proceso.")
+    ap.add_argument("--modo", choices=["auto", "http", "selenium"],
+                    default=os.getenv("SENAMHI_MODO", "auto"))
+    ap.add_argument("--fuente", help="HTML/JS guardado del mapa para correr sin red (modo http)")
+    ap.add_argument("--concurrencia", type=int, default=int(os.getenv("SENAMHI_CONCURRENCIA", "8")))
+    ap.add_argument("--intervalo-host", type=float, default=0.2)
+    ap.add_argument("--sin-csv", action="store_true", help="no agrega las filas crudas a senamhi_detalle.csv")
+    ap.add_argument("--almacen", action="store_true", help="agrega las filas limpias al almacén Parquet")
+    ap.add_argument("--sin-db", action="store_true", help="no sube a MySQL (p.ej. para probar)")
+    ap.add_argument("--modo-carga", choices=["fila", "lotes", "infile"], default="lotes")
+    ap.add_argument("--reconcile", type=float, metavar="HORAS",
+                    help="re-sube también las filas de las últimas HORAS bajo la marca")
+    ap.add_argument("--sin-alertas", action="store_true", help="no evalúa reglas sobre las filas subidas")
+    args = ap.parse_args()
+
+    run(modo=args.modo, fuente=args.fuente, concurrencia=args.concurrencia,
+        intervalo_host=args.intervalo_host, csv=not args.sin_csv, almacen=args.almacen,
+        db=not args.sin_db, modo_carga=args.modo_carga, reconcile=args.reconcile,
+        alertas=not args.sin_alertas)
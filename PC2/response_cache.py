@@ -0,0 +1,205 @@
+# response_cache.py
+"""
+Cache de respuestas para los endpoints de lectura de la API (app.py).
+
+- Llave: ruta + query params normalizados (ordenados), más la versión de datos.
+- LRU + TTL en memoria del proceso; opcionalmente compartida entre workers en
+  Redis (CACHE_REDIS_URL, requiere el paquete `redis`).
+- Invalidación por ingesta: el loader incrementa data_version (ver
+  sql/06_data_version.sql) en la misma transacción que cada lote; la API lee
+  ese contador como mucho cada `check_interval` segundos y, si cambió, todo lo
+  cacheado con la versión anterior deja de servirse.
+- ETag = hash del cuerpo, así que es el mismo en todos los workers y sirve para
+  responder If-None-Match con 304 aunque la entrada no esté en este proceso.
+
+Uso:
+    from response_cache import ResponseCache
+    cache = ResponseCache(version_fn=leer_version, max_entries=512, ttl=300)
+    hit = cache.get(key)            # CachedResponse | None
+    cache.put(key, body, mimetype)
+    cache.stats()
+
+    # en el loader, dentro de la transacción del lote:
+    bump_version(cur)
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+BUMP_VERSION_SQL = "UPDATE data_version SET version = version + 1 WHERE id = 1"
+READ_VERSION_SQL = "SELECT version FROM data_version WHERE id = 1"
+
+
+def bump_version(cur) -> None:
+    """Marca que cambiaron los datos; se commitea junto con el lote que lo causó."""
+    cur.execute(BUMP_VERSION_SQL)
+
+
+def read_version(cur) -> Optional[int]:
+    cur.execute(READ_VERSION_SQL)
+    row = cur.fetchone()
+    if row is None:
+        return None
+    return int(row["version"] if isinstance(row, dict) else row[0])
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match puede traer '*', varias etags separadas por comas o etags débiles (W/)."""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == "*" or tag == etag:
+            return True
+    return False
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    mimetype: str
+    etag: str
+
+
+class _MemoryBackend:
+    """OrderedDict como LRU: move_to_end al leer, popitem(last=False) al pasarse."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: CachedResponse, ttl: float) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class _RedisBackend:
+    """Compartido entre procesos; el TTL y la expulsión (maxmemory-policy) los hace Redis."""
+
+    def __init__(self, url: str, prefix: str = "senamhi:resp:"):
+        import redis  # opcional: solo si se configura CACHE_REDIS_URL
+
+        self._r = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.evictions = 0
+
+    def get(self, key: str):
+        raw = self._r.hgetall(self.prefix + key)
+        if not raw:
+            return None
+        return CachedResponse(raw[b"body"], raw[b"mimetype"].decode(), raw[b"etag"].decode())
+
+    def set(self, key: str, value: CachedResponse, ttl: float) -> None:
+        k = self.prefix + key
+        pipe = self._r.pipeline()
+        pipe.hset(k, mapping={"body": value.body, "mimetype": value.mimetype, "etag": value.etag})
+        pipe.expire(k, max(1, int(ttl)))
+        pipe.execute()
+
+    def clear(self) -> None:
+        # las llaves llevan la versión: las viejas dejan de pedirse y expiran solas
+        pass
+
+    def __len__(self) -> int:
+        return -1
+
+
+class ResponseCache:
+    def __init__(self, version_fn: Callable[[], Optional[int]], max_entries: int = 512,
+                 ttl: float = 300.0, check_interval: float = 5.0, redis_url: Optional[str] = None):
+        self.version_fn = version_fn
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self.backend = _RedisBackend(redis_url) if redis_url else _MemoryBackend(max_entries)
+        self._version: Optional[int] = None
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "not_modified": 0,
+                         "invalidations": 0, "version_errors": 0}
+
+    def version(self) -> Optional[int]:
+        """Versión de datos vigente; se consulta a la base como mucho cada check_interval s."""
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return self._version
+        with self._lock:
+            if now - self._checked_at < self.check_interval:
+                return self._version
+            try:
+                v = self.version_fn()
+            except Exception:
+                # sin tabla/base: se sigue con la última versión conocida y solo vale el TTL
+                self.counters["version_errors"] += 1
+                v = self._version
+            if v != self._version:
+                if self._version is not None:
+                    self.counters["invalidations"] += 1
+                self.backend.clear()
+                self._version = v
+            self._checked_at = now
+            return v
+
+    def key(self, path: str, args) -> str:
+        """
+        Ruta + pares (param, valor) ordenados: ?b=2&a=1 y ?a=1&b=2 son la misma entrada.
+        `args` es el MultiDict de Flask o el QueryParams de Starlette (app_async.py).
+        """
+        items = args.multi_items() if hasattr(args, "multi_items") else ((k, v) for k, vs in args.lists() for v in vs)
+        pares = sorted(items)
+        qs = "&".join(f"{k}={v}" for k, v in pares)
+        return f"{self.version()}:{path}?{qs}"
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        hit = self.backend.get(key)
+        self.counters["hits" if hit is not None else "misses"] += 1
+        return hit
+
+    def put(self, key: str, body: bytes, mimetype: str) -> CachedResponse:
+        value = CachedResponse(body, mimetype, make_etag(body))
+        self.backend.set(key, value, self.ttl)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        c = dict(self.counters)
+        total = c["hits"] + c["misses"]
+        c.update({
+            "hit_ratio": round(c["hits"] / total, 4) if total else None,
+            "entries": len(self.backend),
+            "evictions": self.backend.evictions,
+            "data_version": self._version,
+            "ttl": self.ttl,
+            "backend": "redis" if isinstance(self.backend, _RedisBackend) else "memory",
+        })
+        return c
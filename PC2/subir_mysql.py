@@ -1,9 +1,25 @@
 import os
+import sys
+import time
+import argparse
+import tempfile
+import contextlib
 from pathlib import Path
+import numpy as np
 import pandas as pd
 import mysql.connector
+from mysql.connector.constants import ClientFlag
 from dotenv import load_dotenv
 
+PC1_DIR = Path(__file__).resolve().parents[1] / "PC1"
+sys.path.insert(0, str(PC1_DIR))
+import almacen_parquet  # noqa: E402
+import por_bloques  # noqa: E402
+import agregados  # noqa: E402
+from estaciones import ResolverEstaciones  # noqa: E402
+from response_cache import bump_version  # noqa: E402
+from alertas import EvaluadorAlertas  # noqa: E402
+
 # === 1. Cargar variables del archivo .env ===
 load_dotenv(Path(__file__).parent / "config.env")
 
@@ -14,11 +30,19 @@ DB_PASS = os.getenv("DB_PASS", "")
 DB_NAME = os.getenv("DB_NAME", "senamhi")
 
 # === 3. Ruta al CSV limpio generado por el scraper ===
-CSV_PATH = Path(__file__).resolve().parents[1] / "PC1" / "senamhi_detalle_limpio.csv"
+CSV_PATH = PC1_DIR / "senamhi_detalle_limpio.csv"
+
+POL_COLS = [("PM 2.5","pm2_5"),("PM 10","pm10"),("SO2","so2"),
+            ("NO2","no2"),("O3","o3"),("CO","co")]
+
+MODOS = ("fila", "lotes", "infile")
+LOTE = 5000
 
-def connect():
+def connect(local_infile=False):
+    # sin FOUND_ROWS: el rowcount del upsert es 1 insertada / 2 cambiada / 0 igual
     return mysql.connector.connect(
-        host=DB_HOST, user=DB_USER, password=DB_PASS, database=DB_NAME
+        host=DB_HOST, user=DB_USER, password=DB_PASS, database=DB_NAME,
+        allow_local_infile=local_infile, client_flags=[-ClientFlag.FOUND_ROWS]
     )
 
 def get_or_create_station_id(cur, name: str) -> int:
@@ -30,48 +54,145 @@ def get_or_create_station_id(cur, name: str) -> int:
     cur.execute("INSERT INTO stations (name) VALUES (%s)", (name,))
     return cur.lastrowid
 
-def main():
-    if not CSV_PATH.exists():
-        print(f"❌ No existe el archivo {CSV_PATH}")
-        return
+UPSERT_SQL = """
+INSERT INTO measurements (station_id, ts, pm2_5, pm10, so2, no2, o3, co)
+VALUES (%s,%s,%s,%s,%s,%s,%s,%s)
+ON DUPLICATE KEY UPDATE
+  pm2_5=VALUES(pm2_5),
+  pm10 =VALUES(pm10),
+  so2  =VALUES(so2),
+  no2  =VALUES(no2),
+  o3   =VALUES(o3),
+  co   =VALUES(co);
+"""
+
+# station_latest: solo avanza si la fila trae un ts >= al guardado. MySQL evalúa
+# las asignaciones en orden y las siguientes ven el valor ya actualizado, por eso
+# ts va al final.
+LATEST_UPSERT_SQL = """
+INSERT INTO station_latest (station_id, ts, pm2_5, pm10, so2, no2, o3, co)
+VALUES (%s,%s,%s,%s,%s,%s,%s,%s)
+ON DUPLICATE KEY UPDATE
+  pm2_5=IF(VALUES(ts) >= ts, VALUES(pm2_5), pm2_5),
+  pm10 =IF(VALUES(ts) >= ts, VALUES(pm10),  pm10),
+  so2  =IF(VALUES(ts) >= ts, VALUES(so2),   so2),
+  no2  =IF(VALUES(ts) >= ts, VALUES(no2),   no2),
+  o3   =IF(VALUES(ts) >= ts, VALUES(o3),    o3),
+  co   =IF(VALUES(ts) >= ts, VALUES(co),    co),
+  ts   =GREATEST(ts, VALUES(ts))
+"""
+
+REBUILD_LATEST_SQL = """
+INSERT INTO station_latest (station_id, ts, pm2_5, pm10, so2, no2, o3, co)
+SELECT m.station_id, m.ts, m.pm2_5, m.pm10, m.so2, m.no2, m.o3, m.co
+FROM measurements m
+JOIN (
+  SELECT station_id, MAX(ts) AS mx FROM measurements GROUP BY station_id
+) t ON t.station_id = m.station_id AND t.mx = m.ts
+"""
+
+# staging por sesión para LOAD DATA: sin llaves únicas, `seq` conserva el orden
+# del archivo para que en el merge gane la última fila de cada (station_id, ts)
+STAGE_DDL = """
+CREATE TEMPORARY TABLE IF NOT EXISTS measurements_stage (
+  seq BIGINT AUTO_INCREMENT PRIMARY KEY,
+  station_id INT NOT NULL,
+  ts DATETIME NOT NULL,
+  pm2_5 DOUBLE NULL,
+  pm10  DOUBLE NULL,
+  so2   DOUBLE NULL,
+  no2   DOUBLE NULL,
+  o3    DOUBLE NULL,
+  co    DOUBLE NULL
+) ENGINE=InnoDB
+"""
+
+# llaves del lote a reconciliar, para contar en SQL las que ya existen
+LLAVES_DDL = """
+CREATE TEMPORARY TABLE IF NOT EXISTS llaves_lote (
+  station_id INT NOT NULL,
+  ts DATETIME NOT NULL,
+  KEY (station_id, ts)
+) ENGINE=InnoDB
+"""
 
-    # === 4. Leer CSV ===
-    df = pd.read_csv(CSV_PATH, dtype=str, encoding="utf-8-sig").fillna("")
+CONTAR_LLAVES_SQL = """
+SELECT COUNT(*) FROM llaves_lote k
+JOIN measurements m ON m.station_id = k.station_id AND m.ts = k.ts
+"""
+
+LOAD_STAGE_SQL = """
+LOAD DATA LOCAL INFILE %s INTO TABLE measurements_stage
+FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n'
+(station_id, ts, pm2_5, pm10, so2, no2, o3, co)
+"""
+
+MERGE_STAGE_SQL = """
+INSERT INTO measurements (station_id, ts, pm2_5, pm10, so2, no2, o3, co)
+SELECT station_id, ts, pm2_5, pm10, so2, no2, o3, co
+FROM measurements_stage ORDER BY seq
+ON DUPLICATE KEY UPDATE
+  pm2_5=VALUES(pm2_5),
+  pm10 =VALUES(pm10),
+  so2  =VALUES(so2),
+  no2  =VALUES(no2),
+  o3   =VALUES(o3),
+  co   =VALUES(co)
+"""
+
+def tipar(df):
+    """Columnas de texto del CSV limpio -> ts + contaminantes numéricos."""
+    df = df.fillna("")
     needed = ["Estacion","Fecha","Hora","PM 2.5","PM 10","SO2","NO2","O3","CO"]
     for col in needed:
         if col not in df.columns:
             df[col] = ""
 
     # === 5. Crear columna timestamp ===
-    df["ts"] = pd.to_datetime(df["Fecha"].str.strip() + " " + df["Hora"].str.strip(),
-                              errors="coerce", dayfirst=False)
+    # mismo parser (dd/mm/YYYY) que tipar_limpio y el almacén: las marcas por
+    # estación solo valen si todas las rutas de carga dan el mismo ts
+    df["ts"] = almacen_parquet.timestamps(df)
 
     # === 6. Convertir valores a float ===
-    for c, tgt in [("PM 2.5","pm2_5"),("PM 10","pm10"),("SO2","so2"),
-                   ("NO2","no2"),("O3","o3"),("CO","co")]:
+    for c, tgt in POL_COLS:
         df[tgt] = pd.to_numeric(df[c].str.strip().replace({"": None}), errors="coerce")
+    return df
 
-    # Filtrar filas sin timestamp válido
-    df = df[~df["ts"].isna()].copy()
+def leer_csv():
+    return tipar(pd.read_csv(CSV_PATH, dtype=str, encoding="utf-8-sig"))
 
-    cn = connect()
-    cur = cn.cursor()
+def leer_almacen(estaciones=None, desde=None, hasta=None):
+    """Lee del almacén Parquet: ts y contaminantes ya vienen tipados."""
+    df = almacen_parquet.leer(estaciones=estaciones, desde=desde, hasta=hasta,
+                              columnas=["Estacion","ts"] + [c for c, _ in POL_COLS])
+    return _tipar_almacen(df)
+
+def _tipar_almacen(df):
+    df = df.rename(columns=dict(POL_COLS))
+    df["ts"] = pd.to_datetime(df["ts"])
+    return df
 
-    upsert_sql = """
-    INSERT INTO measurements (station_id, ts, pm2_5, pm10, so2, no2, o3, co)
-    VALUES (%s,%s,%s,%s,%s,%s,%s,%s)
-    ON DUPLICATE KEY UPDATE
-      pm2_5=VALUES(pm2_5),
-      pm10 =VALUES(pm10),
-      so2  =VALUES(so2),
-      no2  =VALUES(no2),
-      o3   =VALUES(o3),
-      co   =VALUES(co);
+def bloques(almacen=False, estaciones=None, desde=None, hasta=None,
+            chunksize=por_bloques.CHUNKSIZE, memoria_mb=por_bloques.MEMORIA_MB):
     """
+    Mismas filas que leer_csv()/leer_almacen() pero de a bloques: del CSV con
+    techo de memoria, del almacén una partición (estación/mes) a la vez.
+    Dedup entre bloques no hace falta: el upsert en orden deja la última fila.
+    """
+    if almacen:
+        for df in almacen_parquet.leer_por_particion(estaciones=estaciones, desde=desde, hasta=hasta,
+                                                     columnas=["Estacion","ts"] + [c for c, _ in POL_COLS]):
+            yield _tipar_almacen(df)
+    else:
+        for _, df in por_bloques.leer_por_bloques(CSV_PATH, chunksize, memoria_mb):
+            yield tipar(df)
 
-    count = 0
-    cache_station = {}
+def subir_filas(cur, df, cache_station):
+    """Upsert fila a fila de un DataFrame tipado; devuelve cuántas filas mandó."""
+    # Filtrar filas sin timestamp válido
+    df = df[~df["ts"].isna()]
 
+    count = 0
     for _, r in df.iterrows():
         name = (r["Estacion"] or "").strip()
         if not name:
@@ -83,7 +204,7 @@ def main():
         else:
             sid = cache_station[name]
 
-        cur.execute(upsert_sql, (
+        cur.execute(UPSERT_SQL, (
             sid, r["ts"].to_pydatetime(),
             r["pm2_5"] if pd.notna(r["pm2_5"]) else None,
             r["pm10"]  if pd.notna(r["pm10"])  else None,
@@ -93,12 +214,351 @@ def main():
             r["co"]    if pd.notna(r["co"])    else None,
         ))
         count += 1
+    return count
+
+def _lote_tipado(resolver, df):
+    """station_id + ts + contaminantes de las filas subibles, sin iterrows."""
+    df = df[~df["ts"].isna()]
+    names = df["Estacion"].fillna("").astype(str).str.strip()
+    df, names = df[names != ""], names[names != ""]
+    ids = resolver.resolver(names.unique().tolist())
+    out = pd.DataFrame({"station_id": names.map(ids).astype("int64"), "ts": df["ts"]})
+    for _, tgt in POL_COLS:
+        out[tgt] = df[tgt].astype("float64")
+    return out
+
+def _tuplas(out):
+    cols = [out["station_id"].tolist(), list(out["ts"].dt.to_pydatetime())]
+    for _, tgt in POL_COLS:
+        cols.append(out[tgt].astype(object).where(out[tgt].notna(), None).tolist())
+    return list(zip(*cols))
+
+def actualizar_latest(cur, out):
+    """Lleva a station_latest la fila más reciente de cada estación de `out`."""
+    if out.empty:
+        return
+    ultimas = out.sort_values("ts", kind="stable").drop_duplicates("station_id", keep="last")
+    cur.executemany(LATEST_UPSERT_SQL.strip(), _tuplas(ultimas))
+
+def actualizar_derivadas(cur, out):
+    """Tablas que dependen de measurements y el loader mantiene por lote."""
+    if out.empty:
+        return
+    actualizar_latest(cur, out)
+    agregados.actualizar(cur, out)
+    bump_version(cur)  # invalida la cache de la API al commitear el lote
+
+def reconstruir_latest(cur):
+    """Recalcula station_latest completa desde measurements."""
+    cur.execute("DELETE FROM station_latest")
+    cur.execute(REBUILD_LATEST_SQL)
+    n = cur.rowcount
+    bump_version(cur)
+    return n
+
+def subir_una_a_una(cn, cur, out, lote=None):
+    """Un round trip por fila (como el loop original); devuelve filas afectadas."""
+    afectadas = 0
+    for fila in _tuplas(out):
+        cur.execute(UPSERT_SQL, fila)
+        afectadas += cur.rowcount
+    actualizar_derivadas(cur, out)
+    return afectadas
+
+def subir_lotes(cn, cur, out, lote=LOTE):
+    """executemany multi-fila (el conector arma un INSERT ... VALUES (...),(...)) y commit por lote."""
+    sql = UPSERT_SQL.strip().rstrip(";")
+    afectadas = 0
+    for i in range(0, len(out), lote):
+        parte = out.iloc[i:i + lote]
+        cur.executemany(sql, _tuplas(parte))
+        afectadas += cur.rowcount
+        actualizar_derivadas(cur, parte)
+        cn.commit()
+    return afectadas
+
+def subir_infile(cn, cur, out, lote=LOTE):
+    """LOAD DATA LOCAL INFILE a una tabla staging + merge set-based, commit por lote."""
+    cur.execute(STAGE_DDL)
+    fd, tmp = tempfile.mkstemp(prefix="subir_", suffix=".tsv")
+    os.close(fd)
+    afectadas = 0
+    try:
+        for i in range(0, len(out), lote):
+            parte = out.iloc[i:i + lote]
+            parte.to_csv(tmp, sep="\t", header=False, index=False, na_rep="\\N",
+                                        date_format="%Y-%m-%d %H:%M:%S", lineterminator="\n")
+            cur.execute(LOAD_STAGE_SQL, (tmp,))
+            cur.execute(MERGE_STAGE_SQL)
+            afectadas += cur.rowcount
+            # DELETE y no TRUNCATE: TRUNCATE commitea implícitamente (aun en una
+            # tabla TEMPORARY) y el merge quedaría sin las derivadas del lote
+            cur.execute("DELETE FROM measurements_stage")
+            actualizar_derivadas(cur, parte)
+            cn.commit()
+    finally:
+        os.remove(tmp)
+    return afectadas
+
+SUBIR = {"fila": subir_una_a_una, "lotes": subir_lotes, "infile": subir_infile}
+
+# ---------------- Marcas por estación (carga delta) ----------------
+def marcas_por_estacion(cur):
+    """MAX(ts) de cada estación en una sola consulta (recorre uq_station_ts)."""
+    cur.execute("SELECT station_id, MAX(ts) FROM measurements GROUP BY station_id")
+    return {sid: pd.Timestamp(ts) for sid, ts in cur.fetchall()}
+
+def separar_por_marca(out, marcas, reconcile=None):
+    """
+    Parte las filas tipadas en (nuevas, a_reconciliar, n_saltadas):
+    - nuevas: ts > marca de su estación (o estación sin marca);
+    - a_reconciliar: dentro de la ventana `reconcile` (Timedelta) bajo la marca;
+    - el resto ya está en la base y no se manda.
+    """
+    marca = out["station_id"].map(marcas).astype("datetime64[ns]")
+    nueva = (marca.isna() | (out["ts"] > marca)).to_numpy()
+    rec = np.zeros(len(out), dtype=bool)
+    if reconcile is not None:
+        rec = ~nueva & (out["ts"] > marca - reconcile).to_numpy()
+    return out[nueva], out[rec], int((~nueva & ~rec).sum())
+
+def llaves_existentes(cur, out, lote=LOTE):
+    """
+    Cuántas (station_id, ts) de `out` ya existen en measurements. Las llaves del
+    lote van a una tabla temporal y se cuentan con un join sobre uq_station_ts:
+    a MySQL viajan las llaves del lote, no las filas existentes.
+    """
+    if out.empty:
+        return 0
+    cur.execute(LLAVES_DDL)
+    cur.execute("DELETE FROM llaves_lote")
+    llaves = [(int(sid), ts.to_pydatetime()) for sid, ts in zip(out["station_id"], out["ts"])]
+    for i in range(0, len(llaves), lote):
+        cur.executemany("INSERT INTO llaves_lote (station_id, ts) VALUES (%s, %s)", llaves[i:i + lote])
+    cur.execute(CONTAR_LLAVES_SQL)
+    return int(cur.fetchone()[0])
+
+# ---------------- Corrección única: fechas cargadas mes/día ----------------
+# Hasta que tipar() pasó a dd/mm/YYYY, el CSV se parseaba mes primero: una fila
+# del 03/10 (3 de octubre) quedó en measurements como 10 de marzo. Esas llaves
+# adelantan o atrasan la marca de su estación y ni --completo las pisa, porque
+# la fila correcta va a otra llave.
+BORRAR_LLAVES_SQL = {
+    "measurements": """
+DELETE m FROM measurements m
+JOIN llaves_lote k ON k.station_id = m.station_id AND k.ts = m.ts
+""",
+    "alert_events": """
+DELETE e FROM alert_events e
+JOIN llaves_lote k ON k.station_id = e.station_id AND k.ts = e.ts
+""",
+}
 
+def fechas_invertidas(df):
+    """
+    (Estacion, ts) con que la carga vieja (mes primero) guardó las filas del CSV
+    crudo `df` cuyo día <= 12 y distinto del mes. Se excluyen las llaves que son
+    también el ts correcto de alguna fila de la misma estación: esas las pisa la
+    recarga completa.
+    """
+    fecha = df["Fecha"].astype(str).str.strip() + " " + df["Hora"].astype(str).str.strip()
+    viejo = pd.to_datetime(fecha, format="%m/%d/%Y %H:%M", errors="coerce")
+    nuevo = almacen_parquet.timestamps(df)
+    est = df["Estacion"].fillna("").astype(str).str.strip()
+    mal = viejo.notna() & nuevo.notna() & (viejo != nuevo) & (est != "")
+    llaves = pd.DataFrame({"Estacion": est[mal], "ts": viejo[mal]}).drop_duplicates()
+    buenas = pd.DataFrame({"Estacion": est[nuevo.notna()], "ts": nuevo[nuevo.notna()]}).drop_duplicates()
+    llaves = llaves.merge(buenas, how="left", indicator=True)
+    return llaves[llaves["_merge"] == "left_only"].drop(columns="_merge").reset_index(drop=True)
+
+def corregir_fechas(cn, cur, df, lote=LOTE):
+    """
+    Borra de measurements y alert_events las llaves de fechas_invertidas(df),
+    recalcula los agregados que tocaban y station_latest, y descarta el estado
+    de ventanas de esas estaciones (se vuelve a sembrar en la siguiente carga).
+    Un solo commit; después hay que recargar con completo=True para insertar
+    las filas en su ts correcto. Devuelve las filas borradas de measurements.
+    """
+    llaves = fechas_invertidas(df)
+    if llaves.empty:
+        return 0
+    ids = ResolverEstaciones(cur).resolver(llaves["Estacion"].unique().tolist())
+    out = pd.DataFrame({"station_id": llaves["Estacion"].map(ids).astype("int64"), "ts": llaves["ts"]})
+    cur.execute(LLAVES_DDL)
+    cur.execute("DELETE FROM llaves_lote")
+    filas = [(int(sid), ts.to_pydatetime()) for sid, ts in zip(out["station_id"], out["ts"])]
+    for i in range(0, len(filas), lote):
+        cur.executemany("INSERT INTO llaves_lote (station_id, ts) VALUES (%s, %s)", filas[i:i + lote])
+    cur.execute(BORRAR_LLAVES_SQL["measurements"])
+    borradas = cur.rowcount
+    cur.execute(BORRAR_LLAVES_SQL["alert_events"])
+    sids = sorted(out["station_id"].unique().tolist())
+    cur.execute("DELETE FROM alert_window_state WHERE station_id IN (" + ",".join(["%s"] * len(sids)) + ")",
+                sids)
+    agregados.actualizar(cur, out)
+    reconstruir_latest(cur)
     cn.commit()
+    return borradas
+
+def tipar_limpio(df):
+    """Filas ya limpias en memoria (salida de limpiar()) -> mismas columnas que leer_almacen()."""
+    out = pd.DataFrame({"Estacion": df["Estacion"], "ts": almacen_parquet.timestamps(df)})
+    for c, tgt in POL_COLS:
+        out[tgt] = pd.to_numeric(df[c], errors="coerce")
+    return out
+
+def cargar(cn, cur, fuente, modo="lotes", lote=LOTE, reconcile=None, completo=False, prog=None,
+           evaluador=None):
+    """
+    Sube cada DataFrame tipado de `fuente` y devuelve los contadores.
+    Carga delta: solo se mandan filas con ts > MAX(ts) de su estación, más las
+    de la ventana `reconcile` (horas) bajo la marca; completo=True manda todo.
+    evaluador: alertas.EvaluadorAlertas que recibe las filas subidas una vez commiteadas.
+    """
+    ventana = pd.Timedelta(hours=reconcile) if reconcile is not None else None
+    marcas = None if completo else marcas_por_estacion(cur)
+    subir = SUBIR[modo]
+    resolver = ResolverEstaciones(cur)
+    cuenta = {"insertadas": 0, "actualizadas": 0, "sin_cambios": 0, "saltadas": 0}
+
+    for df in fuente:
+        out = _lote_tipado(resolver, df)
+        if completo:
+            nuevas, rec, saltadas = out.iloc[:0], out, 0
+        else:
+            nuevas, rec, saltadas = separar_por_marca(out, marcas, ventana)
+        cuenta["saltadas"] += saltadas
+
+        # sobre la marca todo es INSERT (rowcount 1 por fila)
+        cuenta["insertadas"] += subir(cn, cur, nuevas, lote)
+
+        # bajo la marca (o todo, con completo): existentes -> rowcount 2 si cambió, 0 si no
+        if len(rec):
+            existentes = llaves_existentes(cur, rec, lote)
+            afectadas = subir(cn, cur, rec, lote)
+            ins = len(rec) - existentes
+            act = (afectadas - ins) // 2
+            cuenta["insertadas"] += ins
+            cuenta["actualizadas"] += act
+            cuenta["sin_cambios"] += existentes - act
+
+        cn.commit()
+        if evaluador is not None:
+            evaluador.encolar(pd.concat([nuevas, rec]))
+        if prog is not None:
+            prog.sumar(len(out))
+    return cuenta
+
+def main(almacen=False, estaciones=None, desde=None, hasta=None, chunksize=None, memoria_mb=None,
+         modo="lotes", lote=LOTE, reconcile=None, completo=False, alertas=True):
+    """
+    modo: 'fila' (un round trip por fila), 'lotes' (executemany multi-fila) o
+    'infile' (LOAD DATA + merge); los dos últimos commitean cada `lote` filas.
+    reconcile/completo: ver cargar().
+    alertas: evalúa las reglas contra las filas subidas en un hilo aparte.
+    chunksize/memoria_mb: modo por bloques; cada bloque se sube y se commitea
+    antes de leer el siguiente, con progreso en stderr.
+    """
+    por_partes = bool(chunksize or memoria_mb)
+    if not almacen and not CSV_PATH.exists():
+        print(f"❌ No existe el archivo {CSV_PATH}")
+        return
+
+    if por_partes:
+        fuente = bloques(almacen, estaciones, desde, hasta,
+                         chunksize or por_bloques.CHUNKSIZE, memoria_mb or por_bloques.MEMORIA_MB)
+    elif almacen:
+        fuente = [leer_almacen(estaciones, desde, hasta)]
+    else:
+        # === 4. Leer CSV ===
+        fuente = [leer_csv()]
+
+    cn = connect(local_infile=(modo == "infile"))
+    cur = cn.cursor()
+    prog = por_bloques.Progreso("subir") if por_partes else None
+    t0 = time.perf_counter()
+
+    ev = EvaluadorAlertas(connect) if alertas else None
+    with ev or contextlib.nullcontext():
+        cuenta = cargar(cn, cur, fuente, modo=modo, lote=lote, reconcile=reconcile,
+                        completo=completo, prog=prog, evaluador=ev)
+
     cur.close()
     cn.close()
+    if prog is not None:
+        prog.fin()
 
-    print(f"✅ Subida completa: {count} filas procesadas")
+    dt = time.perf_counter() - t0
+    print(f"✅ Subida completa ({modo}): {resumen(cuenta)} ({enviadas(cuenta) / max(dt, 1e-9):,.0f} filas/s)")
+    if ev is not None:
+        print(f"🔔 Alertas: {ev.resumen()}")
+    return cuenta
+
+def enviadas(cuenta):
+    return cuenta["insertadas"] + cuenta["actualizadas"] + cuenta["sin_cambios"]
+
+def resumen(cuenta):
+    return (f"{cuenta['insertadas']} insertadas, {cuenta['actualizadas']} actualizadas, "
+            f"{cuenta['sin_cambios']} sin cambios, {cuenta['saltadas']} saltadas por marca")
+
+def bench(almacen=False, lote=LOTE, modos=MODOS):
+    """Sube los mismos datos con cada modo (upserts idempotentes) y compara filas/s."""
+    df = leer_almacen() if almacen else leer_csv()
+    for modo in modos:
+        cn = connect(local_infile=(modo == "infile"))
+        cur = cn.cursor()
+        t0 = time.perf_counter()
+        if modo == "fila":
+            n = subir_filas(cur, df, {})  # el loop original, con iterrows
+        else:
+            out = _lote_tipado(ResolverEstaciones(cur), df)
+            SUBIR[modo](cn, cur, out, lote)
+            n = len(out)
+        cn.commit()
+        dt = time.perf_counter() - t0
+        cur.close()
+        cn.close()
+        print(f"{modo:7s} {n} filas en {dt:7.2f}s -> {n / max(dt, 1e-9):>10,.0f} filas/s")
 
 if __name__ == "__main__":
-    main()
+    ap = argparse.ArgumentParser(description="Sube mediciones limpias a MySQL.")
+    ap.add_argument("--almacen", action="store_true", help="leer desde el almacén Parquet en vez del CSV")
+    ap.add_argument("--estacion", action="append", help="filtra por estación (repetible; con --almacen)")
+    ap.add_argument("--desde", help="YYYY-MM-DD[ HH:MM] (con --almacen)")
+    ap.add_argument("--hasta", help="YYYY-MM-DD[ HH:MM] (con --almacen)")
+    ap.add_argument("--chunksize", type=int, help="sube por bloques de hasta N filas")
+    ap.add_argument("--memoria-mb", type=float, help="techo de memoria del modo por bloques (MB)")
+    ap.add_argument("--modo", choices=MODOS, default="lotes", help="estrategia de carga (default: lotes)")
+    ap.add_argument("--lote", type=int, default=LOTE, help="filas por lote/commit (lotes, infile)")
+    ap.add_argument("--reconcile", type=float, metavar="HORAS",
+                    help="re-sube también las filas de las últimas HORAS bajo la marca de cada estación")
+    ap.add_argument("--completo", action="store_true", help="ignora las marcas y sube todo")
+    ap.add_argument("--sin-alertas", action="store_true", help="no evalúa reglas de alerta sobre lo subido")
+    ap.add_argument("--bench", action="store_true", help="compara filas/s de los tres modos")
+    ap.add_argument("--rebuild-latest", action="store_true",
+                    help="recalcula station_latest desde measurements y sale")
+    ap.add_argument("--corregir-fechas", action="store_true",
+                    help="borra las filas que la carga vieja guardó con día y mes invertidos "
+                         "y recarga el CSV completo")
+    args = ap.parse_args()
+    if args.corregir_fechas:
+        cn = connect()
+        cur = cn.cursor()
+        n = corregir_fechas(cn, cur, pd.read_csv(CSV_PATH, dtype=str, encoding="utf-8-sig"), lote=args.lote)
+        cur.close()
+        cn.close()
+        print(f"✅ {n} filas con fecha invertida borradas; recargando el CSV completo")
+        main(modo=args.modo, lote=args.lote, completo=True, alertas=not args.sin_alertas)
+    elif args.rebuild_latest:
+        cn = connect()
+        cur = cn.cursor()
+        n = reconstruir_latest(cur)
+        cn.commit()
+        cn.close()
+        print(f"✅ station_latest reconstruida: {n} estaciones")
+    elif args.bench:
+        bench(almacen=args.almacen, lote=args.lote)
+    else:
+        main(almacen=args.almacen, estaciones=args.estacion, desde=args.desde, hasta=args.hasta,
+             chunksize=args.chunksize, memoria_mb=args.memoria_mb, modo=args.modo, lote=args.lote,
+             reconcile=args.reconcile, completo=args.completo, alertas=not args.sin_alertas)
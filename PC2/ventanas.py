@@ -0,0 +1,276 @@
+# ventanas.py
+"""
+Reglas de alerta con ventana móvil (alert_rules.window_hours > 1), p.ej. O3
+promedio de 8 h o PM2.5 promedio de 24 h, con agregación avg o max.
+
+Cada par (regla, estación) guarda su estado en alert_window_state:
+- un buffer circular de `w` valores horarios; la hora h va al casillero h % w;
+- la suma y el conteo de valores no nulos del buffer, y su máximo;
+- end_ts, la hora más reciente que entró.
+Una hora nueva limpia los casilleros de las horas que pasaron, escribe el suyo
+y ajusta suma/conteo en O(1) (el máximo se recorre sobre los `w` casilleros);
+no se vuelve a consultar la ventana en measurements. Si el par todavía no tiene
+estado (regla nueva, estación nueva), se siembra una vez desde
+measurements_hourly.
+
+La ventana se evalúa cuando tiene al menos COBERTURA_MIN de sus horas con
+dato (75%, como piden las normas de calidad de aire para promedios móviles).
+Una hora atrasada que cae dentro de la ventana actual corrige su casillero y
+re-evalúa la ventana vigente; una más vieja que la ventana ya no se considera.
+
+Uso:
+    import ventanas
+    horas = ventanas.horas_ventana("8h")              # 8 ('1d' -> 24, None/'1h' -> None)
+    eventos = ventanas.procesar(cur, out, reglas)     # desde alertas.evaluar_filas
+    ventanas.sembrar(cur)                             # estados faltantes, desde la API
+"""
+import json
+import math
+import operator
+import re
+
+import numpy as np
+import pandas as pd
+
+COBERTURA_MIN = 0.75
+AGREGACIONES = {"avg", "max"}
+
+_RE_VENTANA = re.compile(r"^\s*(\d+)\s*([hd])\s*$", re.IGNORECASE)
+_OPS = {"gt": operator.gt, "ge": operator.ge, "lt": operator.lt, "le": operator.le}
+
+ESTADOS_SQL = """
+SELECT rule_id, station_id, end_ts, buf FROM alert_window_state
+WHERE rule_id IN ({reglas}) AND station_id IN ({estaciones})
+"""
+
+GUARDAR_SQL = """
+INSERT INTO alert_window_state (rule_id, station_id, end_ts, buf, sum_val, n, max_val)
+VALUES (%s,%s,%s,%s,%s,%s,%s)
+ON DUPLICATE KEY UPDATE
+  end_ts=VALUES(end_ts), buf=VALUES(buf), sum_val=VALUES(sum_val), n=VALUES(n), max_val=VALUES(max_val)
+"""
+
+REGLAS_SIN_ESTADO_SQL = """
+SELECT r.id AS rule_id, l.station_id, l.ts, LOWER(r.pollutant) AS pollutant, r.window_hours
+FROM alert_rules r
+JOIN station_latest l ON (r.station_id IS NULL OR l.station_id = r.station_id)
+LEFT JOIN alert_window_state w ON w.rule_id = r.id AND w.station_id = l.station_id
+WHERE r.enabled = 1 AND r.window_hours > 1 AND w.rule_id IS NULL {filtro}
+"""
+
+
+def horas_ventana(texto):
+    """'8h' -> 8, '1d' -> 24; None, '' y '1h' son reglas instantáneas (None). ValueError si no se entiende."""
+    if texto is None or str(texto).strip() == "":
+        return None
+    m = _RE_VENTANA.match(str(texto))
+    if not m or int(m.group(1)) < 1:
+        raise ValueError(f"ventana inválida: {texto!r} (se espera p.ej. '8h' o '1d')")
+    horas = int(m.group(1)) * (24 if m.group(2).lower() == "d" else 1)
+    return horas if horas > 1 else None
+
+
+def minimo_horas(w):
+    return max(1, math.ceil(w * COBERTURA_MIN))
+
+
+def _hora(ts):
+    """Número de hora desde 1970 (las mediciones son horarias)."""
+    return int(pd.Timestamp(ts).value // 3_600_000_000_000)
+
+
+def _ts(hora):
+    return pd.Timestamp(hora * 3_600_000_000_000).to_pydatetime()
+
+
+class Ventana:
+    """Buffer circular de `w` horas con suma, conteo y máximo."""
+
+    __slots__ = ("w", "fin", "buf", "suma", "n")
+
+    def __init__(self, w, fin=None, buf=None):
+        self.w = w
+        self.fin = fin
+        self.buf = list(buf) if buf is not None else [None] * w
+        vals = [v for v in self.buf if v is not None]
+        self.suma = float(sum(vals))
+        self.n = len(vals)
+
+    def _poner(self, hora, valor):
+        i = hora % self.w
+        viejo = self.buf[i]
+        if viejo is not None:
+            self.suma -= viejo
+            self.n -= 1
+        if valor is not None:
+            self.suma += valor
+            self.n += 1
+        self.buf[i] = valor
+
+    def agregar(self, hora, valor):
+        """Mete el valor de `hora`; devuelve False si es más vieja que la ventana actual."""
+        if self.fin is None or hora - self.fin >= self.w:
+            self.buf = [None] * self.w
+            self.suma, self.n = 0.0, 0
+        elif hora > self.fin:
+            for h in range(self.fin + 1, hora):
+                self._poner(h, None)
+        elif hora <= self.fin - self.w:
+            return False
+        self._poner(hora, valor)
+        if self.fin is None or hora > self.fin:
+            self.fin = hora
+        return True
+
+    def maximo(self):
+        vals = [v for v in self.buf if v is not None]
+        return max(vals) if vals else None
+
+    def valor(self, agregacion):
+        if self.n < minimo_horas(self.w):
+            return None
+        if agregacion == "max":
+            return self.maximo()
+        return self.suma / self.n
+
+    def fila(self, rule_id, station_id):
+        return (rule_id, station_id, _ts(self.fin), json.dumps(self.buf),
+                self.suma if self.n else None, self.n, self.maximo())
+
+
+def _semillas(cur, rangos, cols):
+    """
+    Promedios horarios de measurements_hourly para `rangos` = {station_id: (desde_h, hasta_h)}
+    (horas, hasta exclusivo). Devuelve DataFrame (station_id, hora, <cols>).
+    """
+    if not rangos:
+        return pd.DataFrame(columns=["station_id", "hora", *cols])
+    where, params = [], []
+    for sid, (desde, hasta) in rangos.items():
+        where.append("(station_id = %s AND bucket >= %s AND bucket < %s)")
+        params += [int(sid), _ts(desde), _ts(hasta)]
+    sel = ", ".join(f"{c}_sum / NULLIF({c}_n, 0) AS {c}" for c in cols)
+    cur.execute(f"SELECT station_id, bucket, {sel} FROM measurements_hourly WHERE "
+                + " OR ".join(where), params)
+    filas = [list(r.values()) if isinstance(r, dict) else r for r in cur.fetchall()]
+    df = pd.DataFrame(filas, columns=["station_id", "bucket", *cols])
+    df["hora"] = [_hora(b) for b in df["bucket"]]
+    return df.drop(columns="bucket")
+
+
+def _cargar_estados(cur, reglas, estaciones):
+    if not reglas or not estaciones:
+        return {}
+    cur.execute(ESTADOS_SQL.format(reglas=",".join(["%s"] * len(reglas)),
+                                   estaciones=",".join(["%s"] * len(estaciones))),
+                [*reglas, *estaciones])
+    estados = {}
+    for row in cur.fetchall():
+        rid, sid, end_ts, buf = row.values() if isinstance(row, dict) else row
+        estados[(rid, sid)] = (_hora(end_ts), json.loads(buf))
+    return estados
+
+
+def _sembrar_pares(cur, pares, primera_hora):
+    """
+    Ventanas iniciales para `pares` = [(regla, station_id)] con las horas de
+    measurements_hourly anteriores a primera_hora[station_id].
+    """
+    rangos, cols = {}, set()
+    for r, sid in pares:
+        desde = primera_hora[sid] - r["w"]
+        rangos[sid] = (min(desde, rangos.get(sid, (desde,))[0]), primera_hora[sid])
+        cols.add(r["col"])
+    semillas = _semillas(cur, rangos, sorted(cols)).sort_values("hora")
+    por_estacion = dict(tuple(semillas.groupby("station_id")))
+    ventanas = {}
+    for r, sid in pares:
+        v = Ventana(r["w"])
+        filas = por_estacion.get(sid)
+        if filas is not None:
+            filas = filas[filas["hora"] >= primera_hora[sid] - r["w"]]
+            for hora, val in zip(filas["hora"], filas[r["col"]]):
+                v.agregar(hora, None if pd.isna(val) else float(val))
+        ventanas[(r["rule_id"], sid)] = v
+    return ventanas
+
+
+def procesar(cur, out, reglas):
+    """
+    Pasa las filas `out` (station_id, ts, contaminantes) por las ventanas de las
+    `reglas` (DataFrame de alertas.IndiceReglas.ventanas), guarda los estados y
+    devuelve los eventos (tuplas de alertas.EVENTO_SQL). No commitea.
+    """
+    if reglas.empty or out.empty:
+        return []
+    out = out.sort_values("ts", kind="stable")
+    out = out.assign(hora=(out["ts"].astype("datetime64[ns]").astype("int64") // 3_600_000_000_000))
+    por_estacion = dict(tuple(out.groupby("station_id")))
+    primera_hora = {sid: int(g["hora"].iloc[0]) for sid, g in por_estacion.items()}
+
+    pares = []
+    for r in reglas.to_dict("records"):
+        if pd.isna(r["station_id"]):
+            sids = [sid for sid, g in por_estacion.items() if g[r["col"]].notna().any()]
+        else:
+            sids = [int(r["station_id"])] if int(r["station_id"]) in por_estacion else []
+        pares += [(r, sid) for sid in sids]
+    if not pares:
+        return []
+
+    guardados = _cargar_estados(cur, sorted({r["rule_id"] for r, _ in pares}),
+                                sorted({sid for _, sid in pares}))
+    ventanas, faltan = {}, []
+    for r, sid in pares:
+        g = guardados.get((r["rule_id"], sid))
+        if g is not None and len(g[1]) == r["w"]:
+            ventanas[(r["rule_id"], sid)] = Ventana(r["w"], g[0], g[1])
+        else:
+            faltan.append((r, sid))
+    ventanas.update(_sembrar_pares(cur, faltan, primera_hora))
+
+    eventos = []
+    for r, sid in pares:
+        v = ventanas[(r["rule_id"], sid)]
+        filas = por_estacion[sid]
+        cmp_ = _OPS[r["operator"]]
+        for hora, ts, val in zip(filas["hora"].tolist(), filas["ts"].dt.to_pydatetime(),
+                                 filas[r["col"]].tolist()):
+            if not v.agregar(hora, None if val is None or np.isnan(val) else float(val)):
+                continue
+            agg = v.valor(r["agregacion"])
+            if agg is not None and cmp_(agg, r["threshold"]):
+                fin = ts if hora == v.fin else _ts(v.fin)
+                eventos.append((r["rule_id"], sid, fin, r["pollutant"], agg, r["operator"], r["threshold"]))
+
+    filas_estado = [v.fila(rid, sid) for (rid, sid), v in ventanas.items()]
+    cur.executemany(GUARDAR_SQL.strip(), filas_estado)
+    return eventos
+
+
+def sembrar(cur, rule_id=None):
+    """
+    Crea el estado de los pares (regla con ventana, estación) que no lo tienen,
+    terminando en la última medición de la estación. Para reglas recién creadas
+    o editadas antes de que llegue la siguiente ingesta. No commitea.
+    """
+    from alertas import POLLUTANT_DB_COL
+
+    filtro, params = ("AND r.id = %s", [rule_id]) if rule_id else ("", [])
+    cur.execute(REGLAS_SIN_ESTADO_SQL.format(filtro=filtro), params)
+    pares = []
+    primera_hora = {}
+    for row in cur.fetchall():
+        rid, sid, ts, pol, w = row.values() if isinstance(row, dict) else row
+        col = POLLUTANT_DB_COL.get(pol)
+        if col is None:
+            continue
+        pares.append(({"rule_id": rid, "w": int(w), "col": col}, sid))
+        primera_hora[sid] = _hora(ts) + 1  # incluye la hora de la última medición
+    if not pares:
+        return 0
+    ventanas = _sembrar_pares(cur, pares, primera_hora)
+    filas = [v.fila(rid, sid) for (rid, sid), v in ventanas.items() if v.fin is not None]
+    if filas:
+        cur.executemany(GUARDAR_SQL.strip(), filas)
+    return len(filas)
@@ -24,8 +24,31 @@ from sklearn.model_selection import GridSearchCV, TimeSeriesSplit, train_test_sp
 from xgboost import XGBRegressor
 
 
-def cargar_y_preparar(ruta_csv: Path) -> pd.DataFrame:
-    df = pd.read_csv(ruta_csv)
+def leer_almacen(ruta: Path, estaciones=None, desde=None, hasta=None) -> pd.DataFrame:
+    """
+    Lee el almacén Parquet de PC1 (datos/estacion=.../mes=.../*.parquet) empujando los
+    filtros al lector: estaciones y meses podan carpetas, `ts` filtra dentro de cada archivo.
+    Devuelve las mismas columnas que calidad_aire.csv.
+    """
+    filtros = []
+    if estaciones:
+        filtros.append(("estacion", "in", list(estaciones)))
+    if desde is not None:
+        desde = pd.Timestamp(desde)
+        filtros += [("mes", ">=", desde.strftime("%Y-%m")), ("ts", ">=", desde.to_pydatetime())]
+    if hasta is not None:
+        hasta = pd.Timestamp(hasta)
+        filtros += [("mes", "<=", hasta.strftime("%Y-%m")), ("ts", "<=", hasta.to_pydatetime())]
+    df = pd.read_parquet(ruta, filters=filtros or None)
+    return df.drop(columns=["estacion", "mes", "ts"], errors="ignore")
+
+
+def cargar_y_preparar(ruta_csv: Path, estaciones=None, desde=None, hasta=None) -> pd.DataFrame:
+    """`ruta_csv` puede ser un CSV limpio o la carpeta del almacén Parquet (filtrable)."""
+    if Path(ruta_csv).is_dir():
+        df = leer_almacen(Path(ruta_csv), estaciones, desde, hasta)
+    else:
+        df = pd.read_csv(ruta_csv)
     df = df.rename(columns={"PM 2.5": "PM2_5", "PM 10": "PM10"})
     df["datetime"] = pd.to_datetime(df["Fecha"] + " " + df["Hora"], format="%d/%m/%Y %H:%M")
     df = df.sort_values(["Estacion", "datetime"]).reset_index(drop=True)
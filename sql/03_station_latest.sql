@@ -0,0 +1,29 @@
+-- Active: 1736532502233@@127.0.0.1@3306@senamhi
+USE senamhi;
+
+-- Última medición por estación, mantenida por el loader (subir_mysql.py) en
+-- cada lote: así /latest y las alertas no recalculan MAX(ts) sobre measurements.
+CREATE TABLE IF NOT EXISTS station_latest (
+  station_id INT NOT NULL PRIMARY KEY,
+  ts DATETIME NOT NULL,
+  pm2_5 DOUBLE NULL,
+  pm10  DOUBLE NULL,
+  so2   DOUBLE NULL,
+  no2   DOUBLE NULL,
+  o3    DOUBLE NULL,
+  co    DOUBLE NULL,
+  updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  CONSTRAINT fk_latest_station FOREIGN KEY (station_id)
+    REFERENCES stations(id) ON DELETE CASCADE ON UPDATE CASCADE
+) ENGINE=InnoDB;
+
+-- Carga inicial (lo mismo que `python subir_mysql.py --rebuild-latest`)
+INSERT INTO station_latest (station_id, ts, pm2_5, pm10, so2, no2, o3, co)
+SELECT m.station_id, m.ts, m.pm2_5, m.pm10, m.so2, m.no2, m.o3, m.co
+FROM measurements m
+JOIN (
+  SELECT station_id, MAX(ts) AS mx FROM measurements GROUP BY station_id
+) t ON t.station_id = m.station_id AND t.mx = m.ts
+ON DUPLICATE KEY UPDATE
+  pm2_5=VALUES(pm2_5), pm10=VALUES(pm10), so2=VALUES(so2),
+  no2=VALUES(no2), o3=VALUES(o3), co=VALUES(co), ts=VALUES(ts);
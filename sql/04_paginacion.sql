@@ -0,0 +1,16 @@
+-- Active: 1736532502233@@127.0.0.1@3306@senamhi
+USE senamhi;
+
+-- Índices para la paginación por cursor (keyset) de la API:
+--   /v1/measurements          ORDER BY ts, station_id  -> idx_ts_station
+--   /v1/stations/<id>/...     ORDER BY ts (por estación) -> uq_station_ts (ya existe)
+--   /v1/alerts/events         ORDER BY ts DESC, id DESC -> idx_events_ts_id
+-- idx_ts queda cubierto por el prefijo de idx_ts_station.
+ALTER TABLE measurements
+  ADD KEY idx_ts_station (ts, station_id),
+  DROP KEY idx_ts;
+
+-- En InnoDB la PK va implícita al final de cada índice secundario, así que
+-- idx_station_ts ya sirve (station_id, ts, id) para el filtro por estación.
+ALTER TABLE alert_events
+  ADD KEY idx_events_ts_id (ts, id);
@@ -0,0 +1,26 @@
+-- Active: 1736532502233@@127.0.0.1@3306@senamhi
+USE senamhi;
+
+-- Rollups por estación y bucket (hora / día / mes) para /v1/aggregates.
+-- Se guardan suma, conteo, mínimo y máximo de cada contaminante, así el
+-- promedio de un bucket mayor sale de sumar los menores (sum/n) sin volver a
+-- measurements. Los mantiene el loader (subir_mysql.py) para los buckets que
+-- toca cada lote; la carga inicial es `python agregados.py --backfill`.
+CREATE TABLE IF NOT EXISTS measurements_hourly (
+  station_id INT NOT NULL,
+  bucket DATETIME NOT NULL,
+  pm2_5_sum DOUBLE NULL, pm2_5_n INT NOT NULL DEFAULT 0, pm2_5_min DOUBLE NULL, pm2_5_max DOUBLE NULL,
+  pm10_sum  DOUBLE NULL, pm10_n  INT NOT NULL DEFAULT 0, pm10_min  DOUBLE NULL, pm10_max  DOUBLE NULL,
+  so2_sum   DOUBLE NULL, so2_n   INT NOT NULL DEFAULT 0, so2_min   DOUBLE NULL, so2_max   DOUBLE NULL,
+  no2_sum   DOUBLE NULL, no2_n   INT NOT NULL DEFAULT 0, no2_min   DOUBLE NULL, no2_max   DOUBLE NULL,
+  o3_sum    DOUBLE NULL, o3_n    INT NOT NULL DEFAULT 0, o3_min    DOUBLE NULL, o3_max    DOUBLE NULL,
+  co_sum    DOUBLE NULL, co_n    INT NOT NULL DEFAULT 0, co_min    DOUBLE NULL, co_max    DOUBLE NULL,
+  PRIMARY KEY (station_id, bucket),
+  CONSTRAINT fk_hourly_station FOREIGN KEY (station_id)
+    REFERENCES stations(id) ON DELETE CASCADE ON UPDATE CASCADE
+) ENGINE=InnoDB;
+
+-- bucket = medianoche del día (LIKE copia columnas e índices, no la FK)
+CREATE TABLE IF NOT EXISTS measurements_daily LIKE measurements_hourly;
+-- bucket = día 1 del mes
+CREATE TABLE IF NOT EXISTS measurements_monthly LIKE measurements_hourly;
@@ -0,0 +1,13 @@
+-- Active: 1736532502233@@127.0.0.1@3306@senamhi
+USE senamhi;
+
+-- Contador de versión de datos: el loader lo incrementa en la transacción de
+-- cada lote y la API (response_cache.py) lo lee cada pocos segundos para
+-- invalidar las respuestas cacheadas.
+CREATE TABLE IF NOT EXISTS data_version (
+  id TINYINT NOT NULL PRIMARY KEY,
+  version BIGINT NOT NULL DEFAULT 0,
+  updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB;
+
+INSERT IGNORE INTO data_version (id, version) VALUES (1, 0);
@@ -0,0 +1,33 @@
+-- Active: 1736532502233@@127.0.0.1@3306@senamhi
+USE senamhi;
+
+-- Reglas con ventana móvil (ver PC2/ventanas.py): time_window sigue siendo el
+-- texto que manda el cliente ('8h', '1d'); window_hours es su valor en horas
+-- (NULL o 1 = instantánea) y aggregation cómo se resume la ventana.
+ALTER TABLE alert_rules
+  ADD COLUMN window_hours INT NULL AFTER time_window,
+  ADD COLUMN aggregation VARCHAR(4) NOT NULL DEFAULT 'avg' AFTER window_hours; /* avg|max */
+
+UPDATE alert_rules
+SET window_hours = CAST(REGEXP_SUBSTR(time_window, '[0-9]+') AS UNSIGNED)
+                   * IF(LOWER(TRIM(time_window)) LIKE '%d', 24, 1)
+WHERE TRIM(time_window) REGEXP '^[0-9]+[hHdD]$';
+
+-- Estado incremental por (regla, estación): buffer circular de window_hours
+-- valores horarios (la hora h va en la posición h % window_hours), con su suma,
+-- conteo de no nulos y máximo; end_ts es la hora más reciente que entró.
+CREATE TABLE IF NOT EXISTS alert_window_state (
+  rule_id INT NOT NULL,
+  station_id INT NOT NULL,
+  end_ts DATETIME NOT NULL,
+  buf JSON NOT NULL,
+  sum_val DOUBLE NULL,
+  n INT NOT NULL DEFAULT 0,
+  max_val DOUBLE NULL,
+  updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (rule_id, station_id),
+  CONSTRAINT fk_window_rule FOREIGN KEY (rule_id)
+    REFERENCES alert_rules(id) ON DELETE CASCADE ON UPDATE CASCADE,
+  CONSTRAINT fk_window_station FOREIGN KEY (station_id)
+    REFERENCES stations(id) ON DELETE CASCADE ON UPDATE CASCADE
+) ENGINE=InnoDB;
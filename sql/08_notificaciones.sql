@@ -0,0 +1,52 @@
+-- Active: 1736532502233@@127.0.0.1@3306@senamhi
+USE senamhi;
+
+-- Suscriptores de webhooks: reciben los alert_events nuevos que cumplan sus
+-- filtros (NULL = todos). Ver PC2/notificaciones.py.
+CREATE TABLE IF NOT EXISTS alert_subscribers (
+  id INT AUTO_INCREMENT PRIMARY KEY,
+  name VARCHAR(120) NOT NULL,
+  url VARCHAR(500) NOT NULL,
+  secret VARCHAR(200) NULL,            /* firma HMAC-SHA256 en X-Signature */
+  rule_id INT NULL,
+  station_id INT NULL,
+  enabled TINYINT(1) NOT NULL DEFAULT 1,
+  created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  CONSTRAINT fk_subs_rule FOREIGN KEY (rule_id)
+    REFERENCES alert_rules(id) ON DELETE CASCADE ON UPDATE CASCADE,
+  CONSTRAINT fk_subs_station FOREIGN KEY (station_id)
+    REFERENCES stations(id) ON DELETE CASCADE ON UPDATE CASCADE
+) ENGINE=InnoDB;
+
+-- Outbox persistente: una fila por (suscriptor, evento). Se entrega al menos
+-- una vez: el despachador "toma" filas corriendo next_attempt_at hacia adelante
+-- (si se cae, vuelven a quedar pendientes) y las marca sent al recibir 2xx.
+CREATE TABLE IF NOT EXISTS alert_outbox (
+  id BIGINT AUTO_INCREMENT PRIMARY KEY,
+  subscriber_id INT NOT NULL,
+  event_id BIGINT NOT NULL,
+  status VARCHAR(8) NOT NULL DEFAULT 'pending',   /* pending|sent|failed */
+  attempts INT NOT NULL DEFAULT 0,
+  next_attempt_at DATETIME(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+  last_error VARCHAR(300) NULL,
+  created_at DATETIME(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+  sent_at DATETIME(3) NULL,
+  UNIQUE KEY uq_outbox_sub_event (subscriber_id, event_id),
+  KEY idx_outbox_due (status, next_attempt_at),
+  CONSTRAINT fk_outbox_sub FOREIGN KEY (subscriber_id)
+    REFERENCES alert_subscribers(id) ON DELETE CASCADE ON UPDATE CASCADE,
+  CONSTRAINT fk_outbox_event FOREIGN KEY (event_id)
+    REFERENCES alert_events(id) ON DELETE CASCADE ON UPDATE CASCADE
+) ENGINE=InnoDB;
+
+-- Hasta qué alert_events.id ya se pasó al outbox. El despachador la lee con
+-- FOR UPDATE y la avanza en la misma transacción que el INSERT IGNORE, así un
+-- evento creado con el despachador detenido se encola cuando vuelve.
+CREATE TABLE IF NOT EXISTS alert_outbox_mark (
+  id TINYINT PRIMARY KEY,
+  last_event_id BIGINT NOT NULL DEFAULT 0
+) ENGINE=InnoDB;
+
+-- se arranca desde los eventos existentes: el historial no se notifica
+INSERT IGNORE INTO alert_outbox_mark (id, last_event_id)
+SELECT 1, COALESCE(MAX(id), 0) FROM alert_events;
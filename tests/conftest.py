@@ -0,0 +1,78 @@
+# tests/conftest.py
+"""
+Los módulos de PC1/ y PC2/ son scripts planos que se importan entre hermanos
+(`import almacen_parquet`, `from alertas import ...`); aquí se ponen ambas
+carpetas en sys.path para importarlos igual que cuando se corren desde ahí.
+"""
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+RAIZ = Path(__file__).resolve().parents[1]
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+
+for carpeta in ("PC1", "PC2"):
+    ruta = str(RAIZ / carpeta)
+    if ruta not in sys.path:
+        sys.path.insert(0, ruta)
+
+
+class _Servidor:
+    """
+    Servidor HTTP en 127.0.0.1 con respuestas fijas por ruta; anota cada pedido
+    (`pedidos`: rutas de los GET, `posts`: (ruta, headers, cuerpo) de los POST).
+    """
+
+    def __init__(self, rutas):
+        self.rutas = rutas  # {ruta: bytes | callable(ruta) -> (status, bytes)}
+        self.pedidos = []
+        self.posts = []
+        servidor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                servidor.pedidos.append(self.path)
+                self._responder()
+
+            def do_POST(self):
+                cuerpo = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                servidor.posts.append((self.path, dict(self.headers), cuerpo))
+                self._responder()
+
+            def _responder(self):
+                r = servidor.rutas.get(self.path)
+                status, cuerpo = (r(self.path) if callable(r) else (200, r)) if r is not None else (404, b"")
+                self.send_response(status)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(cuerpo)))
+                self.end_headers()
+                self.wfile.write(cuerpo)
+
+            def log_message(self, *args):
+                pass
+
+        self.srv = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.srv.server_port}"
+        threading.Thread(target=self.srv.serve_forever, daemon=True).start()
+
+    def cerrar(self):
+        self.srv.shutdown()
+        self.srv.server_close()
+
+
+@pytest.fixture
+def servidor():
+    """Fábrica de servidores locales; se apagan al terminar el test."""
+    abiertos = []
+
+    def crear(rutas):
+        s = _Servidor(rutas)
+        abiertos.append(s)
+        return s
+
+    yield crear
+    for s in abiertos:
+        s.cerrar()
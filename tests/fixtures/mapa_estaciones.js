@@ -0,0 +1,10 @@
+// estaciones del mapa de calidad del aire (copia reducida)
+var mapa = L.map('map').setView([-12.05, -77.03], 11);
+L.marker([-12.0237, -76.9208]).addTo(mapa).bindPopup("<div class=\"content\">\n  <input type=\"radio\" name=\"tabs\" id=\"tab-1\" checked>\n  <label for=\"tab-1\">Estaci\u00f3n</label>\n  <div class=\"content-1\">\n    <table class=\"info\">\n      <tr><td><b>Estaci\u00f3n:</b></td><td>PARIACHI</td></tr>\n      <tr><td><b>Distrito:</b></td><td>Ate</td></tr>\n      <tr><td><b>Altitud:</b></td><td>474 m s.n.m.</td></tr>\n    </table>\n  </div>\n  <input type=\"radio\" name=\"tabs\" id=\"tab-3\">\n  <label for=\"tab-3\">Datos</label>\n  <div class=\"content-2\">\n    <table class=\"datos\">\n      <thead>\n        <tr><th>Fecha</th><th>Hora</th><th>PM 2,5</th><th>PM 10</th><th>SO2</th><th>NO2</th><th>O3</th><th>CO</th></tr>\n      </thead>\n      <tbody>\n        <tr><td>03/10/2025</td><td>18:00</td><td>20,75</td><td>31,59</td><td>13,67</td><td>108,79</td><td>4,20</td><td>3.501,75</td></tr>\n        <tr><td>03/10/2025</td><td>17:00</td><td>17,71</td><td>30,93</td><td>14,02</td><td>110,44</td><td>6,69</td><td>3.474,15</td></tr>\n        <tr><td>03/10/2025</td><td>16:00</td><td><span class=\"v\">27,49</span></td><td>47,57</td><td>S/D</td><td>108,89</td><td>10,79</td><td></td></tr>\n        <tr><td></td><td></td><td></td><td></td><td></td><td></td><td></td><td></td></tr>\n        <tr><td>03/10/2025</td><td>15:00</td><td>23,65</td><td>47,77</td></tr>\n      </tbody>\n    </table>\n  </div>\n</div>\n");
+L.marker([-12.1086, -76.9997]).addTo(mapa).bindPopup('<div class="content"><div class="content-1"><table><tr><td><b>Estaci\u00f3n:</b></td><td>SAN BORJA</td></tr></table></div><div class="content-2"><table><tbody><tr><td>03/10/2025</td><td>18:00</td><td>12,4</td><td>25,0</td><td>1,8</td><td>14,2</td><td>18,9</td><td>501,0</td></tr></tbody></table></div></div>');
+L.marker([-12.0700, -77.0433]).addTo(mapa).on('click', function (e) {
+  var m = e.target;
+  $.get("popup.php?id=3", function (html) { m.bindPopup(html).openPopup(); });
+});
+L.marker([-12.0, -77.0]).addTo(mapa).bindPopup("<b>Estaci\u00f3n en mantenimiento</b>");
+L.tileLayer('https://tile.openstreetmap.org/{z}/{x}/{y}.png').addTo(mapa);
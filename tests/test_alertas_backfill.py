@@ -0,0 +1,170 @@
+"""
+alertas.backfill sobre SQLite en memoria (measurements y alert_rules) detrás de
+un cursor que anota cada tramo leído y hace el upsert de EVENTO_SQL en un dict:
+reglas instantáneas y de ventana, ventanas que cruzan el borde de un tramo y
+re-ejecuciones idempotentes.
+"""
+import sqlite3
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+
+import alertas
+
+sqlite3.register_adapter(datetime, lambda d: d.strftime("%Y-%m-%d %H:%M:%S"))
+sqlite3.register_converter("DATETIME", lambda b: datetime.fromisoformat(b.decode()))
+
+ESQUEMA = """
+CREATE TABLE measurements (station_id INT, ts DATETIME, pm2_5 REAL, pm10 REAL, so2 REAL,
+                           no2 REAL, o3 REAL, co REAL, PRIMARY KEY (station_id, ts));
+CREATE TABLE alert_rules (id INT PRIMARY KEY, station_id INT, pollutant TEXT, operator TEXT,
+                          threshold REAL, window_hours INT, aggregation TEXT, enabled INT DEFAULT 1);
+"""
+
+
+class Cursor:
+    """Cursor mysql-connector (tuplas) sobre SQLite; EVENTO_SQL va a `eventos` (upsert)."""
+
+    def __init__(self, db):
+        self.db, self.c = db, None
+        self.tramos = []  # (desde, hasta) de cada TRAMO_SQL
+        self.eventos = {}  # (rule_id, station_id, ts) -> fila
+
+    def execute(self, sql, params=()):
+        if "FROM measurements\nWHERE ts >=" in sql:
+            self.tramos.append(tuple(params[:2]))
+        self.c = self.db.execute(sql.replace("%s", "?"), tuple(params))
+
+    def executemany(self, sql, filas):
+        assert sql == alertas.EVENTO_SQL.strip()
+        for f in filas:
+            self.eventos[f[:3]] = f
+
+    def fetchone(self):
+        return self.c.fetchone()
+
+    def fetchall(self):
+        return self.c.fetchall()
+
+
+class Conexion:
+    def __init__(self):
+        self.commits = 0
+
+    def commit(self):
+        self.commits += 1
+
+
+def _db(valores, reglas):
+    """valores: {(station_id, ts): {col: v}}; el resto de columnas queda NULL."""
+    db = sqlite3.connect(":memory:", detect_types=sqlite3.PARSE_DECLTYPES)
+    db.executescript(ESQUEMA)
+    cols = list(alertas.POLLUTANT_DB_COL.values())
+    db.executemany("INSERT INTO measurements VALUES (?,?,?,?,?,?,?,?)",
+                   [(sid, ts, *[v.get(c) for c in cols]) for (sid, ts), v in valores.items()])
+    db.executemany("INSERT INTO alert_rules (id, station_id, pollutant, operator, threshold, "
+                   "window_hours, aggregation) VALUES (?,?,?,?,?,?,?)", reglas)
+    return db
+
+
+def _horas(desde, n):
+    return [desde + timedelta(hours=h) for h in range(n)]
+
+
+def _backfill(db, **kw):
+    cur = Cursor(db)
+    res = alertas.backfill(Conexion(), cur, **kw)
+    return res, cur
+
+
+def test_tramos_instantaneos_no_releen_desde_el_principio():
+    # 2022-2024, una medición diaria: solo reglas instantáneas (w_max = 0)
+    t0 = datetime(2022, 1, 1)
+    valores = {(1, t0 + timedelta(days=d)): {"pm2_5": 80.0 if d % 100 == 0 else 10.0}
+               for d in range(3 * 365)}
+    db = _db(valores, [(1, None, "pm25", "gt", 50.0, None, None)])
+    res, cur = _backfill(db, dias=31)
+
+    assert len(cur.tramos) == 36
+    assert cur.tramos[0][0] == t0
+    # cada tramo empieza donde terminó el anterior
+    assert all(a == b_prev for (a, _), (_, b_prev) in zip(cur.tramos[1:], cur.tramos))
+    assert res["filas"] == len(valores)
+    assert sorted(ts for _, _, ts in cur.eventos) == [t0 + timedelta(days=d) for d in range(0, 3 * 365, 100)]
+
+
+def test_regla_instantanea_de_una_estacion():
+    t0 = datetime(2025, 1, 1)
+    valores = {(sid, ts): {"pm10": 150.0 if ts.hour == 5 else 20.0}
+               for sid in (1, 2) for ts in _horas(t0, 48)}
+    db = _db(valores, [(7, 2, "PM10", "GE", 150.0, 1, None)])
+    res, cur = _backfill(db, dias=1)
+    assert sorted((r, s, ts) for r, s, ts in cur.eventos) == [
+        (7, 2, datetime(2025, 1, 1, 5)), (7, 2, datetime(2025, 1, 2, 5))]
+    assert res["por_estacion"] == {2: 2} and res["por_regla"] == {7: 2}
+    # solo se leyó la estación de la regla
+    assert res["filas"] == 48
+
+
+def _valores_borde():
+    # 3 horas altas que terminan a las 00:00 del 2 de enero: solo la ventana de
+    # 3 h que cierra en esa hora (que mira al tramo anterior) supera 50 de promedio
+    t0 = datetime(2025, 1, 1)
+    altas = {datetime(2025, 1, 1, 22), datetime(2025, 1, 1, 23), datetime(2025, 1, 2, 0)}
+    return {(1, ts): {"pm2_5": 60.0 if ts in altas else 10.0, "o3": 30.0} for ts in _horas(t0, 72)}
+
+
+@pytest.mark.parametrize("dias", [1, 2, 365])
+def test_ventana_que_cruza_el_borde_del_tramo(dias):
+    db = _db(_valores_borde(), [(3, None, "pm25", "gt", 50.0, 3, "avg")])
+    res, cur = _backfill(db, dias=dias)
+    assert list(cur.eventos) == [(3, 1, datetime(2025, 1, 2, 0))]
+    assert cur.eventos[(3, 1, datetime(2025, 1, 2, 0))][4] == pytest.approx(60.0)
+    assert res["filas"] == 72
+
+
+def test_ventana_max_y_cobertura_minima():
+    t0 = datetime(2025, 1, 1)
+    valores = {(1, ts): {"o3": 100.0 if ts.hour == 12 else 10.0} for ts in _horas(t0, 24)}
+    del valores[(1, datetime(2025, 1, 1, 14))]  # hueco: 14-15 no llega al 75% de 4 h
+    del valores[(1, datetime(2025, 1, 1, 15))]
+    db = _db(valores, [(4, None, "o3", "ge", 100.0, 4, "max")])
+    _, cur = _backfill(db, dias=1)
+    # el máximo de 100 sigue en la ventana 12..15 pero 14 y 15 no tienen 3 de 4 horas
+    assert sorted(ts for _, _, ts in cur.eventos) == [datetime(2025, 1, 1, 12), datetime(2025, 1, 1, 13)]
+
+
+def test_desde_mira_hacia_atras_para_la_primera_ventana():
+    db = _db(_valores_borde(), [(3, None, "pm25", "gt", 50.0, 3, "avg")])
+    res, cur = _backfill(db, desde="2025-01-02", dias=1)
+    assert cur.tramos[0][0] == datetime(2025, 1, 1, 21)
+    assert list(cur.eventos) == [(3, 1, datetime(2025, 1, 2, 0))]
+    assert res["filas"] == 48
+
+
+def test_repetir_el_backfill_no_duplica():
+    db = _db(_valores_borde(), [(3, None, "pm25", "gt", 50.0, 3, "avg"),
+                                (5, 1, "pm25", "gt", 55.0, None, None)])
+    res1, cur = _backfill(db, dias=1)
+    antes = dict(cur.eventos)
+    res2 = alertas.backfill(Conexion(), cur, dias=1)
+    assert cur.eventos == antes and len(antes) == 4
+    assert res1["eventos"] == res2["eventos"] == 4
+
+
+def test_sin_escribir_solo_cuenta():
+    db = _db(_valores_borde(), [(3, None, "pm25", "gt", 50.0, 3, "avg")])
+    cn, cur = Conexion(), Cursor(db)
+    res = alertas.backfill(cn, cur, [3], dias=1, escribir=False)
+    assert res["eventos"] == 1 and cur.eventos == {} and cn.commits == 0
+
+
+def test_ventanas_historicas_filtra_por_desde_y_estacion():
+    df = pd.DataFrame({"station_id": [1] * 4 + [2] * 4,
+                       "ts": pd.to_datetime(_horas(datetime(2025, 1, 1), 4) * 2),
+                       "pm2_5": [60.0] * 8})
+    reglas = alertas.IndiceReglas([(9, 2, "pm25", "gt", 50.0, 2, "avg")]).ventanas
+    ev = alertas._ventanas_historicas(df, reglas, pd.Timestamp("2025-01-01 02:00"))
+    assert [(r, s, ts) for r, s, ts, *_ in ev] == [
+        (9, 2, datetime(2025, 1, 1, 2)), (9, 2, datetime(2025, 1, 1, 3))]
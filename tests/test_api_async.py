@@ -0,0 +1,292 @@
+"""
+app.py (Flask) y app_async.py (Starlette) contra la misma base: SQLite en
+memoria detrás de pools falsos con la interfaz de mysql-connector y de aiomysql.
+Las respuestas de lectura deben ser idénticas byte a byte (mismas ETags).
+"""
+import asyncio
+import re
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("mysql.connector")
+pytest.importorskip("starlette")
+pytest.importorskip("aiomysql")
+pytest.importorskip("httpx")
+
+from starlette.testclient import TestClient  # noqa: E402
+
+sqlite3.register_adapter(datetime, lambda d: d.strftime("%Y-%m-%d %H:%M:%S"))
+sqlite3.register_converter("DATETIME", lambda b: datetime.fromisoformat(b.decode()))
+
+ESQUEMA = """
+CREATE TABLE stations (id INTEGER PRIMARY KEY, name TEXT);
+CREATE TABLE measurements (station_id INT, ts DATETIME, pm2_5 REAL, pm10 REAL, so2 REAL,
+                           no2 REAL, o3 REAL, co REAL, PRIMARY KEY (station_id, ts));
+CREATE TABLE station_latest (station_id INT PRIMARY KEY, ts DATETIME, pm2_5 REAL, pm10 REAL,
+                             so2 REAL, no2 REAL, o3 REAL, co REAL);
+CREATE TABLE data_version (id INT PRIMARY KEY, version INT);
+"""
+POLS = ("pm2_5", "pm10", "so2", "no2", "o3", "co")
+
+
+def _base():
+    db = sqlite3.connect(":memory:", detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+    db.executescript(ESQUEMA)
+    rollup = ", ".join(f"{c}_sum REAL, {c}_n INT, {c}_min REAL, {c}_max REAL" for c in POLS)
+    for t in ("hourly", "daily", "monthly"):
+        db.execute(f"CREATE TABLE measurements_{t} (station_id INT, bucket DATETIME, {rollup})")
+    db.executemany("INSERT INTO stations VALUES (?, ?)", [(1, "CAMPO DE MARTE"), (2, "ÑAÑA")])
+    t0 = datetime(2025, 10, 1)
+    for sid in (1, 2):
+        for h in range(30):
+            vals = [None if (h + i) % 7 == 0 else round(10 + sid * h * 0.5 + i, 2) for i in range(6)]
+            db.execute("INSERT INTO measurements VALUES (?,?,?,?,?,?,?,?)", (sid, t0 + timedelta(hours=h), *vals))
+            fila = [x for v in vals for x in (v, int(v is not None), v, v)]
+            db.execute(f"INSERT INTO measurements_hourly VALUES (?,?,{','.join('?' * 24)})",
+                       (sid, t0 + timedelta(hours=h), *fila))
+        db.execute("INSERT INTO station_latest SELECT * FROM measurements WHERE station_id=? "
+                   "ORDER BY ts DESC LIMIT 1", (sid,))
+    db.execute("INSERT INTO data_version VALUES (1, 1)")
+    return db
+
+
+def _sqlite(sql):
+    return re.sub(r"%s", "?", sql)
+
+
+class _Cursor:
+    """mysql-connector: cursor(dictionary=True) y context manager."""
+
+    def __init__(self, db, dictionary):
+        self.db, self.dictionary, self.c = db, dictionary, None
+
+    def execute(self, sql, params=()):
+        self.c = self.db.execute(_sqlite(sql), tuple(params))
+
+    def _fila(self, r):
+        return dict(zip([d[0] for d in self.c.description], r)) if self.dictionary else r
+
+    def fetchone(self):
+        r = self.c.fetchone()
+        return None if r is None else self._fila(r)
+
+    def fetchall(self):
+        return [self._fila(r) for r in self.c.fetchall()]
+
+    def fetchmany(self, n):
+        return [self._fila(r) for r in self.c.fetchmany(n)]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *a):
+        pass
+
+
+class _Conn:
+    def __init__(self, db, eventos=None):
+        self.db = db
+        self.eventos = eventos if eventos is not None else []
+
+    def cursor(self, dictionary=False, buffered=None):
+        return _Cursor(self.db, dictionary)
+
+    def consume_results(self):
+        self.eventos.append("consume_results")
+
+    def shutdown(self):
+        self.eventos.append("shutdown")
+
+    def commit(self):
+        pass
+
+    def close(self):
+        self.eventos.append("close")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *a):
+        pass
+
+
+class _Pool:
+    def __init__(self, *a, **k):
+        self.db = None
+        self.eventos = []
+
+    def get_connection(self):
+        return _Conn(self.db, self.eventos)
+
+
+class _ACursor:
+    """aiomysql: DictCursor/SSDictCursor con execute/fetch* como corutinas."""
+
+    def __init__(self, conn):
+        self.conn, self.cur = conn, _Cursor(conn.db, True)
+
+    async def execute(self, sql, params=()):
+        await asyncio.sleep(self.conn.demora)
+        self.cur.execute(sql, params)
+
+    async def fetchall(self):
+        return self.cur.fetchall()
+
+    async def fetchmany(self, n):
+        return self.cur.fetchmany(n)
+
+    async def close(self):
+        pass
+
+
+class _AConn:
+    def __init__(self, db, demora):
+        self.db, self.demora, self.closed = db, demora, False
+
+    async def cursor(self, cls=None):
+        return _ACursor(self)
+
+    def close(self):
+        self.closed = True
+
+
+class _APool:
+    def __init__(self, db, demora=0.0):
+        self.db, self.demora = db, demora
+        self.libres, self.liberadas = [], []
+
+    async def acquire(self):
+        return self.libres.pop() if self.libres else _AConn(self.db, self.demora)
+
+    def release(self, cn):
+        self.liberadas.append(cn)
+        if not cn.closed:
+            self.libres.append(cn)
+
+
+@pytest.fixture(scope="module")
+def apps():
+    import mysql.connector.pooling
+
+    real = mysql.connector.pooling.MySQLConnectionPool
+    mysql.connector.pooling.MySQLConnectionPool = _Pool
+    try:
+        import app as flask_api
+        import app_async
+    finally:
+        mysql.connector.pooling.MySQLConnectionPool = real
+    db = _base()
+    flask_api.POOL.db = db
+    app_async.POOL = _APool(db)
+    return flask_api, app_async, db
+
+
+URLS = [
+    "/v1/stations",
+    "/v1/stations?q=campo&limit=1",
+    "/v1/stations/2",
+    "/v1/stations/99",
+    "/v1/stations/1/latest?tz=UTC",
+    "/v1/measurements/latest",
+    "/v1/stations/1/measurements?limit=5&order=desc",
+    "/v1/stations/2/measurements?start=2025-10-01T05:00:00-05:00&fields=pm25,o3&limit=4",
+    "/v1/measurements?station_id=1&station_id=2&limit=7",
+    "/v1/measurements?station_name=ÑAÑA&end=2025-10-01T03:00:00&order=desc",
+    "/v1/measurements?station_id=x",
+    "/v1/measurements?cursor=basura",
+    "/v1/aggregates/hourly?station_id=1&agg=max&start=2025-10-01T10:30:00",
+    "/v1/aggregates/daily?station_id=2",
+    "/v1/aggregates/daily",
+    "/v1/export/csv?station_id=1",
+]
+
+
+@pytest.mark.parametrize("url", URLS)
+def test_mismas_respuestas(apps, url):
+    flask_api, app_async, _ = apps
+    a = flask_api.app.test_client().get(url)
+    b = TestClient(app_async.app).get(url)
+    assert a.status_code == b.status_code
+    assert a.data == b.content
+    assert a.headers.get("ETag") == b.headers.get("etag")
+
+
+def test_cursor_recorre_lo_mismo(apps):
+    flask_api, app_async, _ = apps
+    cliente = TestClient(app_async.app)
+    vistos, url = [], "/v1/measurements?limit=8&order=desc"
+    while url:
+        r = cliente.get(url).json()
+        vistos += [(i["station_id"], i["ts"]) for i in r["items"]]
+        url = r["next_cursor"] and f"/v1/measurements?limit=8&order=desc&cursor={r['next_cursor']}"
+    assert len(vistos) == len(set(vistos)) == 60
+    assert vistos == sorted(vistos, key=lambda x: (x[1], x[0]), reverse=True)
+
+
+def test_timeout_cierra_la_conexion_y_responde_504(apps, monkeypatch):
+    _, app_async, db = apps
+    pool = _APool(db, demora=0.5)
+    monkeypatch.setattr(app_async, "POOL", pool)
+    monkeypatch.setattr(app_async, "QUERY_TIMEOUT", 0.05)
+    r = TestClient(app_async.app).get("/v1/stations/1/measurements?limit=3")
+    assert r.status_code == 504
+    assert r.json() == {"error": "GatewayTimeout", "message": "Query timed out"}
+    # la conexión cortada a mitad no vuelve al pool
+    assert [c.closed for c in pool.liberadas] == [True]
+    assert pool.libres == []
+
+
+def test_export_completo_devuelve_la_conexion_al_pool(apps):
+    flask_api, _, _ = apps
+    flask_api.POOL.eventos.clear()
+    r = flask_api.app.test_client().get("/v1/export/csv?station_id=1")
+    assert r.status_code == 200 and r.data.count(b"\n") == 31
+    assert flask_api.POOL.eventos == ["close"]
+
+
+def test_export_cortado_cierra_sin_drenar(apps, monkeypatch):
+    flask_api, _, _ = apps
+    monkeypatch.setattr(flask_api, "EXPORT_LOTE", 5)
+    flask_api.POOL.eventos.clear()
+    r = flask_api.app.test_client().get("/v1/export/csv", buffered=False)
+    partes = iter(r.response)
+    next(partes)  # cabecera
+    next(partes)  # primer lote de 5 filas
+    r.close()     # el cliente corta
+    assert flask_api.POOL.eventos == ["shutdown", "close"]
+
+
+@pytest.fixture
+def backfill_falso(apps, monkeypatch):
+    flask_api, _, _ = apps
+    llamadas = []
+
+    def backfill(cn, cur, ids, desde, hasta, escribir=True):
+        llamadas.append((ids, desde, hasta, escribir))
+        return {"rules": ids or [1], "desde": desde, "hasta": hasta, "filas": 0, "eventos": 0,
+                "por_estacion": {}, "por_regla": {}, "segundos": 0.0}
+
+    monkeypatch.setattr(flask_api, "backfill", backfill)
+    return flask_api.app.test_client(), llamadas
+
+
+def test_backfill_pasa_las_fechas_en_hora_local(backfill_falso):
+    cliente, llamadas = backfill_falso
+    r = cliente.post("/v1/alerts/backfill", json={"rule_ids": [3], "start": "2025-10-01T05:00:00Z",
+                                                  "end": "2025-10-02T00:00:00-05:00", "write": False})
+    assert r.status_code == 200 and r.get_json()["written"] is False
+    assert llamadas == [([3], "2025-10-01 00:00:00", "2025-10-02 00:00:00", False)]
+
+
+@pytest.mark.parametrize("body", [{"write": "false"}, {"write": 0}, {"start": "ayer"}, {"end": 20251001}])
+def test_backfill_rechaza_parametros_invalidos(backfill_falso, body):
+    cliente, llamadas = backfill_falso
+    r = cliente.post("/v1/alerts/backfill", json=body)
+    assert r.status_code == 400 and r.get_json()["error"] == "BadRequest"
+    assert llamadas == []
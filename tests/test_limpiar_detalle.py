@@ -0,0 +1,111 @@
+"""
+Paridad de la limpieza vectorizada (limpiar_columna / normalizar_texto) con las
+funciones por celda de siempre (normalize_str → limpiar_valor → to_float), celda
+a celda y sobre un CSV crudo grabado en tests/fixtures/detalle_crudo.csv
+(muestra del CSV real más filas con los casos raros vistos).
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+import limpiar_detalle as L  # noqa: E402
+from conftest import FIXTURES  # noqa: E402
+
+CRUDO = FIXTURES / "detalle_crudo.csv"
+
+
+def _por_celda(s):
+    return s.map(L.normalize_str).map(L.limpiar_valor).map(L.to_float)
+
+
+def _limpiar_por_celda(df):
+    """limpiar() tal como era antes de vectorizar: todo con .map por celda."""
+    rename = {c: c.replace("PM 2,5", "PM 2.5") for c in df.columns if "PM 2,5" in c}
+    df = df.rename(columns=rename)
+    for c in ["Estacion", "Fecha", "Hora"]:
+        df[c] = df[c].map(L.normalize_str)
+    for c in L.POLS:
+        df[c] = _por_celda(df[c])
+    df = df.drop_duplicates(subset=["Estacion", "Fecha", "Hora"], keep="last")
+    df = df[~df[L.POLS].isna().all(axis=1)].copy()
+    for c in L.POLS:
+        df.loc[df[c] < 0, c] = np.nan
+    return df.sort_values(by=["Estacion", "Fecha", "Hora"]).reset_index(drop=True)
+
+
+def _iguales(a, b):
+    a, b = pd.Series(a, dtype="float64"), pd.Series(b, dtype="float64")
+    return bool(((a == b) | (a.isna() & b.isna())).all())
+
+
+EXTRA = ["١٢,٥", "٣.٥", "1_000", "nan", "-0,1", "1.234.567,8", "1.000", "  ", "\t2,5\n",
+         "12,3456", "1,2,3", "١,٢٣٤.٥", "½"]
+
+
+@pytest.mark.parametrize("valor", L.MUESTRAS + EXTRA)
+def test_celda_igual_a_la_version_por_celda(valor):
+    s = pd.Series([valor], dtype=object)
+    assert _iguales(L.limpiar_columna(s), _por_celda(s)), valor
+
+
+def test_columna_aleatoria():
+    s = L._valores_aleatorios(20000, seed=7)
+    assert _iguales(L.limpiar_columna(s), _por_celda(s))
+
+
+@pytest.mark.parametrize("s", [
+    pd.Series([1.5, -2.0, np.nan]),
+    pd.Series([1, 2, 3]),
+    pd.Series(["1,5", 2.0, None, "x"], dtype=object),   # mezclada: cae a por celda
+    pd.Series([None, None], dtype=object),
+    pd.Series([], dtype=object),
+], ids=["float", "int", "mezclada", "vacias", "sin_filas"])
+def test_columnas_no_texto(s):
+    out = L.limpiar_columna(s)
+    assert out.dtype == "float64"
+    assert _iguales(out, _por_celda(s))
+
+
+@pytest.mark.parametrize("dtype", [str, object])
+def test_normalizar_texto(dtype):
+    s = pd.Series([' "PARIACHI" ', "'SAN BORJA'", None, " 18:00 "], dtype=dtype)
+    # el faltante puede quedar como None o NaN según el dtype: ambos son vacío
+    assert L.normalizar_texto(s).fillna("").tolist() == s.map(L.normalize_str).fillna("").tolist()
+
+
+def test_limpiar_csv_grabado_igual_a_la_version_por_celda():
+    crudo = pd.read_csv(CRUDO, dtype=str, encoding="utf-8-sig")
+    esperado = _limpiar_por_celda(crudo.copy())
+    obtenido = L.limpiar(crudo.copy())
+    pd.testing.assert_frame_equal(obtenido, esperado, check_dtype=False)
+    # las filas raras del final hacen lo que dicen: dedup última gana, sin datos fuera
+    pari = obtenido[(obtenido["Estacion"] == "PARIACHI") & (obtenido["Hora"] == "18:00")
+                    & (obtenido["Fecha"] == "03/10/2025")]
+    assert pari["PM 2.5"].tolist() == [21.0]
+    assert not ((obtenido["Estacion"] == "SAN BORJA") & (obtenido["Hora"] == "17:00")).any()
+
+
+def test_por_bloques_igual_a_main_con_textos_tipo_na(tmp_path, monkeypatch):
+    crudo = pd.read_csv(CRUDO, dtype=str, encoding="utf-8-sig")
+    # con espacios read_csv no los toma por NA; tras el strip son "NA"/"null"/"N/A"
+    raras = pd.DataFrame([[" NA ", "04/10/2025", "01:00", "1", "2", "3", "4", "5", "6"],
+                          [" null", "04/10/2025", "02:00", "1", "2", "3", "4", "5", "6"],
+                          ["PARIACHI", "04/10/2025", "03:00", "N/A ", "2", "3", "4", "5", "6"]],
+                         columns=crudo.columns)
+    inp = tmp_path / "crudo.csv"
+    pd.concat([crudo, raras]).to_csv(inp, index=False, encoding="utf-8-sig")
+
+    out_main = tmp_path / "main.csv"
+    monkeypatch.setattr(L, "INP", inp)
+    monkeypatch.setattr(L, "OUT", out_main)
+    L.main()
+    out_bloques = tmp_path / "bloques.csv"
+    L.limpiar_por_bloques(chunksize=7, inp=inp, out=out_bloques)
+
+    lee = dict(dtype=str, encoding="utf-8-sig", keep_default_na=False)
+    esperado = pd.read_csv(out_main, **lee)
+    obtenido = pd.read_csv(out_bloques, **lee)
+    assert {"NA", "null"} <= set(obtenido["Estacion"])
+    pd.testing.assert_frame_equal(obtenido, esperado)
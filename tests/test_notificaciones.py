@@ -0,0 +1,267 @@
+"""
+Despachador de webhooks sin MySQL: `entregar` contra el webhook stub de
+notificaciones (_Stub) y un servidor local que guarda lo recibido; el ciclo
+encolar → tomar → cerrar_hechos contra una conexión falsa que anota cada
+sentencia y transacción.
+"""
+import hashlib
+import hmac
+import json
+import threading
+from datetime import datetime
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import notificaciones as N
+
+EVENTO = {"event_id": 7, "rule_id": 1, "rule_name": "PM2.5 alto", "station_id": 3,
+          "station_name": "PARIACHI", "ts": datetime(2025, 10, 3, 18), "pollutant": "pm2_5",
+          "value": 80.5, "operator": ">", "threshold": 50.0}
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    """El webhook stub de --prueba, con contadores en cero."""
+    for k, v in {"fallos": 0.0, "latencia_s": 0.0, "recibidos": 0, "posts": 0}.items():
+        monkeypatch.setattr(N._Stub, k, v)
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), N._Stub)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{srv.server_address[1]}/hook"
+    srv.shutdown()
+    srv.server_close()
+
+
+# ---------------- entregar ----------------
+
+def test_entregar_ok_contra_el_stub(stub):
+    ok, error = N.entregar({"name": "s", "url": stub}, [EVENTO, EVENTO])
+    assert (ok, error) == (True, None)
+    assert (N._Stub.posts, N._Stub.recibidos) == (1, 2)
+
+
+def test_entregar_503_del_stub(stub):
+    N._Stub.fallos = 1.0
+    assert N.entregar({"name": "s", "url": stub}, [EVENTO]) == (False, "HTTP 503")
+    assert N._Stub.posts == 0
+
+
+def test_entregar_timeout(stub):
+    N._Stub.latencia_s = 0.5
+    ok, error = N.entregar({"name": "s", "url": stub}, [EVENTO], timeout=0.1)
+    assert not ok and "timed out" in error
+
+
+def test_entregar_sin_servidor():
+    ok, error = N.entregar({"name": "s", "url": "http://127.0.0.1:9/hook"}, [EVENTO], timeout=1)
+    assert not ok and error.startswith(("URLError", "ConnectionRefusedError"))
+
+
+def test_entregar_cuerpo_y_firma(servidor):
+    srv = servidor({"/hook": lambda ruta: (204, b"")})
+    sub = {"name": "ops", "url": f"{srv.url}/hook", "secret": "s3cr3t"}
+    assert N.entregar(sub, [EVENTO]) == (True, None)
+
+    [(ruta, headers, cuerpo)] = srv.posts
+    datos = json.loads(cuerpo)
+    assert datos["subscriber"] == "ops" and datos["count"] == 1
+    assert datos["events"][0]["ts"] == "2025-10-03T18:00:00"
+    assert headers["Content-Type"] == "application/json"
+    esperada = hmac.new(b"s3cr3t", cuerpo, hashlib.sha256).hexdigest()
+    assert headers["X-Signature"] == f"sha256={esperada}"
+
+
+def test_entregar_sin_secret_no_firma(servidor):
+    srv = servidor({"/hook": lambda ruta: (200, b"ok")})
+    assert N.entregar({"name": "s", "url": f"{srv.url}/hook", "secret": None}, [EVENTO]) == (True, None)
+    assert "X-Signature" not in srv.posts[0][1]
+
+
+# ---------------- Despachador contra una conexión falsa ----------------
+
+def _nombre(sql):
+    """Qué sentencia de notificaciones es (las de {ids} se comparan hasta ahí)."""
+    for k in ("MARCA_SQL", "ENCOLAR_SQL", "NUEVA_MARCA_SQL", "GUARDAR_MARCA_SQL", "LISTOS_SQL",
+              "TOMAR_SQL", "LEASE_SQL", "ENVIADO_SQL", "FALLIDO_SQL"):
+        if sql.startswith(getattr(N, k).split("{ids}")[0]):
+            return k
+    return sql.split()[0] + " " + sql.split()[-1]
+
+
+class ConexionFalsa:
+    """
+    mysql-connector falso: `datos` dice qué devuelve cada sentencia (filas como
+    dicts o una función de los params); `log` guarda transacciones y sentencias.
+    """
+
+    def __init__(self, datos, falla_en=None):
+        self.datos = datos
+        self.falla_en = falla_en
+        self.log = []
+        self.cerrada = False
+        self.autocommit = False
+
+    def cursor(self, dictionary=False):
+        return CursorFalso(self)
+
+    def start_transaction(self):
+        self.log.append("BEGIN")
+
+    def commit(self):
+        self.log.append("COMMIT")
+
+    def rollback(self):
+        self.log.append("ROLLBACK")
+
+    def close(self):
+        self.cerrada = True
+
+
+class CursorFalso:
+    def __init__(self, cn):
+        self.cn = cn
+        self.filas = []
+        self.rowcount = 0
+
+    def execute(self, sql, params=()):
+        nombre = _nombre(sql)
+        self.cn.log.append((nombre, tuple(params or ()), sql))
+        if nombre == self.cn.falla_en:
+            raise RuntimeError(f"falla en {nombre}")
+        r = self.cn.datos.get(nombre, [])
+        self.filas = [dict(f) for f in (r(params) if callable(r) else r)]
+        self.rowcount = len(self.filas)
+
+    def fetchone(self):
+        return self.filas[0] if self.filas else None
+
+    def fetchall(self):
+        return self.filas
+
+    def close(self):
+        pass
+
+
+def _sentencias(cn):
+    return [x if isinstance(x, str) else x[0] for x in cn.log]
+
+
+def _datos(**extra):
+    datos = {
+        "MARCA_SQL": [{"last_event_id": 100}],
+        "ENCOLAR_SQL": [{}, {}],  # rowcount 2
+        "NUEVA_MARCA_SQL": [{"marca": 104}],
+        "LISTOS_SQL": [{"subscriber_id": 5}],
+        # _nombre() de las consultas sin constante: primera y última palabra
+        "TOMAR_SQL": [{"id": 11, "edad_us": 2_500_000, **EVENTO},
+                      {"id": 12, "edad_us": 1_000_000, **EVENTO, "event_id": 8}],
+        "SELECT (5)": [{"id": 5, "name": "ops", "url": "http://x/hook", "secret": None}],
+    }
+    datos.update(extra)
+    return datos
+
+
+def _despachador(cn, resultado=(True, None), **kw):
+    enviados = []
+
+    def entregar_fn(sub, eventos):
+        enviados.append((sub, eventos))
+        return resultado
+
+    d = N.Despachador(lambda: cn, workers=1, entregar_fn=entregar_fn, **kw)
+    return d, enviados
+
+
+def _esperar(d):
+    for fut, *_ in list(d.en_vuelo.values()):
+        fut.result(timeout=5)
+
+
+def test_encolar_avanza_la_marca_en_una_transaccion():
+    cn = ConexionFalsa(_datos())
+    d, _ = _despachador(cn)
+    d._abrir()
+    assert d.encolar() == 2
+    assert _sentencias(cn) == ["BEGIN", "MARCA_SQL", "ENCOLAR_SQL", "NUEVA_MARCA_SQL",
+                               "GUARDAR_MARCA_SQL", "COMMIT"]
+    params = {x[0]: x[1] for x in cn.log if not isinstance(x, str)}
+    assert params["ENCOLAR_SQL"] == (100, N.EDAD_MAX_H)
+    assert params["NUEVA_MARCA_SQL"] == (100, 100, N.ASENTAR_S)
+    assert params["GUARDAR_MARCA_SQL"] == (104,)
+    assert "FOR UPDATE" in N.MARCA_SQL
+
+
+def test_encolar_con_error_hace_rollback_y_no_guarda_la_marca():
+    cn = ConexionFalsa(_datos(), falla_en="ENCOLAR_SQL")
+    d, _ = _despachador(cn)
+    d._abrir()
+    with pytest.raises(RuntimeError):
+        d.encolar()
+    assert _sentencias(cn)[-1] == "ROLLBACK"
+    assert "GUARDAR_MARCA_SQL" not in _sentencias(cn)
+
+
+def test_ciclo_completo_entrega_y_marca_sent():
+    cn = ConexionFalsa(_datos())
+    d, enviados = _despachador(cn)
+    d.paso()
+    # la toma y el lease van juntos en su propia transacción, con SKIP LOCKED
+    s = _sentencias(cn)
+    i = s.index("TOMAR_SQL")
+    assert s[i - 1:i + 3] == ["BEGIN", "TOMAR_SQL", "LEASE_SQL", "COMMIT"]
+    assert "SKIP LOCKED" in N.TOMAR_SQL
+    lease = next(x for x in cn.log if x[0] == "LEASE_SQL")
+    assert lease[1] == (N.LEASE_S,) and "IN (11,12)" in lease[2]
+
+    _esperar(d)
+    [(sub, eventos)] = enviados
+    assert sub["name"] == "ops"
+    assert [e["event_id"] for e in eventos] == [7, 8]
+    assert all("id" not in e and "edad_us" not in e for e in eventos)
+
+    d.paso()
+    enviado = next(x for x in cn.log if x[0] == "ENVIADO_SQL")
+    assert "IN (11,12)" in enviado[2]
+    assert d.cuenta == {"lotes": 1, "entregados": 2, "reintentos": 0, "fallidos": 0}
+    assert len(d.latencias) == 2 and min(d.latencias) >= 1.0
+
+
+def test_fallo_reintenta_con_backoff_y_cuenta_los_fallidos():
+    cn = ConexionFalsa(_datos(**{"SELECT (11,12)": [{"n": 1}]}))
+    d, _ = _despachador(cn, resultado=(False, "HTTP 503"), max_intentos=3)
+    d.paso()
+    _esperar(d)
+    d.paso()
+    fallido = next(x for x in cn.log if x[0] == "FALLIDO_SQL")
+    assert fallido[1] == ("HTTP 503", 3, N.BACKOFF_MAX_S, N.BACKOFF_BASE_S)
+    assert "IN (11,12)" in fallido[2]
+    assert d.cuenta == {"lotes": 1, "entregados": 0, "reintentos": 1, "fallidos": 1}
+
+
+def test_no_toma_otro_lote_del_mismo_suscriptor_en_vuelo():
+    cn = ConexionFalsa(_datos())
+    bloqueo = threading.Event()
+    d = N.Despachador(lambda: cn, workers=1, entregar_fn=lambda sub, ev: bloqueo.wait(5) and (True, None))
+    d.paso()
+    d.paso()
+    assert _sentencias(cn).count("TOMAR_SQL") == 1
+    bloqueo.set()
+    _esperar(d)
+
+
+def test_correr_cierra_la_conexion_tras_un_error_y_reabre():
+    conexiones = []
+
+    def conectar():
+        # la primera conexión falla al encolar; la segunda anda
+        cn = ConexionFalsa(_datos(LISTOS_SQL=[]), falla_en=None if conexiones else "MARCA_SQL")
+        conexiones.append(cn)
+        return cn
+
+    d = N.Despachador(conectar, workers=1, intervalo=0.01)
+    vueltas = iter(range(3))
+    d.correr(hasta=lambda: next(vueltas, None) is None)
+    assert conexiones[0].cerrada
+    assert "ROLLBACK" in conexiones[0].log
+    assert len(conexiones) == 2 and conexiones[1].cerrada
+    assert d.cn is None
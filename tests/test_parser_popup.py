@@ -0,0 +1,59 @@
+"""
+Paridad de los backends de parser_popup (bs4 y lxml) con la referencia
+(parse_first_row_by_position / parse_table_by_position / station_name_from_html)
+sobre los popups grabados en tests/fixtures, incluidos los casos raros de
+popups_borde.html.
+"""
+import pytest
+
+pytest.importorskip("bs4")
+pytest.importorskip("lxml")
+pytest.importorskip("selenium")  # la referencia vive en los scripts Selenium
+pytest.importorskip("webdriver_manager")
+
+import parser_popup  # noqa: E402
+from conftest import FIXTURES  # noqa: E402
+from senamhi_http import extract_popups  # noqa: E402
+
+ARCHIVOS = ["popup_pariachi.html", "popup_ajax_campo_de_marte.html",
+            "popups_borde.html", "mapa_estaciones.js"]
+
+
+def _popups():
+    out = []
+    for nombre in ARCHIVOS:
+        texto = (FIXTURES / nombre).read_text(encoding="utf-8")
+        for i, html in enumerate(extract_popups(texto) or [texto]):
+            out.append(pytest.param(html, id=f"{nombre}-{i}"))
+    return out
+
+
+@pytest.mark.parametrize("first_only", [True, False], ids=["primera", "tabla"])
+@pytest.mark.parametrize("backend", ["bs4", "lxml"])
+@pytest.mark.parametrize("html", _popups())
+def test_backend_igual_a_la_referencia(html, backend, first_only):
+    assert parser_popup.parse_popup(html, first_only, backend=backend) == \
+        parser_popup._reference(html, first_only)
+
+
+def test_paridad_de_todos_los_fixtures(capsys):
+    popups = [p.values[0] for p in _popups()]
+    assert parser_popup.paridad(popups)
+    assert f"{len(popups)} popups" in capsys.readouterr().out
+
+
+def test_parse_many_concatena_parse_popup():
+    popups = [p.values[0] for p in _popups()] + ["", None]
+    for backend in parser_popup.BACKENDS:
+        esperado = [f for h in popups for f in parser_popup.parse_popup(h, backend=backend)]
+        assert parser_popup.parse_many(popups, backend=backend) == esperado
+
+
+def test_valores_de_un_popup_grabado():
+    html = (FIXTURES / "popup_pariachi.html").read_text(encoding="utf-8")
+    filas = parser_popup.parse_popup(html, backend="lxml")
+    # la fila vacía se salta y la corta se completa con ""
+    assert [f["Hora"] for f in filas] == ["18:00", "17:00", "16:00", "15:00"]
+    assert filas[2]["PM 2,5"] == "27.49" and filas[2]["SO2"] == "S/D" and filas[2]["CO"] == ""
+    assert filas[3]["NO2"] == filas[3]["CO"] == ""
+    assert {f["Estacion"] for f in filas} == {"PARIACHI"}
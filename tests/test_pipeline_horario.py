@@ -0,0 +1,76 @@
+"""
+Orden de etapas de pipeline_horario.run: todas las filas del run van a la
+carga y solo con la carga commiteada se agregan al CSV y al índice de llaves.
+"""
+import pytest
+
+pytest.importorskip("mysql.connector")
+pytest.importorskip("dotenv")
+pytest.importorskip("selenium")
+pytest.importorskip("webdriver_manager")
+
+import pipeline_horario  # noqa: E402
+import subir_mysql  # noqa: E402
+
+FILAS = [
+    {"Estacion": "PARIACHI", "Fecha": "03/10/2025", "Hora": "18:00", "PM 2,5": "20.75", "PM 10": "31.59",
+     "SO2": "13.67", "NO2": "108.79", "O3": "4.20", "CO": "3501.75"},
+    {"Estacion": "CAMPO DE MARTE", "Fecha": "03/10/2025", "Hora": "18:00", "PM 2,5": "15.2",
+     "PM 10": "28.4", "SO2": "2.1", "NO2": "19.7", "O3": "22.8", "CO": "612.3"},
+]
+
+
+class _Cn:
+    def cursor(self):
+        return self
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def pipeline(monkeypatch, tmp_path):
+    llamadas = {"save_rows": [], "cargar": []}
+    monkeypatch.setattr(pipeline_horario, "REPORTE", tmp_path / "reporte.json")
+    monkeypatch.setattr(pipeline_horario.hora, "scrape", lambda **kw: [dict(f) for f in FILAS])
+    monkeypatch.setattr(pipeline_horario.hora, "save_rows",
+                        lambda filas: llamadas["save_rows"].append(filas) or filas[:1])
+    monkeypatch.setattr(subir_mysql, "connect", lambda local_infile=False: _Cn())
+    monkeypatch.setattr(subir_mysql, "tipar_limpio", lambda limpio: limpio)
+    return llamadas
+
+
+def test_carga_todas_las_filas_y_despues_audita(pipeline, monkeypatch):
+    orden = []
+
+    def cargar(cn, cur, fuente, **kw):
+        [df] = fuente
+        pipeline["cargar"].append(df)
+        orden.append("cargar")
+        return {"insertadas": len(df), "actualizadas": 0, "sin_cambios": 0, "saltadas": 0}
+
+    monkeypatch.setattr(subir_mysql, "cargar", cargar)
+    monkeypatch.setattr(pipeline_horario.hora, "save_rows",
+                        lambda filas: orden.append("save_rows") or pipeline["save_rows"].append(filas) or [])
+    res = pipeline_horario.run(alertas=False)
+    assert orden == ["cargar", "save_rows"]
+    # aunque el índice diga que ninguna es nueva, la carga recibió las dos
+    assert sorted(pipeline["cargar"][0]["Estacion"]) == ["CAMPO DE MARTE", "PARIACHI"]
+    assert len(pipeline["save_rows"][0]) == 2
+    assert res["filas"]["carga"] == 2 and res["filas"]["auditoria"] == 0
+
+
+def test_si_la_carga_falla_no_toca_el_csv_ni_el_indice(pipeline, monkeypatch):
+    def cargar(*a, **kw):
+        raise RuntimeError("MySQL caído")
+
+    monkeypatch.setattr(subir_mysql, "cargar", cargar)
+    with pytest.raises(RuntimeError):
+        pipeline_horario.run(alertas=False)
+    assert pipeline["save_rows"] == []
+
+
+def test_sin_db_audita_igual(pipeline):
+    res = pipeline_horario.run(db=False)
+    assert len(pipeline["save_rows"]) == 1
+    assert res["filas"]["auditoria"] == 1 and "carga" not in res["filas"]
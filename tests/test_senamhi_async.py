@@ -0,0 +1,94 @@
+"""
+Límite por host, concurrencia y reintentos de senamhi_async contra un host
+falso: una función `fetch` que anota cuándo se la llama y falla a pedido, y un
+servidor local que responde 503 antes de dar el popup.
+"""
+import threading
+import time
+
+import senamhi_async
+from conftest import FIXTURES
+
+
+class HostFalso:
+    """fetch(url, timeout) síncrono: demora fija, fallas programadas por URL."""
+
+    def __init__(self, demora=0.0, fallas=None):
+        self.demora = demora
+        self.fallas = dict(fallas or {})  # url -> cuántas veces falla antes de responder
+        self.llamadas = []  # (url, t)
+        self.en_vuelo = self.max_en_vuelo = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, url, timeout):
+        with self._lock:
+            self.llamadas.append((url, time.monotonic()))
+            self.en_vuelo += 1
+            self.max_en_vuelo = max(self.max_en_vuelo, self.en_vuelo)
+        try:
+            time.sleep(self.demora)
+            with self._lock:
+                if self.fallas.get(url, 0) > 0:
+                    self.fallas[url] -= 1
+                    raise ConnectionResetError(url)
+            return f"<html>{url}</html>"
+        finally:
+            with self._lock:
+                self.en_vuelo -= 1
+
+    def tiempos(self, url):
+        return [t for u, t in self.llamadas if u == url]
+
+
+def test_respeta_orden_y_concurrencia():
+    host = HostFalso(demora=0.05)
+    urls = [f"http://h{i % 3}/estacion/{i}" for i in range(12)]
+    out = senamhi_async.fetch_all(urls, fetch=host, concurrencia=4)
+    assert out == [f"<html>{u}</html>" for u in urls]
+    assert host.max_en_vuelo == 4
+
+
+def test_intervalo_minimo_por_host():
+    host = HostFalso()
+    urls = [f"http://a/{i}" for i in range(4)] + [f"http://b/{i}" for i in range(4)]
+    senamhi_async.fetch_all(urls, fetch=host, concurrencia=8, intervalo_host=0.1)
+    for h in ("a", "b"):
+        ts = sorted(t for u, t in host.llamadas if u.startswith(f"http://{h}/"))
+        assert all(t2 - t1 >= 0.09 for t1, t2 in zip(ts, ts[1:]))
+    # hosts distintos no se esperan entre sí
+    primero = {h: min(t for u, t in host.llamadas if u.startswith(f"http://{h}/")) for h in "ab"}
+    assert abs(primero["a"] - primero["b"]) < 0.05
+
+
+def test_backoff_exponencial_entre_reintentos(monkeypatch):
+    monkeypatch.setattr(senamhi_async.random, "random", lambda: 0.5)  # jitter x1.0
+    host = HostFalso(fallas={"http://a/x": 3})
+    out = senamhi_async.fetch_all(["http://a/x"], fetch=host, reintentos=3, backoff=0.05)
+    assert out == ["<html>http://a/x</html>"]
+    ts = host.tiempos("http://a/x")
+    esperas = [t2 - t1 for t1, t2 in zip(ts, ts[1:])]
+    assert len(esperas) == 3
+    for espera, esperado in zip(esperas, (0.05, 0.1, 0.2)):
+        assert esperado - 0.01 <= espera < esperado + 0.05
+
+
+def test_agotar_reintentos_devuelve_none(capsys):
+    host = HostFalso(fallas={"http://a/mala": 99})
+    out = senamhi_async.fetch_all(["http://a/mala", "http://a/buena"], fetch=host,
+                                  reintentos=2, backoff=0.01)
+    assert out == [None, "<html>http://a/buena</html>"]
+    assert len(host.tiempos("http://a/mala")) == 3
+    assert "falló tras 3 intentos: ConnectionResetError" in capsys.readouterr().out
+
+
+def test_fetch_all_vacio_no_arranca_el_loop():
+    assert senamhi_async.fetch_all([]) == []
+
+
+def test_reintenta_503_de_un_servidor_real(servidor):
+    popup = (FIXTURES / "popup_pariachi.html").read_bytes()
+    respuestas = iter([(503, b""), (503, b""), (200, popup)])
+    srv = servidor({"/estacion/1": lambda ruta: next(respuestas)})
+    out = senamhi_async.fetch_all([f"{srv.url}/estacion/1"], backoff=0.01, timeout=5)
+    assert out == [popup.decode("utf-8")]
+    assert srv.pedidos == ["/estacion/1"] * 3
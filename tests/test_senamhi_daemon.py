@@ -0,0 +1,263 @@
+"""
+ScraperDaemon sin navegador: FakeDriver entra por `driver_factory` y simula el
+iframe de Leaflet (marcadores, popups con el HTML grabado en tests/fixtures,
+Escape, location.reload con el documento viejo quedando stale). Se prueban los
+runs con la sesión caliente, el reciclado de la sesión y el servidor de control.
+"""
+import json
+import threading
+from urllib.request import Request, urlopen
+
+import pytest
+
+pytest.importorskip("selenium")
+pytest.importorskip("webdriver_manager")
+
+from selenium.common.exceptions import (  # noqa: E402
+    NoSuchElementException, StaleElementReferenceException, WebDriverException)
+from selenium.webdriver.common.by import By  # noqa: E402
+
+import senamhi_daemon  # noqa: E402
+import senamhi_por_hora as hora  # noqa: E402
+from conftest import FIXTURES  # noqa: E402
+from senamhi_http import station_name_from_html  # noqa: E402
+from tiempos_scraper import TimeoutsAdaptativos  # noqa: E402
+
+POPUPS = [(FIXTURES / n).read_text(encoding="utf-8")
+          for n in ("popup_pariachi.html", "popup_ajax_campo_de_marte.html")]
+
+
+class Elemento:
+    """WebElement de un documento: se vuelve stale cuando el documento se recarga."""
+
+    def __init__(self, drv, html="", texto=""):
+        self.drv, self.html, self._texto = drv, html, texto
+        self.doc = drv.doc
+
+    def _vivo(self):
+        if self.doc != self.drv.doc:
+            raise StaleElementReferenceException("documento recargado")
+
+    def is_displayed(self):
+        self._vivo()
+        return True
+
+    def is_enabled(self):
+        self._vivo()
+        return True
+
+    def get_attribute(self, nombre):
+        self._vivo()
+        return self.html
+
+    @property
+    def text(self):
+        self._vivo()
+        return self._texto
+
+
+class _SwitchTo:
+    def default_content(self):
+        pass
+
+
+class FakeDriver:
+    """
+    Lo mínimo de un webdriver.Chrome parado en el iframe del mapa.
+    popups: HTML del popup de cada marcador; falla_reload / sin_mapa / falla_click
+    simulan una sesión que dejó de responder.
+    """
+
+    def __init__(self, popups=POPUPS):
+        self.popups = list(popups)
+        self.doc = 0          # generación del documento (get/reload la suben)
+        self.abierto = None   # HTML del popup abierto
+        self.cargas = self.recargas = 0
+        self.cerrado = False
+        self.falla_reload = self.sin_mapa = self.falla_click = False
+        self.switch_to = _SwitchTo()
+
+    def get(self, url):
+        self.doc += 1
+        self.cargas += 1
+
+    def quit(self):
+        self.cerrado = True
+
+    def execute_script(self, js, *args):
+        if self.cerrado:
+            raise WebDriverException("sesión cerrada")
+        if "readyState" in js:
+            return "complete"
+        if "location.reload" in js:
+            if self.falla_reload:
+                raise WebDriverException("chrome no responde")
+            self.doc += 1
+            self.abierto = None
+            self.recargas += 1
+        elif "MouseEvent" in js:
+            if self.falla_click:
+                raise WebDriverException("click")
+            args[0]._vivo()
+            self.abierto = args[0].html
+        elif "Escape" in js:
+            self.abierto = None
+        elif "tab-3" in js:
+            return True
+        return None
+
+    def find_elements(self, by, valor):
+        if self.cerrado:
+            raise WebDriverException("sesión cerrada")
+        if valor == ".leaflet-container":
+            return [] if self.sin_mapa else [Elemento(self)]
+        if valor == hora.MARKERS_CSS:
+            return [] if self.sin_mapa else [Elemento(self, html=p) for p in self.popups]
+        if valor == hora.POPUP_CSS:
+            return [Elemento(self, html=self.abierto)] if self.abierto else []
+        return []
+
+    def find_element(self, by, valor):
+        if by == By.TAG_NAME and valor == "html":
+            return Elemento(self)
+        if self.abierto and valor == hora.POPUP_CSS:
+            return Elemento(self, html=self.abierto)
+        if self.abierto and by == By.XPATH:
+            return Elemento(self, texto=station_name_from_html(self.abierto))
+        raise NoSuchElementException(valor)
+
+
+@pytest.fixture
+def daemon(monkeypatch, tmp_path):
+    """Daemon con FakeDriver; no escribe el CSV, el reporte ni el historial de PC1."""
+    guardadas = []
+    monkeypatch.setattr(hora, "save_rows", lambda filas, almacen=False: guardadas.extend(filas) or filas)
+    monkeypatch.setattr(hora, "save_timings", lambda timeouts, reporte, etiqueta="": reporte.resumen())
+    drivers = []
+
+    def crear(**kw):
+        def factory():
+            drivers.append(FakeDriver())
+            return drivers[-1]
+
+        d = senamhi_daemon.ScraperDaemon(driver_factory=factory, **kw)
+        d.timeouts = TimeoutsAdaptativos(path=tmp_path / "historial.json")
+        d.drivers, d.guardadas = drivers, guardadas
+        return d
+
+    return crear
+
+
+def test_run_now_abre_la_sesion_y_lee_los_marcadores(daemon):
+    d = daemon()
+    res = d.run_now()
+    assert res["ok"] and res["filas"] == 2 and res["nuevas"] == 2
+    assert [f["Estacion"] for f in d.guardadas] == ["PARIACHI", "CAMPO DE MARTE"]
+    assert d.guardadas[0]["Hora"] == "18:00" and d.guardadas[0]["PM 2,5"] == "20.75"
+    assert len(d.drivers) == 1 and d.drivers[0].cargas == 1
+
+
+def test_runs_siguientes_reusan_la_sesion_y_recargan_el_iframe(daemon):
+    d = daemon()
+    for _ in range(3):
+        assert d.run_now()["ok"]
+    drv = d.drivers[0]
+    assert len(d.drivers) == 1 and d.sesiones == 1
+    assert (drv.cargas, drv.recargas) == (1, 2)
+    assert len(d.guardadas) == 6
+
+
+def test_recicla_la_sesion_vencida(daemon):
+    d = daemon(max_edad=0)
+    d.run_now()
+    d.run_now()
+    assert len(d.drivers) == 2 and d.sesiones == 2
+    assert d.drivers[0].cerrado and not d.drivers[1].cerrado
+
+
+def test_recicla_tras_max_fallas_runs_sin_filas(daemon):
+    d = daemon(max_fallas=2)
+    d.run_now()
+    # el mapa carga pero los popups vienen sin tabla
+    d.drivers[0].popups = ["<div>sin datos</div>", "<div>en mantenimiento</div>"]
+    assert d.run_now()["filas"] == 0
+    assert d.run_now()["filas"] == 0
+    assert d.fallas_seguidas == 2 and len(d.drivers) == 1
+    res = d.run_now()  # la sesión se da por perdida y se abre otra
+    assert len(d.drivers) == 2 and d.drivers[0].cerrado
+    assert res["filas"] == 2 and d.fallas_seguidas == 0
+
+
+def test_recarga_fallida_abre_sesion_nueva(daemon):
+    d = daemon()
+    d.run_now()
+    d.drivers[0].falla_reload = True
+    assert d.run_now()["ok"]
+    assert len(d.drivers) == 2 and d.drivers[0].cerrado
+
+
+def test_sesion_sin_mapa_se_recicla(daemon):
+    d = daemon()
+    d.run_now()
+    d.drivers[0].sin_mapa = True
+    assert d.run_now()["ok"]
+    assert len(d.drivers) == 2
+
+
+def test_error_en_el_run_queda_en_health(daemon):
+    d = daemon()
+    d.run_now()
+    d.drivers[0].falla_click = True
+    res = d.run_now()
+    assert not res["ok"] and res["error"].startswith("WebDriverException")
+    h = d.health()
+    assert h["status"] == "degraded" and h["fallas_seguidas"] == 1 and h["runs"] == 2
+    d.drivers[0].falla_click = False
+    d.run_now()
+    assert d.health()["status"] == "ok" and d.health()["ultimo_error"] is None
+
+
+def test_health_antes_y_despues_de_un_run(daemon):
+    d = daemon()
+    h = d.health()
+    assert h["sesion_activa"] is False and h["sesion_edad_s"] is None and h["runs"] == 0
+    d.run_now()
+    h = d.health()
+    assert h["status"] == "ok" and h["sesion_activa"] and h["sesiones_creadas"] == 1
+    assert h["runs"] == 1 and h["ultimo_run"] and h["ocupado"] is False
+    assert set(h) == {"status", "sesion_activa", "sesion_edad_s", "sesiones_creadas",
+                      "fallas_seguidas", "runs", "ultimo_run", "ultimo_error", "ocupado"}
+
+
+def test_servidor_de_control(daemon):
+    d = daemon()
+    srv = senamhi_daemon.control_server(d, puerto=0)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{srv.server_port}"
+    try:
+        with urlopen(Request(f"{url}/run", data=b"", method="POST"), timeout=30) as r:
+            res = json.loads(r.read())
+        assert res["ok"] and res["filas"] == 2
+        with urlopen(f"{url}/health", timeout=5) as r:
+            h = json.loads(r.read())
+        assert h["runs"] == 1 and h["sesiones_creadas"] == 1
+        with pytest.raises(Exception) as e:
+            urlopen(f"{url}/nada", timeout=5)
+        assert e.value.code == 404
+    finally:
+        srv.shutdown()
+        srv.server_close()
+
+
+def test_loop_corre_y_se_detiene(daemon):
+    d = daemon(intervalo=60)
+    hilo = threading.Thread(target=d.loop)
+    hilo.start()
+    for _ in range(200):
+        if d.runs:
+            break
+        threading.Event().wait(0.01)
+    d.stop()
+    hilo.join(5)
+    assert not hilo.is_alive()
+    assert d.runs == 1 and d.drivers[0].cerrado and d.d is None
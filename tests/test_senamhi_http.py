@@ -0,0 +1,86 @@
+"""
+Extractor sin navegador contra páginas grabadas en tests/fixtures: popups en
+literales JS (bindPopup con comillas dobles/simples y escapes), popups ya
+renderizados en un page_source y popups que el mapa pide por AJAX.
+"""
+import pytest
+
+pytest.importorskip("bs4")
+
+import parser_popup  # noqa: E402
+import senamhi_http  # noqa: E402
+from conftest import FIXTURES  # noqa: E402
+
+
+def _leer(nombre):
+    return (FIXTURES / nombre).read_text(encoding="utf-8")
+
+
+def _estaciones(popups):
+    return [senamhi_http.station_name_from_html(p) for p in popups]
+
+
+def test_js_unescape():
+    assert senamhi_http.js_unescape(r"Estación \'A\' \x41\n") == "Estación 'A' A\n"
+    assert senamhi_http.js_unescape(r'<div class=\"c\">') == '<div class="c">'
+
+
+def test_extract_popups_desde_literales_js():
+    popups = senamhi_http.extract_popups(_leer("mapa_estaciones.js"))
+    # el popup sin tabla (estación en mantenimiento) se descarta
+    assert _estaciones(popups) == ["PARIACHI", "SAN BORJA"]
+    # el literal con comillas dobles queda igual al HTML original
+    assert popups[0] == _leer("popup_pariachi.html")
+
+
+def test_extract_popups_desde_page_source():
+    popups = senamhi_http.extract_popups(_leer("page_source_popup_abierto.html"))
+    assert _estaciones(popups) == ["PARIACHI"]
+    filas = parser_popup.parse_many(popups, first_only=True)
+    assert filas == [{"Estacion": "PARIACHI", "Fecha": "03/10/2025", "Hora": "18:00",
+                      "PM 2,5": "20.75", "PM 10": "31.59", "SO2": "13.67",
+                      "NO2": "108.79", "O3": "4.20", "CO": "3.501,75"}]
+
+
+def test_extract_popup_urls():
+    base = "https://www.senamhi.gob.pe/mapas/aire/mapa_iframe.html"
+    urls = senamhi_http.extract_popup_urls(_leer("mapa_estaciones.js"), base)
+    assert urls == ["https://www.senamhi.gob.pe/mapas/aire/popup.php?id=3"]
+    js = 'fetch("/api/popup/7"); $.get("app.js"); $.ajax({url: "popup.php?id=7"});'
+    assert senamhi_http.extract_popup_urls(js, base) == [
+        "https://www.senamhi.gob.pe/api/popup/7",
+        "https://www.senamhi.gob.pe/mapas/aire/popup.php?id=7",
+    ]
+
+
+def test_collect_popups_desde_archivo_guardado():
+    popups = senamhi_http.collect_popups(fuente=FIXTURES / "mapa_estaciones.js")
+    assert _estaciones(popups) == ["PARIACHI", "SAN BORJA"]
+
+
+def test_collect_popups_recorre_iframe_scripts_y_ajax(servidor):
+    srv = servidor({
+        "/calidad-del-aire": _leer("pagina_mapa.html").encode(),
+        "/mapa/mapa_iframe.html": _leer("mapa_iframe.html").encode(),
+        "/mapa/mapa_estaciones.js": _leer("mapa_estaciones.js").encode(),
+        "/mapa/popup.php?id=3": _leer("popup_ajax_campo_de_marte.html").encode(),
+    })
+    popups = senamhi_http.collect_popups(f"{srv.url}/calidad-del-aire", timeout=5,
+                                         intervalo_host=0)
+    assert _estaciones(popups) == ["PARIACHI", "SAN BORJA", "CAMPO DE MARTE"]
+    # leaflet.js y jquery no se piden: no traen estaciones
+    assert not any("jquery" in p or "leaflet" in p for p in srv.pedidos)
+
+    filas = parser_popup.parse_many(popups, first_only=True)
+    assert [(f["Estacion"], f["Hora"], f["PM 2,5"]) for f in filas] == [
+        ("PARIACHI", "18:00", "20.75"), ("SAN BORJA", "18:00", "12.4"),
+        ("CAMPO DE MARTE", "18:00", "15.2"),
+    ]
+
+
+def test_collect_popups_sigue_si_falla_un_iframe(servidor, capsys):
+    srv = servidor({"/": b'<iframe src="/no-existe.html"></iframe>'
+                         + _leer("page_source_popup_abierto.html").encode()})
+    popups = senamhi_http.collect_popups(f"{srv.url}/", timeout=5)
+    assert _estaciones(popups) == ["PARIACHI"]
+    assert "no se pudo leer iframe" in capsys.readouterr().out
@@ -0,0 +1,112 @@
+"""
+Transacciones de subir_mysql contra una conexión falsa que anota sentencias,
+commits y rollbacks (sin MySQL).
+"""
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("mysql.connector")
+pytest.importorskip("dotenv")
+
+import subir_mysql  # noqa: E402
+
+
+class Conexion:
+    def __init__(self):
+        self.log = []
+
+    def commit(self):
+        self.log.append("COMMIT")
+
+    def rollback(self):
+        self.log.append("ROLLBACK")
+
+
+class Cursor:
+    def __init__(self, cn):
+        self.cn = cn
+        self.rowcount = 0
+
+    def execute(self, sql, params=()):
+        self.cn.log.append(" ".join(sql.split()[:3]))
+        self.rowcount = 2
+
+
+def _out(n):
+    return pd.DataFrame({"station_id": [1] * n,
+                         "ts": pd.date_range(datetime(2025, 10, 1), periods=n, freq="h"),
+                         **{c: [1.0] * n for c in ("pm2_5", "pm10", "so2", "no2", "o3", "co")}})
+
+
+def test_infile_commitea_merge_y_derivadas_juntos(monkeypatch):
+    cn = Conexion()
+    derivadas = []
+    monkeypatch.setattr(subir_mysql, "actualizar_derivadas",
+                        lambda cur, parte: (cn.log.append("DERIVADAS"), derivadas.append(len(parte))))
+    assert subir_mysql.subir_infile(cn, Cursor(cn), _out(5), lote=3) == 4
+    assert derivadas == [3, 2]
+    assert not any("TRUNCATE" in s for s in cn.log)
+    lote = ["LOAD DATA LOCAL", "INSERT INTO measurements", "DELETE FROM measurements_stage",
+            "DERIVADAS", "COMMIT"]
+    assert cn.log == ["CREATE TEMPORARY TABLE", *lote, *lote]
+
+
+def test_infile_falla_en_derivadas_no_deja_nada_commiteado(monkeypatch):
+    cn = Conexion()
+
+    def falla(cur, parte):
+        raise RuntimeError("rollups")
+
+    monkeypatch.setattr(subir_mysql, "actualizar_derivadas", falla)
+    with pytest.raises(RuntimeError):
+        subir_mysql.subir_infile(cn, Cursor(cn), _out(3))
+    # sin sentencias con commit implícito entre el merge y la falla
+    assert "COMMIT" not in cn.log
+    assert not any(s.startswith(("TRUNCATE", "DROP", "ALTER")) for s in cn.log)
+
+
+def _crudo(filas):
+    return pd.DataFrame(filas, columns=["Estacion", "Fecha", "Hora"])
+
+
+def test_fechas_invertidas_son_las_llaves_mes_primero():
+    df = _crudo([("A", "03/10/2025", "18:00"),   # cargada como 10 de marzo
+                 ("A", "13/10/2025", "18:00"),   # día > 12: no era parseable mes primero
+                 ("A", "05/05/2025", "01:00"),   # día == mes: misma llave
+                 ("B", "02/01/2025", "00:00"),   # 1 de febrero, pero B también tiene el 2 de enero
+                 ("B", "01/02/2025", "00:00"),
+                 ("", "04/10/2025", "00:00")])
+    llaves = subir_mysql.fechas_invertidas(df)
+    assert list(zip(llaves["Estacion"], llaves["ts"])) == [("A", pd.Timestamp(2025, 3, 10, 18))]
+
+
+def test_corregir_fechas_borra_y_recalcula_en_un_commit(monkeypatch):
+    class Resolver:
+        def __init__(self, cur):
+            pass
+
+        def resolver(self, nombres):
+            return {n: i + 1 for i, n in enumerate(nombres)}
+
+    cn = Conexion()
+    cur = Cursor(cn)
+    cur.executemany = lambda sql, filas: cn.log.append(("LLAVES", filas))
+    monkeypatch.setattr(subir_mysql, "ResolverEstaciones", Resolver)
+    monkeypatch.setattr(subir_mysql.agregados, "actualizar", lambda cur, out: cn.log.append("AGREGADOS"))
+    monkeypatch.setattr(subir_mysql, "bump_version", lambda cur: None)
+
+    borradas = subir_mysql.corregir_fechas(cn, cur, _crudo([("A", "03/10/2025", "18:00")]))
+    assert borradas == 2
+    assert cn.log == ["CREATE TEMPORARY TABLE", "DELETE FROM llaves_lote",
+                      ("LLAVES", [(1, datetime(2025, 3, 10, 18))]),
+                      "DELETE m FROM", "DELETE e FROM", "DELETE FROM alert_window_state",
+                      "AGREGADOS", "DELETE FROM station_latest", "INSERT INTO station_latest",
+                      "COMMIT"]
+
+
+def test_corregir_fechas_sin_llaves_no_toca_la_base():
+    cn = Conexion()
+    assert subir_mysql.corregir_fechas(cn, Cursor(cn), _crudo([("A", "20/10/2025", "18:00")])) == 0
+    assert cn.log == []
@@ -0,0 +1,72 @@
+"""
+Timeouts adaptativos de scrape_markers con el FakeDriver de los tests del
+daemon: cada espera usa el timeout de su fase, cada fase queda medida aparte en
+el reporte y solo las esperas que terminaron entran al historial.
+"""
+import pytest
+
+pytest.importorskip("selenium")
+pytest.importorskip("webdriver_manager")
+
+from selenium.common.exceptions import NoSuchElementException  # noqa: E402
+
+import senamhi_por_hora as hora  # noqa: E402
+import tiempos_scraper  # noqa: E402
+from test_senamhi_daemon import FakeDriver  # noqa: E402
+from tiempos_scraper import ReporteTiempos, TimeoutsAdaptativos  # noqa: E402
+
+
+class SinNombre(FakeDriver):
+    """El XPath de 'Estación:' nunca se vuelve visible (el nombre sale del HTML)."""
+
+    def find_element(self, by, valor):
+        if by == hora.By.XPATH:
+            raise NoSuchElementException(valor)
+        return super().find_element(by, valor)
+
+
+@pytest.fixture
+def timeouts(tmp_path):
+    return TimeoutsAdaptativos(path=tmp_path / "historial.json", minimo=0.1)
+
+
+def test_fases_por_estacion_en_el_reporte(timeouts):
+    reporte = ReporteTiempos()
+    filas = hora.scrape_markers(FakeDriver(), timeouts, reporte)
+    assert [f["Estacion"] for f in filas] == ["PARIACHI", "CAMPO DE MARTE"]
+    for e in reporte.estaciones:
+        assert set(tiempos_scraper.FASES) <= set(e)
+        assert e["total"] == pytest.approx(sum(e[f] for f in tiempos_scraper.FASES), abs=1e-3)
+    assert set(reporte.resumen()) >= {"nombre", "parse"}
+    assert len(timeouts.data["fases"]["estacion"]) == 2
+
+
+def test_la_espera_del_nombre_usa_su_timeout_adaptativo(timeouts, monkeypatch):
+    timeouts.data["fases"]["estacion"] = [0.2] * 20  # p95 0.2 * margen 2 -> 0.4 s
+    pedidos = []
+    real = hora.wait_station_name
+    monkeypatch.setattr(hora, "wait_station_name", lambda d, t: pedidos.append(t) or real(d, t))
+    hora.scrape_markers(FakeDriver(), timeouts, ReporteTiempos())
+    assert pedidos == [pytest.approx(0.4)] * 2
+
+
+def test_nombre_que_no_aparece_no_entra_al_historial(timeouts):
+    timeouts.data["fases"]["estacion"] = [0.05] * 20  # timeout corto: el mínimo, 0.1 s
+    reporte = ReporteTiempos()
+    filas = hora.scrape_markers(SinNombre(), timeouts, reporte)
+    # el nombre sale del HTML del popup, y los timeouts no se anotan
+    assert [f["Estacion"] for f in filas] == ["PARIACHI", "CAMPO DE MARTE"]
+    assert timeouts.data["fases"]["estacion"] == [0.05] * 20
+    assert all(e["nombre"] >= 0.1 for e in reporte.estaciones)
+    assert all(e["parse"] < 0.1 for e in reporte.estaciones)
+
+
+def test_extract_station_name_con_timeout(monkeypatch):
+    pedidos = []
+    monkeypatch.setattr(hora, "wait_station_name", lambda d, t: pedidos.append(t) or None)
+    monkeypatch.setattr(hora, "get_popup_html", lambda d, timeout: pedidos.append(timeout) or None)
+    html = FakeDriver().popups[0]
+    assert hora.extract_station_name(None, popup_html_backup=html, timeout=0.3) == "PARIACHI"
+    assert hora.extract_station_name(None, timeout=0.3) == ""
+    assert pedidos == [0.3, 0.3, 0.3]
+    assert hora.extract_station_name.__defaults__[-1] == tiempos_scraper.TIMEOUTS_MAX["estacion"]
@@ -0,0 +1,166 @@
+import json
+import re
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+
+import alertas
+import ventanas
+
+
+def _columnas(sql):
+    """Nombres de columna como los devuelve MySQL: el alias si hay, si no el texto de la expresión."""
+    lista = re.search(r"SELECT\s+(.*?)\s+FROM\s", sql, re.S | re.I).group(1)
+    nombres = []
+    for expr in lista.split(","):
+        expr = expr.strip()
+        m = re.search(r"\s+AS\s+(\w+)$", expr, re.I)
+        nombres.append(m.group(1) if m else expr.split(".")[-1])
+    return nombres
+
+
+class CursorDict:
+    """Cursor falso con dictionary=True: filas como dicts con las llaves que pone MySQL."""
+
+    def __init__(self, respuestas):
+        self.respuestas = respuestas  # [(fragmento de SQL, filas como tuplas)]
+        self.guardadas = []
+        self._filas = []
+
+    def execute(self, sql, params=()):
+        for fragmento, filas in self.respuestas:
+            if fragmento in sql:
+                cols = _columnas(sql)
+                self._filas = [dict(zip(cols, f)) for f in filas]
+                return
+        self._filas = []
+
+    def fetchall(self):
+        return self._filas
+
+    def executemany(self, sql, filas):
+        self.guardadas += list(filas)
+
+
+def test_sembrar_con_cursor_dict_carga_los_valores():
+    ultima = datetime(2025, 10, 13, 12)
+    horas = [(ultima - timedelta(hours=i), 30.0 + i) for i in range(8)]
+    cur = CursorDict([
+        ("alert_window_state w", [(7, 3, ultima, "o3", 8)]),
+        ("FROM measurements_hourly", [(3, ts, v) for ts, v in horas]),
+    ])
+
+    assert ventanas.sembrar(cur) == 1
+
+    (rule_id, station_id, end_ts, buf, suma, n, maximo), = cur.guardadas
+    assert (rule_id, station_id, end_ts) == (7, 3, ultima)
+    assert n == 8
+    assert suma == sum(v for _, v in horas)
+    assert maximo == 37.0
+
+
+def test_semillas_acepta_tuplas_y_dicts():
+    ts = datetime(2025, 10, 13, 5)
+    fila = (3, ts, 12.5)
+
+    class CursorTuplas(CursorDict):
+        def fetchall(self):
+            return [tuple(d.values()) for d in self._filas]
+
+    rangos = {3: (ventanas._hora(ts), ventanas._hora(ts) + 1)}
+    for cur in (CursorDict([("measurements_hourly", [fila])]),
+                CursorTuplas([("measurements_hourly", [fila])])):
+        df = ventanas._semillas(cur, rangos, ["o3"])
+        assert df["o3"].tolist() == [12.5]
+        assert df["hora"].tolist() == [ventanas._hora(ts)]
+
+
+def _ventana(w, horas):
+    v = ventanas.Ventana(w)
+    for h, val in horas:
+        assert v.agregar(h, val)
+    return v
+
+
+def test_agregar_limpia_las_horas_salteadas():
+    v = _ventana(4, [(10, 1.0), (11, 2.0), (13, 4.0)])
+    assert v.fin == 13
+    assert v.buf[12 % 4] is None
+    assert (v.suma, v.n) == (7.0, 3)
+    # un hueco de w horas o más vacía la ventana
+    assert v.agregar(20, 5.0)
+    assert (v.fin, v.suma, v.n) == (20, 5.0, 1)
+    assert v.buf.count(None) == 3
+
+
+def test_hora_atrasada_dentro_de_la_ventana_corrige_su_casillero():
+    v = _ventana(4, [(10, 1.0), (11, 2.0), (13, 4.0)])
+    assert v.agregar(12, 3.0)
+    assert (v.fin, v.suma, v.n) == (13, 10.0, 4)
+    assert v.agregar(11, 6.0)  # reemplaza el 2.0
+    assert (v.suma, v.n) == (14.0, 4)
+
+
+def test_hora_atrasada_fuera_de_la_ventana_se_ignora():
+    v = _ventana(4, [(10, 1.0), (11, 2.0), (13, 4.0)])
+    antes = list(v.buf)
+    assert v.agregar(9, 100.0) is False
+    assert (v.buf, v.fin, v.suma, v.n) == (antes, 13, 7.0, 3)
+
+
+def test_valor_exige_cobertura_minima():
+    assert ventanas.minimo_horas(8) == 6
+    v = _ventana(8, [(h, 10.0) for h in range(5)])
+    assert v.valor("avg") is None and v.valor("max") is None
+    v.agregar(5, 16.0)
+    assert v.valor("avg") == 11.0
+
+
+def test_valor_avg_y_max():
+    v = _ventana(4, [(0, 1.0), (1, None), (2, 3.0), (3, 8.0)])
+    assert v.valor("avg") == 4.0
+    assert v.valor("max") == 8.0
+
+
+T0 = datetime(2025, 10, 13, 10)
+H0 = ventanas._hora(T0)
+
+
+def _reglas(agregacion="avg", threshold=10):
+    return alertas.IndiceReglas([(7, 3, "O3", "gt", threshold, 3, agregacion)]).ventanas
+
+
+def _out(filas):
+    df = pd.DataFrame(filas, columns=["station_id", "ts", "o3"])
+    for c in ("pm2_5", "pm10", "so2", "no2", "co"):
+        df[c] = float("nan")
+    return df
+
+
+def test_procesar_sin_estado_evalua_cuando_hay_cobertura():
+    cur = CursorDict([])
+    out = _out([(3, T0 + timedelta(hours=i), 20.0) for i in range(3)])
+    eventos = ventanas.procesar(cur, out, _reglas())
+    # w=3 pide 3 horas: solo la tercera evalúa
+    assert eventos == [(7, 3, T0 + timedelta(hours=2), "o3", 20.0, "gt", 10.0)]
+    (rid, sid, end_ts, buf, suma, n, maximo), = cur.guardadas
+    assert (rid, sid, end_ts, suma, n, maximo) == (7, 3, T0 + timedelta(hours=2), 60.0, 3, 20.0)
+
+
+@pytest.mark.parametrize("agregacion, esperado", [("avg", 14.0), ("max", 20.0)])
+def test_procesar_hora_atrasada_emite_con_el_end_ts_de_la_ventana(agregacion, esperado):
+    guardada = _ventana(3, [(H0, 20.0), (H0 + 2, 20.0)])
+    cur = CursorDict([("FROM alert_window_state", [(7, 3, T0 + timedelta(hours=2), json.dumps(guardada.buf))])])
+    out = _out([(3, T0 + timedelta(hours=1), 2.0)])
+    eventos = ventanas.procesar(cur, out, _reglas(agregacion))
+    assert eventos == [(7, 3, T0 + timedelta(hours=2), "o3", esperado, "gt", 10.0)]
+    assert cur.guardadas[0][2] == T0 + timedelta(hours=2)
+    assert cur.guardadas[0][5] == 3
+
+
+def test_procesar_hora_mas_vieja_que_la_ventana_no_emite():
+    guardada = _ventana(3, [(H0 + 4, 20.0), (H0 + 5, 20.0), (H0 + 6, 20.0)])
+    cur = CursorDict([("FROM alert_window_state", [(7, 3, T0 + timedelta(hours=6), json.dumps(guardada.buf))])])
+    assert ventanas.procesar(cur, _out([(3, T0, 50.0)]), _reglas()) == []
+    assert cur.guardadas[0][5] == 3